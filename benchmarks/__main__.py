@@ -0,0 +1,47 @@
+import json
+import sys
+from argparse import ArgumentParser, Namespace
+
+from .suite import BenchmarkSuite, compare, DEFAULT_REPEAT, DEFAULT_PASSES, DEFAULT_LOOKUPS, DEFAULT_ITEMS
+
+
+def get_arg_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog='python -m benchmarks',
+                            description='Measures the extraction, the nearest station search and the output'
+                                        ' pipelines on the saved pages of benchmarks/corpus.')
+    parser.add_argument('--output', type=str,
+                        help='File where the results are saved as JSON, printed when not given.')
+    parser.add_argument('--baseline', type=str,
+                        help='Results of a previous run, the change of every rate against them is printed.')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Rounds of every benchmark, the best one is kept.')
+    parser.add_argument('--passes', type=int, default=DEFAULT_PASSES,
+                        help='Times the corpus pages are extracted on every round.')
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS,
+                        help='Random coordinates searched for their nearest stations on every round.')
+    parser.add_argument('--items', type=int, default=DEFAULT_ITEMS,
+                        help='Properties written by every output pipeline on every round.')
+    return parser
+
+
+def main(args: Namespace) -> None:
+    results = BenchmarkSuite(args.repeat, args.passes, args.lookups, args.items).run()
+    results_json = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results_json + '\n')
+        print(f"Saved the results on '{args.output}'")
+    else:
+        print(results_json)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            changes = compare(results, json.load(baseline))
+        # the printed results stay valid JSON
+        changes_output = sys.stdout if args.output else sys.stderr
+        for name, change in sorted(changes.items()):
+            print(f'{name}: {change:+.1%}', file=changes_output)
+
+
+if __name__ == '__main__':
+    main(get_arg_parser().parse_args())
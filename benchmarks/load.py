@@ -0,0 +1,126 @@
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace, REMAINDER
+from typing import Any, Dict, List, Optional
+from urllib.request import urlopen
+
+from .mock_daft import STATS_PATH, DEFAULT_LISTINGS, DEFAULT_PADDING_BYTES
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_SCRAPER_SCRIPT = os.path.join(PROJECT_DIR, 'bin', 'web-scraper')
+
+RESULTS_VERSION = 1
+DEFAULT_TIMEOUT_S = 3600
+SERVER_ADDRESS_REGEX = re.compile('(http://\\S+)')
+# logged by scrapy at the end of the crawl, and printed with the merged stats of the workers
+ITEMS_REGEX = re.compile("'item_scraped_count': (\\d+)")
+
+
+class LoadTest:
+    # Starts the mock daft.ie server and crawls it with web-scraper houses-for-sale, both on their own process, and
+    # reports how long the whole crawl took, its peak memory and what the server served
+
+    def __init__(self, server_args: List[str], crawl_args: List[str], timeout: float = DEFAULT_TIMEOUT_S,
+                 crawl_log: Optional[str] = None) -> None:
+        self.server_args = server_args
+        self.crawl_args = crawl_args
+        self.timeout = timeout
+        self.crawl_log = crawl_log
+
+    def run(self) -> Dict[str, Any]:
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, (PROJECT_DIR,
+                                                                         os.environ.get('PYTHONPATH'))))}
+        server = subprocess.Popen([sys.executable, '-m', 'benchmarks.mock_daft', '--port', '0', *self.server_args],
+                                  stdout=subprocess.PIPE, cwd=PROJECT_DIR, env=env, text=True)
+        try:
+            matcher = SERVER_ADDRESS_REGEX.search(server.stdout.readline()) if server.stdout else None
+            if not matcher:
+                raise RuntimeError('The mock daft.ie server did not start')
+            daft_address = matcher.group(1)
+
+            with tempfile.TemporaryFile('w+') as crawl_output:
+                start = time.perf_counter()
+                crawl = subprocess.run([sys.executable, WEB_SCRAPER_SCRIPT, 'houses-for-sale', '--daft-address',
+                                        daft_address, *self.crawl_args], cwd=PROJECT_DIR, env=env,
+                                       stdout=crawl_output, stderr=subprocess.STDOUT, timeout=self.timeout)
+                elapsed = time.perf_counter() - start
+                crawl_output.seek(0)
+                output = crawl_output.read()
+            if self.crawl_log:
+                with open(self.crawl_log, 'w') as crawl_log:
+                    crawl_log.write(output)
+
+            # only the crawl, and the workers it waited for, finished among the children
+            peak_rss_bytes = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+            with urlopen(daft_address + STATS_PATH) as stats_response:
+                server_stats = json.load(stats_response)
+        finally:
+            server.terminate()
+            server.wait()
+
+        items_matchers = ITEMS_REGEX.findall(output)
+        items = int(items_matchers[-1]) if items_matchers else 0
+        return {
+            'version': RESULTS_VERSION,
+            'server_args': self.server_args,
+            'crawl_args': self.crawl_args,
+            'returncode': crawl.returncode,
+            'elapsed_s': elapsed,
+            'items': items,
+            'items_per_s': items / elapsed,
+            'requests_per_s': server_stats['requests'] / elapsed,
+            'peak_rss_bytes': peak_rss_bytes,
+            'server': server_stats,
+        }
+
+
+def get_arg_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog='python -m benchmarks.load',
+                            description='Crawls the mock daft.ie server end to end and reports the throughput. The'
+                                        ' arguments after -- are given to web-scraper houses-for-sale.',
+                            usage='python -m benchmarks.load --listings 100000 --latency-ms 50 --'
+                                  ' --concurrent-requests 64 --output-format sqlite --output /tmp/load.sqlite')
+    parser.add_argument('--listings', type=int, default=DEFAULT_LISTINGS,
+                        help='Number of properties for sale on the server.')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Average milliseconds every page takes to be served.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of the requests failed with a 503.')
+    parser.add_argument('--max-rps', type=float,
+                        help='Requests per second served, the ones over it are throttled with a 429.')
+    parser.add_argument('--padding-bytes', type=int, default=DEFAULT_PADDING_BYTES,
+                        help='Size of the markup added to every page.')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT_S,
+                        help='Seconds the crawl can take before it is stopped.')
+    parser.add_argument('--crawl-log', type=str, help='File where the output of the crawl is saved.')
+    parser.add_argument('--output', type=str,
+                        help='File where the results are saved as JSON, printed when not given.')
+    parser.add_argument('crawl_args', nargs=REMAINDER, help='Arguments of web-scraper houses-for-sale.')
+    return parser
+
+
+def main(args: Namespace) -> None:
+    server_args = ['--listings', str(args.listings), '--latency-ms', str(args.latency_ms), '--error-rate',
+                   str(args.error_rate), '--padding-bytes', str(args.padding_bytes)]
+    if args.max_rps:
+        server_args += ['--max-rps', str(args.max_rps)]
+    crawl_args = args.crawl_args[1:] if args.crawl_args[:1] == ['--'] else args.crawl_args
+
+    results = LoadTest(server_args, crawl_args, args.timeout, args.crawl_log).run()
+    results_json = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results_json + '\n')
+        print(f"Saved the results on '{args.output}'")
+    else:
+        print(results_json)
+
+
+if __name__ == '__main__':
+    main(get_arg_parser().parse_args())
@@ -0,0 +1,302 @@
+import json
+import random
+import time
+from argparse import ArgumentParser, Namespace
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET, Site
+
+from web_scraper.spiders import PROPERTIES_FOR_SALE, DEFAULT_PAGE_SIZE, BER_RATING_EXEMPT_CODE
+from web_scraper.items import BER_RATINGS
+
+DETAIL_PATH = '/for-sale/'
+STATS_PATH = '/__mock/stats'
+
+MAX_LISTINGS = 1000000
+DEFAULT_LISTINGS = 10000
+DEFAULT_PADDING_BYTES = 20 * 1024
+DEFAULT_SEED = 20201018
+THROTTLE_RETRY_AFTER_S = 1
+
+# the prices grow with the listing id, so every price band is a contiguous range of ids
+PRICE_MIN = 100000
+PRICE_SPAN = 2000000
+BEDS_CYCLE = 5
+
+STREETS = ('Example Road', 'Sample Avenue', 'Placeholder Park', 'Specimen Terrace', 'Model Grove', 'Fictional Lane',
+           'Demo Crescent', 'Anon Street', 'Test Close', 'Mock Square', 'Dummy Drive', 'Generic Court')
+AREAS = (('Rathmines', 'Dublin 6', 53.3225, -6.2653), ('Clontarf', 'Dublin 3', 53.3640, -6.1930),
+         ('Ballsbridge', 'Dublin 4', 53.3290, -6.2300), ('Dun Laoghaire', 'South Co. Dublin', 53.2900, -6.1350),
+         ('Dundrum', 'South Co. Dublin', 53.2890, -6.2450), ('Malahide', 'North Co. Dublin', 53.4500, -6.1540),
+         ('Lucan', 'West Co. Dublin', 53.3570, -6.4490), ('Bray', 'Co. Wicklow', 53.2030, -6.0980))
+PROPERTY_TYPES = ('House', 'Apartment', 'Semi-D', 'Terrace', 'Detached', 'Duplex', 'Bungalow')
+WORDS = ('bright spacious well presented family home located in a quiet cul de sac within walking distance of local '
+         'shops schools parks and public transport with a south facing rear garden and off street parking').split()
+
+SEARCH_PAGE = '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Property for sale - Daft.ie</title></head>
+<body><div id="__next">%(padding)s
+<main><h1 data-testid="search-h1">%(count)s Properties for Sale in Ireland</h1>
+<ul data-testid="results">
+%(cards)s
+</ul></main></div></body></html>'''
+
+CARD = '''<li data-testid="result-%(id)d"><a href="%(path)s"><div class="Card">
+  <div data-testid="price"><h3>%(price)s</h3></div>
+  <p data-testid="address">%(title)s</p>
+  <div><p data-testid="beds">%(beds)s</p><p data-testid="baths">%(baths)s</p>
+    <p data-testid="floor-area">%(floor_area)s m²</p><p data-testid="property-type">%(property_type)s</p></div>
+</div></a></li>'''
+
+DETAIL_PAGE = '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>%(title)s - Daft.ie</title></head>
+<body><div id="__next">%(padding)s
+<main>
+  <h1 data-testid="address">%(title)s</h1>
+  <div data-testid="price"><p><span>%(price)s</span></p></div>
+  <p data-testid="beds">%(beds)s</p>
+  <p data-testid="baths">%(baths)s</p>
+  <p data-testid="floor-area">%(floor_area)s m²</p>
+  <p data-testid="property-type">%(property_type)s</p>
+  <div data-testid="ber"><img alt="%(ber)s" src="/ber_%(ber)s.svg"></div>
+  <a data-testid="streetview-button" href="https://maps.google.com/?viewpoint=%(lat)s,%(lon)s">Street View</a>
+  <div data-testid="description">%(description_html)s</div>
+  <div data-testid="statistics"><div><div><div><p>%(updated_at)s</p></div></div></div>
+    <div><div><div><p>%(views)s</p></div></div></div></div>
+</main></div>
+<script id="__NEXT_DATA__" type="application/json">%(next_data)s</script>
+</body></html>'''
+
+
+class MockDaftListings:
+    # Generates the same properties from their ids on every run, so a million of them take no memory. The searches
+    # filter them by price and beds as daft.ie does, with inclusive limits
+
+    def __init__(self, listings: int = DEFAULT_LISTINGS, seed: int = DEFAULT_SEED) -> None:
+        if not 0 < listings <= MAX_LISTINGS:
+            raise ValueError(f"The number of listings must be between 1 and {MAX_LISTINGS}, not {listings}")
+        self.listings = listings
+        self.seed = seed
+
+    def price(self, listing_id: int) -> int:
+        return PRICE_MIN + listing_id * PRICE_SPAN // self.listings
+
+    @staticmethod
+    def beds(listing_id: int) -> int:
+        return listing_id % BEDS_CYCLE + 1
+
+    def search(self, min_price: Optional[int] = None, max_price: Optional[int] = None, min_beds: Optional[int] = None,
+               max_beds: Optional[int] = None) -> Tuple[int, int, List[int]]:
+        # the range of ids of the price band and the beds, as remainders of the id, that match the search
+        first_id = self._first_id(min_price) if min_price is not None else 0
+        end_id = self._first_id(max_price + 1) if max_price is not None else self.listings
+        beds_remainders = [remainder for remainder in range(BEDS_CYCLE)
+                           if (min_beds or 0) <= remainder + 1 <= (max_beds or BEDS_CYCLE)]
+        return first_id, end_id, beds_remainders
+
+    @staticmethod
+    def count(search: Tuple[int, int, List[int]]) -> int:
+        first_id, end_id, beds_remainders = search
+        return max(0, MockDaftListings._rank(end_id, beds_remainders) - MockDaftListings._rank(first_id,
+                                                                                               beds_remainders))
+
+    @staticmethod
+    def page(search: Tuple[int, int, List[int]], page_from: int, page_size: int = DEFAULT_PAGE_SIZE) -> List[int]:
+        first_id, end_id, beds_remainders = search
+        if not beds_remainders:
+            return []
+        page_ids = []
+        for rank in range(MockDaftListings._rank(first_id, beds_remainders) + page_from,
+                          MockDaftListings._rank(first_id, beds_remainders) + page_from + page_size):
+            listing_id = rank // len(beds_remainders) * BEDS_CYCLE + beds_remainders[rank % len(beds_remainders)]
+            if listing_id >= end_id:
+                break
+            page_ids.append(listing_id)
+        return page_ids
+
+    def listing(self, listing_id: int) -> Dict[str, Any]:
+        generator = random.Random(self.seed * MAX_LISTINGS + listing_id)
+        region, sector, lat, lon = AREAS[listing_id % len(AREAS)]
+        street = f'{generator.randint(1, 200)} {generator.choice(STREETS)}'
+        title = f'{street}, {region}, {sector}'
+        return {
+            'id': listing_id,
+            'title': title,
+            'path': f'{DETAIL_PATH}{street.lower().replace(" ", "-")}-{region.lower().replace(" ", "-")}/{listing_id}',
+            'price': f'€{self.price(listing_id):,}',
+            'beds': f'{MockDaftListings.beds(listing_id)} Bed',
+            'baths': f'{generator.randint(1, 3)} Bath',
+            'floor_area': str(generator.randint(40, 240)),
+            'property_type': generator.choice(PROPERTY_TYPES),
+            'ber': generator.choice(BER_RATINGS + (BER_RATING_EXEMPT_CODE,)),
+            'lat': round(lat + generator.uniform(-0.01, 0.01), 6),
+            'lon': round(lon + generator.uniform(-0.01, 0.01), 6),
+            'description': [' '.join(generator.choice(WORDS) for _ in range(generator.randint(10, 30))).capitalize()
+                            for _ in range(generator.randint(2, 5))],
+            'updated_at': f'{generator.randint(1, 28):02d}.{generator.randint(1, 12):02d}.2020',
+            'views': generator.randint(100, 20000),
+        }
+
+    def _first_id(self, price: int) -> int:
+        # first id with the price or a higher one
+        return min(self.listings, max(0, -(-(price - PRICE_MIN) * self.listings // PRICE_SPAN)))
+
+    @staticmethod
+    def _rank(listing_id: int, beds_remainders: List[int]) -> int:
+        # number of ids below listing_id with any of the remainders
+        return listing_id // BEDS_CYCLE * len(beds_remainders) + sum(remainder < listing_id % BEDS_CYCLE
+                                                                      for remainder in beds_remainders)
+
+
+class MockDaftSite(Resource):
+    # Serves the search and property pages of the generated listings shaped like daft.ie, after latency seconds and
+    # failing error_rate of the requests with a 503. Over max_rps requests per second are throttled with a 429
+    isLeaf = True
+
+    def __init__(self, listings: MockDaftListings, latency: float = 0.0, error_rate: float = 0.0,
+                 max_rps: Optional[float] = None, padding_bytes: int = DEFAULT_PADDING_BYTES,
+                 seed: int = DEFAULT_SEED) -> None:
+        super().__init__()
+        self.listings = listings
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        # markup of the rest of the page, the same on every one
+        self.padding = ''.join(f'<div class="Filler"><a href="/filler/{index}">Filler link {index}</a></div>'
+                               for index in range(padding_bytes // 64))
+        self.stats = {'requests': 0, 'search_pages': 0, 'detail_pages': 0, 'not_found': 0, 'errors': 0,
+                      'throttled': 0}
+        self._random = random.Random(seed)
+        self._tokens = max_rps or 0.0
+        self._tokens_time = time.monotonic()
+
+    def render_GET(self, request: Any) -> Any:
+        path = request.path.decode()
+        if path == STATS_PATH:
+            request.setHeader(b'Content-Type', b'application/json')
+            return json.dumps(self.stats).encode()
+
+        self.stats['requests'] += 1
+        if not self._take_token():
+            self.stats['throttled'] += 1
+            request.setResponseCode(429)
+            request.setHeader(b'Retry-After', str(THROTTLE_RETRY_AFTER_S).encode())
+            return b''
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            request.setResponseCode(503)
+            return b''
+
+        body = self.render_page(path, parse_qs(urlsplit(request.uri.decode()).query))
+        if body is None:
+            self.stats['not_found'] += 1
+            request.setResponseCode(404)
+            return b''
+
+        request.setHeader(b'Content-Type', b'text/html; charset=utf-8')
+        if not self.latency:
+            return body
+
+        from twisted.internet import reactor
+        # the latency varies like the one of a real server
+        delayed_call = reactor.callLater(self.latency * self._random.uniform(0.5, 1.5), MockDaftSite._finish,
+                                         request, body)
+        request.notifyFinish().addErrback(lambda _: delayed_call.cancel())
+        return NOT_DONE_YET
+
+    def render_page(self, path: str, query: Dict[str, List[str]]) -> Optional[bytes]:
+        if path.startswith(PROPERTIES_FOR_SALE):
+            self.stats['search_pages'] += 1
+            return self.render_search_page(query)
+
+        if path.startswith(DETAIL_PATH):
+            listing_id = path.rstrip('/').rsplit('/', 1)[-1]
+            if listing_id.isdigit() and int(listing_id) < self.listings.listings:
+                self.stats['detail_pages'] += 1
+                return self.render_detail_page(int(listing_id))
+        return None
+
+    def render_search_page(self, query: Dict[str, List[str]]) -> bytes:
+        search = self.listings.search(MockDaftSite._int_arg(query, 'salePrice_from'),
+                                      MockDaftSite._int_arg(query, 'salePrice_to'),
+                                      MockDaftSite._int_arg(query, 'numBeds_from'),
+                                      MockDaftSite._int_arg(query, 'numBeds_to'))
+        page_ids = MockDaftListings.page(search, MockDaftSite._int_arg(query, 'from') or 0,
+                                         MockDaftSite._int_arg(query, 'pageSize') or DEFAULT_PAGE_SIZE)
+        cards = '\n'.join(CARD % self.listings.listing(listing_id) for listing_id in page_ids)
+        return (SEARCH_PAGE % {'padding': self.padding, 'count': f'{MockDaftListings.count(search):,}',
+                               'cards': cards}).encode()
+
+    def render_detail_page(self, listing_id: int) -> bytes:
+        listing = self.listings.listing(listing_id)
+        day, month, year = listing['updated_at'].split('.')
+        next_data = {'props': {'pageProps': {
+            'listing': {'id': listing_id, 'title': listing['title'], 'price': listing['price'],
+                        'numBedrooms': listing['beds'], 'numBathrooms': listing['baths'],
+                        'propertyType': listing['property_type'], 'ber': {'rating': listing['ber']},
+                        'floorArea': {'unit': 'METRES_SQUARED', 'value': listing['floor_area']},
+                        'point': {'type': 'Point', 'coordinates': [listing['lon'], listing['lat']]},
+                        'lastUpdateDate': f'{day}/{month}/{year}', 'description': '\n'.join(listing['description'])},
+            'listingViews': listing['views']}}, 'page': '/for-sale/[title]/[id]'}
+        return (DETAIL_PAGE % {**listing, 'padding': self.padding, 'views': f'{listing["views"]:,}',
+                               'description_html': '<br>'.join(listing['description']),
+                               'next_data': json.dumps(next_data, ensure_ascii=False)}).encode()
+
+    def _take_token(self) -> bool:
+        # token bucket refilled at max_rps, holding up to a second of requests
+        if not self.max_rps:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.max_rps, self._tokens + (now - self._tokens_time) * self.max_rps)
+        self._tokens_time = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    @staticmethod
+    def _finish(request: Any, body: bytes) -> None:
+        request.write(body)
+        request.finish()
+
+    @staticmethod
+    def _int_arg(query: Dict[str, List[str]], name: str) -> Optional[int]:
+        values = query.get(name)
+        return int(values[0]) if values and values[0].isdigit() else None
+
+
+def get_arg_parser() -> ArgumentParser:
+    parser = ArgumentParser(prog='python -m benchmarks.mock_daft',
+                            description='Serves generated daft.ie search and property pages, to crawl with'
+                                        ' web-scraper houses-for-sale --daft-address.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface the server listens on.')
+    parser.add_argument('--port', type=int, default=8080, help='Port the server listens on, 0 for any free one.')
+    parser.add_argument('--listings', type=int, default=DEFAULT_LISTINGS,
+                        help=f'Number of properties for sale, up to {MAX_LISTINGS}.')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Average milliseconds every page takes to be served.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of the requests failed with a 503.')
+    parser.add_argument('--max-rps', type=float,
+                        help='Requests per second served, the ones over it are throttled with a 429.')
+    parser.add_argument('--padding-bytes', type=int, default=DEFAULT_PADDING_BYTES,
+                        help='Size of the markup added to every page, as the rest of the real pages.')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Seed of the generated properties.')
+    return parser
+
+
+def main(args: Namespace) -> None:
+    from twisted.internet import reactor
+
+    site = MockDaftSite(MockDaftListings(args.listings, args.seed), args.latency_ms / 1000, args.error_rate,
+                        args.max_rps, args.padding_bytes, args.seed)
+    port = reactor.listenTCP(args.port, Site(site), interface=args.host)
+    # the first line is read by the load harness
+    print(f'Serving {args.listings} properties on http://{args.host}:{port.getHost().port}', flush=True)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main(get_arg_parser().parse_args())
@@ -0,0 +1,180 @@
+import os
+import platform
+import random
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import lxml.etree
+import numpy as np
+import scrapy
+from scrapy import Request, Spider
+from scrapy.crawler import Crawler
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.utils.misc import load_object
+
+from web_scraper.items import DaftProperty
+from web_scraper.pipelines import OUTPUT_PIPELINES, OUTPUT_PATH_SETTING, OUTPUT_FORMAT_SETTING
+from web_scraper.public_transport import PublicTransport, DUBLIN_BOUNDING_BOX
+from web_scraper.spiders import DaftSaleUsedSpider, EXTRACTION_MODES, DAFT_ADDRESS, PROPERTIES_FOR_SALE, \
+    PAGE_FROM_META, PAGE_CHAIN_META, DEFAULT_PAGE_SIZE
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+DETAIL_PAGE_PREFIX = 'detail-'
+LISTING_PAGE_PREFIX = 'listing-'
+
+RESULTS_VERSION = 1
+DEFAULT_REPEAT = 5
+DEFAULT_PASSES = 10
+DEFAULT_LOOKUPS = 2000
+DEFAULT_ITEMS = 5000
+# same seed on every run, so the random coordinates are the same between releases
+COORDS_SEED = 20201018
+
+
+class BenchmarkSuite:
+    # Measures the extraction, the nearest station search and the output pipelines on the saved pages of the corpus,
+    # without any request. Every benchmark runs repeat times and keeps the best round. The responses are built on
+    # every round, as they keep their parsed html
+
+    def __init__(self, repeat: int = DEFAULT_REPEAT, passes: int = DEFAULT_PASSES, lookups: int = DEFAULT_LOOKUPS,
+                 items: int = DEFAULT_ITEMS, corpus_dir: str = CORPUS_DIR) -> None:
+        self.repeat = repeat
+        self.passes = passes
+        self.lookups = lookups
+        self.items = items
+        self.detail_pages = BenchmarkSuite._load_pages(corpus_dir, DETAIL_PAGE_PREFIX)
+        self.listing_pages = BenchmarkSuite._load_pages(corpus_dir, LISTING_PAGE_PREFIX)
+
+    def run(self) -> Dict[str, Any]:
+        return {
+            'version': RESULTS_VERSION,
+            'environment': BenchmarkSuite.environment(),
+            'parameters': {'repeat': self.repeat, 'passes': self.passes, 'lookups': self.lookups,
+                           'items': self.items, 'detail_pages': len(self.detail_pages),
+                           'listing_pages': len(self.listing_pages)},
+            'extraction': self.run_extraction(),
+            'nearest_station': self.run_nearest_station(),
+            'output': self.run_output(),
+        }
+
+    def run_extraction(self) -> Dict[str, Dict[str, float]]:
+        results = {}
+        for extraction_mode in EXTRACTION_MODES:
+            spider = DaftSaleUsedSpider(extraction_mode=extraction_mode, defer_enrichment=True)
+            results[f'detail/{extraction_mode}'] = self._rate(
+                lambda: [item for _ in range(self.passes) for url, body in self.detail_pages
+                         for item in spider.parse_detailed_page(BenchmarkSuite._response(url, body))],
+                len(self.detail_pages) * self.passes, 'pages_per_s')
+
+        for cards_only in (False, True):
+            spider = DaftSaleUsedSpider(cards_only=cards_only)
+            # a page in the middle of the pagination, which only follows its own links
+            meta = {PAGE_FROM_META: DEFAULT_PAGE_SIZE, PAGE_CHAIN_META: False}
+            results['listing/cards' if cards_only else 'listing/links'] = self._rate(
+                lambda: [result for _ in range(self.passes) for url, body in self.listing_pages
+                         for result in spider.parse(BenchmarkSuite._response(url, body, meta))],
+                len(self.listing_pages) * self.passes, 'pages_per_s')
+        return results
+
+    def run_nearest_station(self) -> Dict[str, Dict[str, float]]:
+        random_coords = random.Random(COORDS_SEED)
+        lat_min, lon_min, lat_max, lon_max = DUBLIN_BOUNDING_BOX
+        parsed_coords: List[Optional[Tuple[float, float]]] = [
+            (random_coords.uniform(lat_min, lat_max), random_coords.uniform(lon_min, lon_max))
+            for _ in range(self.lookups)]
+        coords = [f'{lat},{lon}' for lat, lon in parsed_coords]  # type: ignore
+
+        PublicTransport.use_grid(None)
+        return {
+            'single': self._rate(lambda: [PublicTransport.get_closest_stations(geolocation) for geolocation in coords],
+                                 len(coords), 'lookups_per_s'),
+            'batch': self._rate(lambda: PublicTransport.get_closest_stations_batch(parsed_coords),
+                                len(parsed_coords), 'lookups_per_s'),
+        }
+
+    def run_output(self) -> Dict[str, Dict[str, float]]:
+        items = self._output_items()
+        results = {}
+        for output_format, (pipeline_path, _) in OUTPUT_PIPELINES.items():
+            best: Optional[Tuple[float, int]] = None
+            for _ in range(self.repeat):
+                with tempfile.TemporaryDirectory() as output_dir:
+                    crawler = Crawler(DaftSaleUsedSpider, Settings({
+                        OUTPUT_FORMAT_SETTING: output_format,
+                        OUTPUT_PATH_SETTING: os.path.join(output_dir, 'data'),
+                    }))
+                    elapsed = BenchmarkSuite._time(
+                        lambda: BenchmarkSuite._write(load_object(pipeline_path).from_crawler(crawler), items))
+                    output_bytes = sum(os.path.getsize(os.path.join(output_dir, file_name))
+                                       for file_name in os.listdir(output_dir))
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, output_bytes)
+            elapsed, output_bytes = best  # type: ignore
+            results[output_format] = {'items_per_s': len(items) / elapsed, 'bytes_per_s': output_bytes / elapsed,
+                                      'bytes': output_bytes}
+        return results
+
+    @staticmethod
+    def environment() -> Dict[str, str]:
+        return {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scrapy': scrapy.__version__,
+            'lxml': '.'.join(map(str, lxml.etree.LXML_VERSION)),
+            'numpy': np.__version__,
+        }
+
+    def _output_items(self) -> List[DaftProperty]:
+        spider = DaftSaleUsedSpider(transport_cache_size=0)
+        pages_items = [item for url, body in self.detail_pages
+                       for item in spider.parse_detailed_page(BenchmarkSuite._response(url, body))]
+        # distinct links, so the sqlite output inserts every item instead of updating the same rows
+        return [DaftProperty(f'{page_item.link}-{index}', **{field: value for field, value in page_item.items()
+                                                             if field != 'link'})
+                for index, page_item in zip(range(self.items), pages_items * (self.items // len(pages_items) + 1))]
+
+    def _rate(self, function: Callable[[], Any], count: int, unit: str) -> Dict[str, float]:
+        elapsed = min(BenchmarkSuite._time(function) for _ in range(self.repeat))
+        return {unit: count / elapsed}
+
+    @staticmethod
+    def _time(function: Callable[[], Any]) -> float:
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _write(pipeline: Any, items: List[DaftProperty]) -> None:
+        spider = Spider(name=f'{DaftSaleUsedSpider.name}Benchmark')
+        pipeline.open_spider(spider)
+        for item in items:
+            pipeline.process_item(item, spider)
+        pipeline.close_spider(spider)
+
+    @staticmethod
+    def _response(url: str, body: bytes, meta: Optional[Dict[str, Any]] = None) -> HtmlResponse:
+        return HtmlResponse(url, body=body, request=Request(url, meta=meta))
+
+    @staticmethod
+    def _load_pages(corpus_dir: str, prefix: str) -> List[Tuple[str, bytes]]:
+        pages = []
+        for file_name in sorted(os.listdir(corpus_dir)):
+            if file_name.startswith(prefix):
+                with open(os.path.join(corpus_dir, file_name), 'rb') as page_file:
+                    url = f'{DAFT_ADDRESS}{PROPERTIES_FOR_SALE}/{os.path.splitext(file_name)[0]}'
+                    pages.append((url, page_file.read()))
+        return pages
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, float]:
+    # relative change of every rate against the baseline, positive is faster
+    changes = {}
+    for group in ('extraction', 'nearest_station', 'output'):
+        for name, metrics in results.get(group, {}).items():
+            for unit, value in metrics.items():
+                baseline_value = baseline.get(group, {}).get(name, {}).get(unit)
+                if unit.endswith('_per_s') and baseline_value:
+                    changes[f'{group}/{name}/{unit}'] = value / baseline_value - 1
+    return changes
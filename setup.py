@@ -3,5 +3,5 @@ from setuptools import setup, find_packages
 setup(
     name='web-scraper',
     scripts=['bin/web-scraper'],
-    packages=find_packages()
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*'])
 )
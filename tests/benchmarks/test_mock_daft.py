@@ -0,0 +1,138 @@
+import json
+
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from twisted.web.test.requesthelper import DummyRequest
+
+from benchmarks.load import get_arg_parser, main
+from benchmarks.mock_daft import MockDaftListings, MockDaftSite, STATS_PATH, PRICE_MIN
+from web_scraper.spiders import DaftSaleUsedSpider, EXTRACTION_MODES, PAGE_FROM_META, PAGE_CHAIN_META
+
+MOCK_ADDRESS = 'http://127.0.0.1:8080'
+
+
+def get(site, path, query=b''):
+    request = DummyRequest(path.lstrip(b'/').split(b'/'))
+    request.path = path
+    request.uri = path + (b'?' + query if query else b'')
+    body = site.render_GET(request)
+    return request, body
+
+
+@pytest.mark.parametrize('min_price,max_price,min_beds,max_beds', [
+    (None, None, None, None), (300000, 900000, None, None), (None, 500000, 2, 3), (PRICE_MIN, None, 5, None),
+    (5000000, None, None, None)])
+def test_mock_listings_should_match_the_searched_properties(min_price, max_price, min_beds, max_beds):
+    listings = MockDaftListings(500)
+    expected = [listing_id for listing_id in range(500)
+                if (min_price is None or listings.price(listing_id) >= min_price)
+                and (max_price is None or listings.price(listing_id) <= max_price)
+                and (min_beds or 0) <= listings.beds(listing_id) <= (max_beds or 5)]
+
+    search = listings.search(min_price, max_price, min_beds, max_beds)
+    pages = [listing_id for page_from in range(0, 500, 20) for listing_id in MockDaftListings.page(search, page_from)]
+
+    assert MockDaftListings.count(search) == len(expected)
+    assert pages == expected
+
+
+def test_mock_listings_should_generate_the_same_properties():
+    assert MockDaftListings(1000, seed=1).listing(10) == MockDaftListings(1000, seed=1).listing(10)
+    assert MockDaftListings(1000, seed=1).listing(10) != MockDaftListings(1000, seed=2).listing(10)
+
+
+def test_mock_site_search_page_should_be_crawled_by_the_spider():
+    site = MockDaftSite(MockDaftListings(45), padding_bytes=0)
+    spider = DaftSaleUsedSpider(daft_address=MOCK_ADDRESS)
+    url = spider.start_urls[0]
+    response = HtmlResponse(url, body=site.render_search_page({}), request=Request(url))
+
+    requests = list(spider.parse(response))
+
+    detail_requests = [request for request in requests if request.callback == spider.parse_detailed_page]
+    page_requests = [request for request in requests if request.callback == spider.parse]
+    assert len(detail_requests) == 20
+    assert all(request.url.startswith(MOCK_ADDRESS + '/for-sale/') for request in detail_requests)
+    assert [request.meta[PAGE_FROM_META] for request in page_requests] == [20, 40]
+
+
+def test_mock_site_search_page_cards_should_be_extracted():
+    listings = MockDaftListings(45)
+    site = MockDaftSite(listings, padding_bytes=0)
+    spider = DaftSaleUsedSpider(daft_address=MOCK_ADDRESS, cards_only=True)
+    url = spider.start_urls[0]
+    response = HtmlResponse(url, body=site.render_search_page({'from': ['40']}),
+                            request=Request(url, meta={PAGE_FROM_META: 40, PAGE_CHAIN_META: False}))
+
+    cards = list(spider.parse(response))
+
+    assert [card['price'] for card in cards] == [listings.price(listing_id) for listing_id in range(40, 45)]
+    assert [card['bedrooms'] for card in cards] == [listings.beds(listing_id) for listing_id in range(40, 45)]
+
+
+@pytest.mark.parametrize('extraction_mode', EXTRACTION_MODES)
+def test_mock_site_detail_page_should_extract_the_same_fields_on_every_mode(extraction_mode):
+    listings = MockDaftListings(100)
+    site = MockDaftSite(listings)
+    listing = listings.listing(42)
+    url = MOCK_ADDRESS + listing['path']
+    body = site.render_detail_page(42)
+
+    css_items = list(DaftSaleUsedSpider(defer_enrichment=True).parse_detailed_page(
+        HtmlResponse(url, body=body, request=Request(url))))
+    items = list(DaftSaleUsedSpider(extraction_mode=extraction_mode, defer_enrichment=True).parse_detailed_page(
+        HtmlResponse(url, body=body, request=Request(url))))
+
+    assert items == css_items
+    assert items[0]['price'] == listings.price(42)
+    assert items[0]['bedrooms'] == listings.beds(42)
+    assert items[0]['main_address'] == listing['title']
+    assert items[0]['geolocation'] == f'{listing["lat"]},{listing["lon"]}'
+    assert items[0]['views'] == listing['views']
+
+
+def test_mock_site_should_serve_the_pages_and_the_stats():
+    site = MockDaftSite(MockDaftListings(30), padding_bytes=0)
+
+    _, search_body = get(site, b'/property-for-sale/ireland', b'salePrice_from=100000&from=20')
+    detail_request, detail_body = get(site, b'/for-sale/any-street/7')
+    not_found_request, _ = get(site, b'/for-sale/any-street/30')
+    _, stats_body = get(site, STATS_PATH.encode())
+
+    assert search_body.count(b'data-testid="results"') == 1
+    assert b'/for-sale/' in search_body
+    assert detail_request.responseCode is None
+    assert b'__NEXT_DATA__' in detail_body
+    assert not_found_request.responseCode == 404
+    assert json.loads(stats_body) == {'requests': 3, 'search_pages': 1, 'detail_pages': 1, 'not_found': 1,
+                                      'errors': 0, 'throttled': 0}
+
+
+def test_mock_site_should_fail_and_throttle_requests():
+    failing_site = MockDaftSite(MockDaftListings(30), error_rate=1.0)
+    throttling_site = MockDaftSite(MockDaftListings(30), max_rps=2)
+
+    failed_request, _ = get(failing_site, b'/for-sale/any-street/7')
+    throttled_requests = [get(throttling_site, b'/for-sale/any-street/7')[0] for _ in range(3)]
+
+    assert failed_request.responseCode == 503
+    assert failing_site.stats['errors'] == 1
+    assert [request.responseCode for request in throttled_requests] == [None, None, 429]
+    assert throttled_requests[-1].responseHeaders.getRawHeaders(b'Retry-After') == [b'1']
+    assert throttling_site.stats['throttled'] == 1
+
+
+def test_load_harness_should_crawl_the_mock_site(tmp_path):
+    results = tmp_path / 'results.json'
+    output = tmp_path / 'data.jl'
+
+    main(get_arg_parser().parse_args(['--listings', '30', '--padding-bytes', '0', '--output', str(results),
+                                      '--timeout', '120', '--', '--output', str(output)]))
+
+    load_results = json.loads(results.read_text())
+    assert load_results['returncode'] == 0
+    assert load_results['items'] == 30
+    assert load_results['server']['detail_pages'] == 30
+    assert load_results['items_per_s'] > 0 and load_results['peak_rss_bytes'] > 0
+    assert len(output.read_text().splitlines()) == 30
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+from benchmarks.__main__ import get_arg_parser, main
+from benchmarks.suite import BenchmarkSuite, compare
+from web_scraper.pipelines import OUTPUT_PIPELINES
+from web_scraper.spiders import DaftSaleUsedSpider, EXTRACTION_MODES
+
+
+@pytest.fixture(scope='module')
+def results():
+    return BenchmarkSuite(repeat=1, passes=1, lookups=10, items=30).run()
+
+
+def test_benchmark_suite_should_load_the_corpus():
+    suite = BenchmarkSuite()
+
+    assert len(suite.detail_pages) == 12
+    assert len(suite.listing_pages) == 3
+
+
+@pytest.mark.parametrize('extraction_mode', EXTRACTION_MODES)
+def test_corpus_pages_should_extract_the_same_fields_on_every_mode(extraction_mode):
+    pages = BenchmarkSuite().detail_pages
+    css_spider = DaftSaleUsedSpider(defer_enrichment=True)
+    mode_spider = DaftSaleUsedSpider(extraction_mode=extraction_mode, defer_enrichment=True)
+
+    for url, body in pages:
+        expected = list(css_spider.parse_detailed_page(HtmlResponse(url, body=body, request=Request(url))))
+        assert list(mode_spider.parse_detailed_page(HtmlResponse(url, body=body, request=Request(url)))) == expected
+        assert expected[0]['geolocation'] and expected[0]['main_address']
+
+
+def test_benchmark_suite_should_report_every_rate(results):
+    assert set(results['extraction']) == {f'detail/{mode}' for mode in EXTRACTION_MODES} | {'listing/links',
+                                                                                            'listing/cards'}
+    assert set(results['nearest_station']) == {'single', 'batch'}
+    assert set(results['output']) == set(OUTPUT_PIPELINES)
+    assert all(metrics['pages_per_s'] > 0 for metrics in results['extraction'].values())
+    assert all(metrics['lookups_per_s'] > 0 for metrics in results['nearest_station'].values())
+    assert all(metrics['items_per_s'] > 0 and metrics['bytes_per_s'] > 0 and metrics['bytes'] > 0
+               for metrics in results['output'].values())
+    assert results['parameters']['items'] == 30
+    json.dumps(results)
+
+
+def test_compare_should_report_the_change_of_every_rate():
+    results = {'extraction': {'detail/css': {'pages_per_s': 150.0}}, 'output': {'csv': {'items_per_s': 50.0,
+                                                                                         'bytes': 10}}}
+    baseline = {'extraction': {'detail/css': {'pages_per_s': 100.0}}, 'output': {'csv': {'items_per_s': 100.0,
+                                                                                          'bytes': 20}}}
+
+    assert compare(results, baseline) == {'extraction/detail/css/pages_per_s': 0.5, 'output/csv/items_per_s': -0.5}
+
+
+def test_benchmarks_main_should_save_the_results(tmp_path, capsys):
+    output = tmp_path / 'results.json'
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps({'nearest_station': {'single': {'lookups_per_s': 1e-9}}}))
+
+    main(get_arg_parser().parse_args(['--output', str(output), '--baseline', str(baseline), '--repeat', '1',
+                                      '--passes', '1', '--lookups', '5', '--items', '10']))
+
+    assert json.loads(output.read_text())['parameters']['lookups'] == 5
+    assert 'nearest_station/single/lookups_per_s: +' in capsys.readouterr().out
@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List
+from unittest.mock import Mock
+
+import pytest
+
+from benchmarks.load import PROJECT_DIR, SERVER_ADDRESS_REGEX, WEB_SCRAPER_SCRIPT
+from web_scraper.checkpoint import CrawlCheckpoint, CHECKPOINT_FILE
+
+PAGE_URL = 'https://www.daft.ie/property-for-sale/ireland?pageSize=20&from=20&'
+DETAIL_URL = 'https://www.daft.ie/for-sale/house-1'
+
+
+@pytest.fixture
+def checkpoint_dir(tmp_path):
+    return str(tmp_path / 'checkpoint')
+
+
+def test_checkpoint_should_save_the_pending_requests_and_the_outputs(checkpoint_dir):
+    checkpoint = CrawlCheckpoint(checkpoint_dir)
+    output = Mock()
+    output.checkpoint_state.return_value = {'bytes': 10}
+    checkpoint.register_output('output', output)
+    checkpoint.add_pending(PAGE_URL, 'parse', {'page_from': 20})
+    checkpoint.add_pending(DETAIL_URL, 'parse_detailed_page', {})
+    checkpoint.mark_completed(DETAIL_URL)
+
+    checkpoint.save()
+
+    resumed_checkpoint = CrawlCheckpoint(checkpoint_dir, resume=True)
+    assert resumed_checkpoint.resumed
+    assert resumed_checkpoint.pending == {PAGE_URL: {'callback': 'parse', 'meta': {'page_from': 20}}}
+    assert resumed_checkpoint.completed == {DETAIL_URL}
+    assert resumed_checkpoint.register_output('output', Mock()) == {'bytes': 10}
+    assert checkpoint.saves == 1
+
+
+def test_checkpoint_should_not_restore_the_outputs_without_resuming(checkpoint_dir):
+    CrawlCheckpoint(checkpoint_dir).save()
+
+    checkpoint = CrawlCheckpoint(checkpoint_dir)
+
+    assert not checkpoint.resumed
+    assert checkpoint.register_output('output', Mock()) is None
+
+
+def test_checkpoint_should_start_from_the_beginning_without_a_checkpoint(checkpoint_dir):
+    assert not CrawlCheckpoint(checkpoint_dir, resume=True).resumed
+
+
+def test_checkpoint_should_be_removed_when_the_crawl_finishes(checkpoint_dir, tmp_path):
+    checkpoint = CrawlCheckpoint(checkpoint_dir)
+    checkpoint.save()
+
+    checkpoint.finish()
+
+    assert not (tmp_path / 'checkpoint' / CHECKPOINT_FILE).exists()
+    assert not CrawlCheckpoint(checkpoint_dir, resume=True).resumed
+
+
+def test_checkpoint_should_not_resume_unknown_versions(checkpoint_dir, tmp_path):
+    CrawlCheckpoint(checkpoint_dir)
+    (tmp_path / 'checkpoint' / CHECKPOINT_FILE).write_text(json.dumps({'version': 99}))
+
+    with pytest.raises(ValueError):
+        CrawlCheckpoint(checkpoint_dir, resume=True)
+
+
+def test_checkpoint_should_resume_a_killed_crawl(tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    output = tmp_path / 'data.jl'
+    env = {**os.environ, 'PYTHONPATH': PROJECT_DIR}
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.mock_daft', '--port', '0', '--listings', '60',
+                               '--latency-ms', '100', '--padding-bytes', '0'],
+                              stdout=subprocess.PIPE, cwd=PROJECT_DIR, env=env, text=True)
+    try:
+        daft_address = SERVER_ADDRESS_REGEX.search(server.stdout.readline()).group(1)
+        crawl_args = [sys.executable, WEB_SCRAPER_SCRIPT, 'houses-for-sale', '--daft-address', daft_address,
+                      '--locations', 'dublin-4-dublin', '--concurrent-requests', '2', '--checkpoint-dir',
+                      checkpoint_dir, '--checkpoint-interval', '0.2', '--output', str(output)]
+        crawl = subprocess.Popen(crawl_args, cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL)
+        completed: List[str] = []
+        deadline = time.monotonic() + 60
+        while len(completed) < 5 and crawl.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.1)
+            if os.path.exists(os.path.join(checkpoint_dir, CHECKPOINT_FILE)):
+                with open(os.path.join(checkpoint_dir, CHECKPOINT_FILE)) as checkpoint_file:
+                    completed = json.load(checkpoint_file)['completed']
+        crawl.kill()
+        crawl.wait()
+
+        resumed_crawl = subprocess.run(crawl_args + ['--resume'], cwd=PROJECT_DIR, env=env, timeout=120,
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    links = [json.loads(line)['link'] for line in output.read_text().splitlines()]
+    assert len(completed) >= 5
+    assert resumed_crawl.returncode == 0
+    assert 'Resuming from' in resumed_crawl.stdout
+    assert len(links) == len(set(links)) == 60
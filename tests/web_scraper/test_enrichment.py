@@ -0,0 +1,151 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from scrapy import Spider
+from scrapy.settings import Settings
+
+from web_scraper import spiders
+from web_scraper.enrichment import EnrichmentPipeline, THREAD_POOL, PROCESS_POOL, ENRICHMENT_POOL_SETTING, \
+    ENRICHMENT_WORKERS_SETTING, ENRICHMENT_BATCH_SIZE_SETTING, ENRICHMENT_MAX_DELAY_SETTING, enrich_items
+from web_scraper.items import DaftProperty
+from web_scraper.public_transport import DART_STATIONS
+from web_scraper.spiders import DaftSaleUsedSpider, init_pool_spider
+
+GEOLOCATION = '53.2355839,-6.11813'
+
+
+class FakeReactor:
+    # runs the calls from the pool threads when the test decides, as the reactor thread would
+    def __init__(self):
+        self.delayed_calls = []
+        self.thread_calls = []
+
+    def callLater(self, delay, function):
+        delayed_call = Mock(active=Mock(return_value=True))
+        self.delayed_calls.append((delay, function, delayed_call))
+        return delayed_call
+
+    def callFromThread(self, function, *args):
+        self.thread_calls.append((function, args))
+
+    def run_thread_calls(self):
+        for function, args in self.thread_calls:
+            function(*args)
+        self.thread_calls = []
+
+
+@pytest.fixture()
+def reactor():
+    fake_reactor = FakeReactor()
+    with patch('twisted.internet.reactor', fake_reactor, create=True):
+        yield fake_reactor
+
+
+@pytest.fixture()
+def spider():
+    return DaftSaleUsedSpider(transport_cache_size=0, defer_enrichment=True)
+
+
+def test_enrichment_pipeline_should_pass_the_items_through_when_the_spider_enriches_them(reactor):
+    pipeline = EnrichmentPipeline()
+    item = DaftProperty('link', geolocation=GEOLOCATION)
+
+    pipeline.open_spider(DaftSaleUsedSpider(transport_cache_size=0))
+
+    assert pipeline.process_item(item, Mock(Spider)) is item
+    assert pipeline.close_spider(Mock(Spider)) is None
+
+
+def test_enrichment_pipeline_should_enrich_the_items_in_batches(reactor, spider):
+    pipeline = EnrichmentPipeline(THREAD_POOL, batch_size=2, max_delay=0.5, stats=Mock())
+    pipeline.open_spider(spider)
+    items = [DaftProperty(f'link{index}', geolocation=GEOLOCATION) for index in range(3)]
+    results = []
+
+    for item in items:
+        pipeline.process_item(item, spider).addCallback(results.append)
+    # the full batch cancels its delayed flush, the last item waits for more items or for the delay
+    assert [delay for delay, _, _ in reactor.delayed_calls] == [0.5, 0.5]
+    reactor.delayed_calls[0][2].cancel.assert_called_once_with()
+    reactor.delayed_calls[1][2].cancel.assert_not_called()
+
+    closed = pipeline.close_spider(spider)
+    reactor.delayed_calls[1][2].cancel.assert_called_once_with()
+    pipeline._executor.shutdown(wait=True)
+    reactor.run_thread_calls()
+
+    assert results == items
+    assert [(item['dart_station'], item['dart_distance_m']) for item in results] == [(DART_STATIONS[1].name, 342)] * 3
+    assert closed.called
+    assert pipeline.batches == 2
+    assert spider.timings.stages['enrichment/batch'].count == 2
+    pipeline.stats.inc_value.assert_any_call('enrichment/items', 2)
+    pipeline.stats.inc_value.assert_any_call('enrichment/items', 1)
+
+
+def test_enrichment_pipeline_should_flush_the_batch_after_the_delay(reactor, spider):
+    pipeline = EnrichmentPipeline(THREAD_POOL, batch_size=10)
+    pipeline.open_spider(spider)
+    results = []
+    pipeline.process_item(DaftProperty('link', geolocation=GEOLOCATION), spider).addCallback(results.append)
+
+    _, delayed_flush, _ = reactor.delayed_calls[0]
+    delayed_flush()
+    pipeline._executor.shutdown(wait=True)
+    reactor.run_thread_calls()
+
+    assert results[0]['dart_distance_m'] == 342
+
+
+def test_enrichment_pipeline_should_fail_the_items_of_a_failed_batch(reactor, spider):
+    pipeline = EnrichmentPipeline(THREAD_POOL, batch_size=1)
+    pipeline.open_spider(spider)
+    failures = []
+
+    with patch.object(spider, 'enrich_batch', side_effect=ValueError('no stations')):
+        pipeline.process_item(DaftProperty('link'), spider).addErrback(failures.append)
+        pipeline._executor.shutdown(wait=True)
+    reactor.run_thread_calls()
+
+    assert failures[0].check(ValueError)
+
+
+def test_enrichment_pipeline_should_enrich_on_a_process_pool(reactor, spider):
+    pipeline = EnrichmentPipeline(PROCESS_POOL, batch_size=1)
+    pipeline.open_spider(spider)
+    results = []
+
+    pipeline.process_item(DaftProperty('link', geolocation=GEOLOCATION), spider).addCallback(results.append)
+    pipeline._executor.shutdown(wait=True)
+    reactor.run_thread_calls()
+
+    # a copy of the item comes back from the pool
+    assert results[0]['dart_distance_m'] == 342
+
+
+def test_enrichment_worker_should_enrich_with_the_spider_arguments(tmp_path):
+    csv_path = tmp_path / 'schools.csv'
+    csv_path.write_text('name,latitude,longitude\nSchool 1,53.33,-6.25\n')
+
+    init_pool_spider({'poi_layers': {'schools': str(csv_path)}, 'transport_grid': None, 'transport_cache_size': None})
+    try:
+        items = enrich_items([DaftProperty('link', geolocation='53.331,-6.251')])
+    finally:
+        spiders._pool_spider = None
+
+    assert items[0]['schools_closest'] == 'School 1'
+
+
+def test_enrichment_pipeline_should_read_the_settings():
+    crawler = Mock(settings=Settings({ENRICHMENT_POOL_SETTING: PROCESS_POOL, ENRICHMENT_WORKERS_SETTING: 4,
+                                      ENRICHMENT_BATCH_SIZE_SETTING: 20, ENRICHMENT_MAX_DELAY_SETTING: 1.5}))
+
+    pipeline = EnrichmentPipeline.from_crawler(crawler)
+
+    assert (pipeline.pool, pipeline.workers, pipeline.batch_size, pipeline.max_delay) == (PROCESS_POOL, 4, 20, 1.5)
+    assert pipeline.stats is crawler.stats
+
+
+def test_enrichment_pipeline_should_reject_unknown_pools():
+    with pytest.raises(ValueError):
+        EnrichmentPipeline('gpu')
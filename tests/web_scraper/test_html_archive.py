@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from web_scraper.html_archive import HtmlArchiveWriter, HtmlArchiveReader, INDEX_FILE
+
+URL_1 = 'https://www.daft.ie/for-sale/house-1'
+URL_2 = 'https://www.daft.ie/for-sale/house-2'
+BODY_1 = b'<html><body>' + b'House 1 ' * 100 + b'</body></html>'
+BODY_2 = b'<html><body>House 2</body></html>'
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    return str(tmp_path / 'archive')
+
+
+def test_archive_should_read_the_archived_pages(archive_dir):
+    writer = HtmlArchiveWriter(archive_dir)
+    writer.add(URL_1, BODY_1)
+    writer.add(URL_2, BODY_2, 404)
+    writer.close()
+
+    reader = HtmlArchiveReader(archive_dir)
+    entries = list(reader.entries())
+
+    assert [(entry['url'], entry['status']) for entry in entries] == [(URL_1, 200), (URL_2, 404)]
+    assert [reader.read(entry) for entry in entries] == [BODY_1, BODY_2]
+    assert entries[0]['length'] < len(BODY_1)
+    assert writer.pages == 2
+    reader.close()
+
+
+def test_archive_should_rotate_the_segments(archive_dir):
+    writer = HtmlArchiveWriter(archive_dir, segment_bytes=1)
+    writer.add(URL_1, BODY_1)
+    writer.add(URL_2, BODY_2)
+    writer.close()
+
+    assert [entry['segment'] for entry in HtmlArchiveReader(archive_dir).entries()] == \
+        ['archive-00000.zz', 'archive-00001.zz']
+
+
+def test_archive_should_append_a_new_segment_on_every_crawl(archive_dir):
+    for url, body in [(URL_1, BODY_1), (URL_2, BODY_2)]:
+        writer = HtmlArchiveWriter(archive_dir)
+        writer.add(url, body)
+        writer.close()
+
+    reader = HtmlArchiveReader(archive_dir)
+    entries = list(reader.entries())
+
+    assert [entry['segment'] for entry in entries] == ['archive-00000.zz', 'archive-00001.zz']
+    assert [reader.read(entry) for entry in entries] == [BODY_1, BODY_2]
+    reader.close()
+
+
+def test_archive_should_read_the_pages_of_every_writer(archive_dir):
+    writers = [HtmlArchiveWriter(archive_dir, writer=f'worker{index}') for index in range(2)]
+    single_writer = HtmlArchiveWriter(archive_dir)
+    for writer in writers:
+        writer.add(URL_1, BODY_1)
+    writers[0].add(URL_2, BODY_2)
+    single_writer.add(URL_2, BODY_2)
+    for writer in writers + [single_writer]:
+        writer.close()
+
+    reader = HtmlArchiveReader(archive_dir)
+    entries = list(reader.entries())
+
+    assert sorted(os.listdir(archive_dir)) == ['archive-00000.zz', 'archive-worker0-00000.zz',
+                                               'archive-worker1-00000.zz', 'index-worker0.jl', 'index-worker1.jl',
+                                               INDEX_FILE]
+    assert [(entry['segment'], entry['url']) for entry in entries] == [
+        ('archive-00000.zz', URL_2), ('archive-worker0-00000.zz', URL_1), ('archive-worker0-00000.zz', URL_2),
+        ('archive-worker1-00000.zz', URL_1)]
+    assert [reader.read(entry) for entry in entries] == [BODY_2, BODY_1, BODY_2, BODY_1]
+    reader.close()
+
+
+def test_archive_should_skip_the_incomplete_index_lines(archive_dir):
+    writer = HtmlArchiveWriter(archive_dir)
+    writer.add(URL_1, BODY_1)
+    writer.close()
+    with open(os.path.join(archive_dir, INDEX_FILE), 'a') as index_file:
+        index_file.write('{"url": "https://www.daft.ie/for-sale/ho')
+
+    assert [entry['url'] for entry in HtmlArchiveReader(archive_dir).entries()] == [URL_1]
+
+
+def test_archive_should_not_add_pages_when_closed(archive_dir):
+    writer = HtmlArchiveWriter(archive_dir)
+    writer.close()
+
+    with pytest.raises(RuntimeError):
+        writer.add(URL_1, BODY_1)
@@ -0,0 +1,111 @@
+from email.utils import formatdate
+from time import time
+from unittest.mock import patch
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse, Response
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from web_scraper.http_cache import DaftCachePolicy, DaftHttpCacheMiddleware, LISTING_TTL_SETTING, \
+    DETAIL_TTL_SETTING, BYTES_SAVED_STAT, CACHED_AT_HEADER
+
+LISTING_URL = 'https://www.daft.ie/property-for-sale/ireland?pageSize=20&'
+DETAIL_URL = 'https://www.daft.ie/for-sale/house-1'
+BODY = b'<html><body>House</body></html>'
+ETAG = b'"etag-1"'
+
+
+def _response(url, age_s=0, status=200, body=BODY):
+    return HtmlResponse(url, status=status, body=body, headers={'Date': formatdate(time() - age_s, usegmt=True),
+                                                                 'ETag': ETAG})
+
+
+@pytest.fixture
+def policy():
+    return DaftCachePolicy(Settings({LISTING_TTL_SETTING: 60, DETAIL_TTL_SETTING: 3600}))
+
+
+@pytest.mark.parametrize('url, age_s, fresh', [
+    (LISTING_URL, 30, True),
+    (LISTING_URL, 120, False),
+    (DETAIL_URL, 120, True),
+    (DETAIL_URL, 7200, False),
+])
+def test_policy_should_use_the_ttl_of_every_kind_of_page(policy, url, age_s, fresh):
+    assert policy.is_cached_response_fresh(_response(url, age_s), Request(url)) == fresh
+
+
+def test_policy_should_revalidate_the_expired_pages(policy):
+    request = Request(DETAIL_URL)
+
+    policy.is_cached_response_fresh(_response(DETAIL_URL, 7200), request)
+
+    assert request.headers[b'If-None-Match'] == ETAG
+
+
+def test_policy_should_cache_the_pages_without_validators(policy):
+    assert policy.should_cache_response(HtmlResponse(DETAIL_URL, body=BODY), Request(DETAIL_URL))
+    assert not policy.should_cache_response(HtmlResponse(DETAIL_URL, status=404, body=BODY), Request(DETAIL_URL))
+
+
+@pytest.mark.parametrize('age_s, fresh', [(120, True), (7200, False)])
+def test_policy_should_use_the_time_the_page_was_cached_without_a_date(policy, age_s, fresh):
+    response = HtmlResponse(DETAIL_URL, body=BODY)
+    with patch('web_scraper.http_cache.time', return_value=time() - age_s):
+        policy.should_cache_response(response, Request(DETAIL_URL))
+
+    assert policy.is_cached_response_fresh(response, Request(DETAIL_URL)) == fresh
+
+
+def test_policy_should_prefer_the_time_the_page_was_cached_to_its_date(policy):
+    response = _response(DETAIL_URL)
+    response.headers[CACHED_AT_HEADER] = str(time() - 7200)
+
+    assert not policy.is_cached_response_fresh(response, Request(DETAIL_URL))
+
+
+def test_policy_should_expire_the_pages_without_any_time(policy):
+    assert not policy.is_cached_response_fresh(HtmlResponse(DETAIL_URL, body=BODY), Request(DETAIL_URL))
+
+
+@pytest.fixture
+def middleware(tmp_path):
+    crawler = get_crawler(Spider, {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': str(tmp_path),
+        'HTTPCACHE_GZIP': True,
+        'HTTPCACHE_POLICY': 'web_scraper.http_cache.DaftCachePolicy',
+        LISTING_TTL_SETTING: 0,
+    })
+    crawler.spider = Spider.from_crawler(crawler, 'cache_test')
+    cache_middleware = DaftHttpCacheMiddleware.from_crawler(crawler)
+    cache_middleware.spider_opened(crawler.spider)
+    yield cache_middleware
+    cache_middleware.spider_closed(crawler.spider)
+
+
+def test_middleware_should_count_the_bytes_of_the_cache_hits(middleware):
+    assert middleware.process_request(Request(DETAIL_URL)) is None
+    middleware.process_response(Request(DETAIL_URL), _response(DETAIL_URL))
+
+    cached_response = middleware.process_request(Request(DETAIL_URL))
+
+    assert cached_response.body == BODY
+    assert middleware.stats.get_value('httpcache/hit') == 1
+    assert middleware.stats.get_value(BYTES_SAVED_STAT) == len(BODY)
+
+
+def test_middleware_should_count_the_bytes_of_the_revalidated_pages(middleware):
+    middleware.process_request(Request(LISTING_URL))
+    middleware.process_response(Request(LISTING_URL), _response(LISTING_URL))
+
+    request = Request(LISTING_URL)
+    assert middleware.process_request(request) is None
+    result = middleware.process_response(request, Response(LISTING_URL, status=304))
+
+    assert request.headers[b'If-None-Match'] == ETAG
+    assert result.body == BODY
+    assert middleware.stats.get_value('httpcache/revalidate') == 1
+    assert middleware.stats.get_value(BYTES_SAVED_STAT) == len(BODY)
@@ -0,0 +1,96 @@
+import json
+import pickle
+
+import pytest
+
+from web_scraper.items import DaftProperty, DAFT_PROPERTY_FIELDS, CSV_COLUMNS, to_json, to_csv_row
+
+LINK = 'https://www.daft.ie/for-sale/house-7-crofton-terrace/2345678'
+
+
+@pytest.fixture()
+def daft_property():
+    return DaftProperty(LINK, property_type='House', ber_rating='C1', price=375000, bedrooms=3, bathrooms=2,
+                        floor_area_m2=54.5, main_address='7 Crofton Terrace, Dún Laoghaire, South Co. Dublin',
+                        sector='South Co. Dublin', region='Dún Laoghaire', geolocation='53.29,-6.13',
+                        description='A "lovely" house\nclose to the sea', updated_at='2020-04-05', views=1234,
+                        dart_station='Salthill and Monkstown', dart_distance_m=342, schools_closest='St. Mary',
+                        schools_distance_m=120)
+
+
+def test_daft_property_should_keep_every_field_on_a_slot(daft_property):
+    assert not hasattr(daft_property, '__dict__')
+    assert daft_property.price == 375000
+    assert daft_property['bedrooms'] == 3
+    assert daft_property['green_luas_station'] is None
+    assert daft_property.extra == {'schools_closest': 'St. Mary', 'schools_distance_m': 120}
+
+
+@pytest.mark.parametrize('ber_rating, ber_code', [('A1', 0), ('C1', 6), ('G', 14), (None, None),
+                                                  ('XXX', 'XXX')])
+def test_daft_property_should_encode_the_ber_rating(ber_rating, ber_code):
+    daft_property = DaftProperty(LINK, ber_rating=ber_rating)
+
+    assert daft_property._ber_code == ber_code
+    assert daft_property.ber_rating == ber_rating
+
+
+def test_daft_property_should_share_the_repeated_values():
+    region = ''.join(['Rath', 'mines'])
+
+    assert DaftProperty(LINK, region=region).region is DaftProperty(LINK, region='Rathmines').region
+
+
+def test_daft_property_should_behave_as_a_dict(daft_property):
+    daft_property['price'] = 350000
+    daft_property['hospitals_distance_m'] = 800
+
+    assert list(daft_property) == list(DAFT_PROPERTY_FIELDS) + ['schools_closest', 'schools_distance_m',
+                                                                'hospitals_distance_m']
+    assert len(daft_property) == len(DAFT_PROPERTY_FIELDS) + 3
+    assert 'hospitals_distance_m' in daft_property
+    assert 'unknown' not in daft_property
+    assert daft_property.get('unknown', 'default') == 'default'
+    assert dict(daft_property)['price'] == 350000
+    assert daft_property == dict(daft_property)
+    with pytest.raises(KeyError):
+        daft_property['unknown']
+
+
+def test_daft_property_should_be_accepted_as_a_dict_item(daft_property):
+    copied_property = daft_property.copy()
+    copied_property.update({'price': 350000}, views=10)
+
+    assert isinstance(daft_property, dict)
+    assert {**daft_property} == dict(daft_property.items())
+    assert copied_property.setdefault('price') == 350000
+    assert (copied_property.views, daft_property.views) == (10, 1234)
+    assert copied_property != daft_property
+    with pytest.raises(TypeError):
+        daft_property.pop('price')
+
+
+def test_daft_property_should_serialize_to_json_as_a_dict(daft_property):
+    assert daft_property.to_json() == json.dumps(dict(daft_property))
+    assert to_json(daft_property) == to_json(dict(daft_property))
+    assert DaftProperty(LINK).to_json() == json.dumps(dict(DaftProperty(LINK)))
+
+
+@pytest.mark.parametrize('value', [float('inf'), float('nan'), True, 1e-07, 'Ráth Maonais', ['list']])
+def test_daft_property_should_serialize_any_value_to_json_as_json_does(value):
+    daft_property = DaftProperty(LINK, floor_area_m2=value, schools_closest=value)
+
+    assert daft_property.to_json() == json.dumps(dict(daft_property))
+
+
+def test_daft_property_should_serialize_to_a_csv_row(daft_property):
+    row = daft_property.to_csv_row()
+
+    assert len(row) == len(CSV_COLUMNS)
+    assert row[:4] == [LINK, 'House', 'C1', 375000]
+    assert json.loads(row[-1]) == {'schools_closest': 'St. Mary', 'schools_distance_m': 120}
+    assert to_csv_row(dict(daft_property)) == row
+
+
+def test_daft_property_should_survive_pickling(daft_property):
+    assert pickle.loads(pickle.dumps(daft_property)) == daft_property
@@ -0,0 +1,155 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from scrapy import Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from twisted.web.test.requesthelper import DummyRequest
+
+from web_scraper.metrics import StageHistogram, StageTimings, StageMetricsExporter, MetricsResource, \
+    timed_process_item, to_prometheus, METRICS_FILE_SETTING, METRICS_PORT_SETTING, METRICS_INTERVAL_SETTING
+
+
+def test_stage_histogram_should_estimate_the_quantiles():
+    histogram = StageHistogram()
+    durations = [index / 10000 for index in range(1000, 0, -1)]
+
+    for duration in durations:
+        histogram.observe(duration)
+
+    assert histogram.count == 1000
+    assert histogram.total == pytest.approx(sum(durations))
+    for quantile, expected in ((0.5, 0.05), (0.95, 0.095), (0.99, 0.099)):
+        assert expected <= histogram.quantile(quantile) <= expected * 1.1
+    assert histogram.quantile(1.0) == histogram.max == 0.1
+
+
+def test_stage_histogram_should_count_the_shortest_durations_on_the_first_bucket():
+    histogram = StageHistogram()
+
+    histogram.observe(0.0)
+    histogram.observe(1e-7)
+
+    assert histogram.buckets == {0: 2}
+    assert histogram.quantile(0.5) == 1e-7
+    assert StageHistogram().quantile(0.99) == 0.0
+
+
+def test_stage_timings_should_only_time_the_production_of_the_values():
+    timings = StageTimings()
+    clock = [0.0]
+
+    def values():
+        clock[0] += 1
+        yield 1
+        clock[0] += 1
+        yield 2
+
+    with patch('web_scraper.metrics.perf_counter', lambda: clock[0]):
+        for _ in timings.timed('parse', values()):
+            clock[0] += 10
+        closed_values = timings.timed('parse', values())
+        next(closed_values)
+        closed_values.close()
+
+    assert timings.stages['parse'].count == 2
+    assert timings.stages['parse'].total == 3
+
+
+def test_stage_timings_should_publish_the_histograms_on_the_stats():
+    timings = StageTimings()
+    stats = MemoryStatsCollector(Mock())
+    for duration in (0.01, 0.02, 0.03):
+        timings.observe('extract/price', duration)
+
+    timings.publish(stats)
+
+    published = stats.get_stats()
+    assert published['timing/extract/price/count'] == 3
+    assert published['timing/extract/price/total_s'] == pytest.approx(0.06)
+    assert set(published) == {'timing/extract/price/count', 'timing/extract/price/total_s',
+                              'timing/extract/price/p50_s', 'timing/extract/price/p95_s',
+                              'timing/extract/price/p99_s'}
+    assert 0.02 <= published['timing/extract/price/p50_s'] <= 0.022
+    assert published['timing/extract/price/p99_s'] == 0.03
+
+
+def test_timed_process_item_should_time_the_pipelines_of_the_spider():
+    class Pipeline:
+        @timed_process_item
+        def process_item(self, item, spider):
+            return item
+
+    spider = Mock(Spider, timings=StageTimings())
+
+    assert Pipeline().process_item('item', spider) == 'item'
+    assert Pipeline().process_item('item', Spider(name='other')) == 'item'
+    assert spider.timings.stages['process_item/Pipeline'].count == 1
+
+
+def test_to_prometheus_should_export_the_timings_and_the_numeric_stats():
+    timings = StageTimings()
+    timings.observe('parse', 0.5)
+
+    metrics = to_prometheus(timings, {'item_scraped_count': 3, 'finish_reason': 'finished', 'quoted"stat': 1.5,
+                                      'timing/parse/count': 1, 'log_count/ERROR': True})
+
+    assert metrics.splitlines() == [
+        '# HELP web_scraper_stage_seconds Time spent on every stage of the crawl.',
+        '# TYPE web_scraper_stage_seconds summary',
+        'web_scraper_stage_seconds{stage="parse",quantile="0.5"} 0.5',
+        'web_scraper_stage_seconds{stage="parse",quantile="0.95"} 0.5',
+        'web_scraper_stage_seconds{stage="parse",quantile="0.99"} 0.5',
+        'web_scraper_stage_seconds_sum{stage="parse"} 0.5',
+        'web_scraper_stage_seconds_count{stage="parse"} 1',
+        '# HELP web_scraper_crawl_stat Numeric stats of the crawl.',
+        '# TYPE web_scraper_crawl_stat gauge',
+        'web_scraper_crawl_stat{name="item_scraped_count"} 3',
+        'web_scraper_crawl_stat{name="quoted\\"stat"} 1.5',
+    ]
+
+
+def test_metrics_exporter_should_not_be_configured_without_a_file_or_a_port():
+    with pytest.raises(NotConfigured):
+        StageMetricsExporter.from_crawler(Mock(settings=Settings()))
+
+
+def test_metrics_exporter_should_read_the_settings(tmp_path):
+    crawler = Mock(settings=Settings({METRICS_FILE_SETTING: str(tmp_path / 'crawl.prom'), METRICS_PORT_SETTING: 0,
+                                      METRICS_INTERVAL_SETTING: 5}))
+
+    exporter = StageMetricsExporter.from_crawler(crawler)
+
+    assert (exporter.metrics_file, exporter.metrics_port, exporter.interval) == (str(tmp_path / 'crawl.prom'), 0, 5)
+    assert crawler.signals.connect.call_count == 2
+
+
+def test_metrics_exporter_should_export_the_spider_timings_to_the_file(tmp_path):
+    metrics_file = tmp_path / 'crawl.prom'
+    stats = MemoryStatsCollector(Mock())
+    stats.set_value('item_scraped_count', 2)
+    spider = Mock(Spider, timings=StageTimings())
+    exporter = StageMetricsExporter(stats, str(metrics_file))
+    exporter.spider_opened(spider)
+    spider.timings.observe('download', 0.25)
+
+    exporter.spider_closed(spider)
+
+    assert 'web_scraper_stage_seconds_count{stage="download"} 1' in metrics_file.read_text()
+    assert 'web_scraper_crawl_stat{name="item_scraped_count"} 2' in metrics_file.read_text()
+    assert stats.get_value('timing/download/count') == 1
+    assert exporter.exports == 1
+    assert [path.name for path in tmp_path.iterdir()] == ['crawl.prom']
+
+
+def test_metrics_resource_should_serve_the_metrics():
+    stats = MemoryStatsCollector(Mock())
+    exporter = StageMetricsExporter(stats, metrics_port=0)
+    exporter.timings.observe('parse', 0.5)
+    request = DummyRequest([b'metrics'])
+
+    body = MetricsResource(exporter).render_GET(request)
+
+    assert b'web_scraper_stage_seconds_sum{stage="parse"} 0.5' in body
+    assert request.responseHeaders.getRawHeaders(b'Content-Type') == [b'text/plain; version=0.0.4; charset=utf-8']
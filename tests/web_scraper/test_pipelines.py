@@ -1,10 +1,24 @@
+import csv
+import gzip
 import json
+import lzma
+import os
+import sqlite3
 from unittest.mock import Mock, patch, mock_open
 
 import pytest
 from scrapy import Spider
+from scrapy.settings import Settings
+from scrapy.utils.misc import load_object
 
-from web_scraper.pipelines import JsonWriterPipeline
+from web_scraper.checkpoint import CrawlCheckpoint
+from web_scraper.items import DaftProperty, CSV_COLUMNS
+from web_scraper.pipelines import JsonWriterPipeline, JsonLinesWriterPipeline, OUTPUT_PATH_SETTING, \
+    FLUSH_INTERVAL_SETTING, DEFAULT_JSON_LINES_OUTPUT, DEFAULT_FLUSH_INTERVAL, CompressedJsonLinesWriterPipeline, \
+    JSON_LINES_FORMAT, JSON_LINES_GZIP_FORMAT, JSON_LINES_LZMA_FORMAT, SEGMENT_EXTENSIONS, MANIFEST_EXTENSION, \
+    OUTPUT_FORMAT_SETTING, COMPRESSION_LEVEL_SETTING, ROTATE_ITEMS_SETTING, ROTATE_BYTES_SETTING, \
+    SqliteWriterPipeline, SQLITE_INDEXED_COLUMNS, BATCH_SIZE_SETTING, CsvWriterPipeline, DEFAULT_CSV_OUTPUT, \
+    OUTPUT_PIPELINES, SQLITE_FORMAT
 
 
 @pytest.fixture()
@@ -51,3 +65,403 @@ def test_close_spider_saves_the_file(json_writer_pipeline_with_item, spider):
     open_mock.assert_called_once_with('/tmp/data.json', 'w')
     handle = open_mock()
     handle.write.assert_called_once_with(json.dumps(json_writer_pipeline_with_item.data))
+
+
+def test_json_writer_pipeline_should_save_to_the_configured_output(item, spider, tmp_path):
+    output_path = str(tmp_path / 'data.json')
+    pipeline = JsonWriterPipeline.from_crawler(_crawler({OUTPUT_PATH_SETTING: output_path}))
+    pipeline.open_spider(spider)
+    pipeline.process_item(item, spider)
+
+    pipeline.close_spider(spider)
+
+    with open(output_path) as output:
+        assert json.load(output) == [item]
+
+
+@pytest.fixture()
+def json_lines_output(tmp_path):
+    return str(tmp_path / 'data.jl')
+
+
+@pytest.fixture()
+def json_lines_pipeline(json_lines_output, spider):
+    pipeline = JsonLinesWriterPipeline(json_lines_output, flush_interval=2)
+    pipeline.open_spider(spider)
+    yield pipeline
+    pipeline.close_spider(spider)
+
+
+def test_json_lines_pipeline_should_read_the_settings(json_lines_output):
+    pipeline = JsonLinesWriterPipeline.from_crawler(_crawler({OUTPUT_PATH_SETTING: json_lines_output,
+                                                              FLUSH_INTERVAL_SETTING: 5}))
+
+    assert pipeline.output_path == json_lines_output
+    assert pipeline.flush_interval == 5
+
+
+def test_json_lines_pipeline_should_use_defaults_without_settings():
+    pipeline = JsonLinesWriterPipeline.from_crawler(_crawler({}))
+
+    assert pipeline.output_path == DEFAULT_JSON_LINES_OUTPUT
+    assert pipeline.flush_interval == DEFAULT_FLUSH_INTERVAL
+
+
+def test_json_lines_pipeline_should_write_one_item_per_line(json_lines_pipeline, json_lines_output, spider):
+    items = [{'property': index} for index in range(3)]
+    for item in items:
+        assert json_lines_pipeline.process_item(item, spider) == item
+
+    json_lines_pipeline.close_spider(spider)
+
+    assert _read_json_lines(json_lines_output) == items
+
+
+def test_json_lines_pipeline_should_flush_on_the_flush_interval(json_lines_pipeline, json_lines_output, spider):
+    json_lines_pipeline.process_item({'property': 1}, spider)
+    assert _read_json_lines(json_lines_output) == []
+
+    json_lines_pipeline.process_item({'property': 2}, spider)
+    assert _read_json_lines(json_lines_output) == [{'property': 1}, {'property': 2}]
+
+
+def test_json_lines_pipeline_should_not_keep_the_items(json_lines_pipeline, item, spider):
+    json_lines_pipeline.process_item(item, spider)
+
+    assert json_lines_pipeline.items_written == 1
+    assert not hasattr(json_lines_pipeline, 'data')
+
+
+def test_json_lines_pipeline_should_fsync_on_close(json_lines_pipeline, item, spider):
+    json_lines_pipeline.process_item(item, spider)
+
+    with patch('web_scraper.pipelines.os.fsync') as fsync_mock:
+        json_lines_pipeline.close_spider(spider)
+
+    fsync_mock.assert_called_once()
+
+
+def test_json_lines_pipeline_should_fail_when_not_opened(item, spider):
+    with pytest.raises(RuntimeError):
+        JsonLinesWriterPipeline().process_item(item, spider)
+
+
+def test_json_lines_pipeline_should_truncate_the_items_written_after_the_checkpoint(json_lines_output, tmp_path):
+    checkpoint_spider = Mock(checkpoint=CrawlCheckpoint(str(tmp_path / 'checkpoint')))
+    pipeline = JsonLinesWriterPipeline(json_lines_output)
+    pipeline.open_spider(checkpoint_spider)
+    pipeline.process_item({'property': 1}, checkpoint_spider)
+    checkpoint_spider.checkpoint.save()
+    pipeline.process_item({'property': 2}, checkpoint_spider)
+    pipeline.close_spider(checkpoint_spider)
+
+    resumed_spider = Mock(checkpoint=CrawlCheckpoint(str(tmp_path / 'checkpoint'), resume=True))
+    resumed_pipeline = JsonLinesWriterPipeline(json_lines_output)
+    resumed_pipeline.open_spider(resumed_spider)
+    resumed_pipeline.process_item({'property': 3}, resumed_spider)
+    resumed_pipeline.close_spider(resumed_spider)
+
+    assert _read_json_lines(json_lines_output) == [{'property': 1}, {'property': 3}]
+    assert resumed_pipeline.items_written == 2
+
+
+@pytest.fixture()
+def compressed_output(tmp_path):
+    return str(tmp_path / 'data')
+
+
+@pytest.mark.parametrize('output_format, open_segment', [
+    (JSON_LINES_GZIP_FORMAT, gzip.open),
+    (JSON_LINES_LZMA_FORMAT, lzma.open),
+])
+def test_compressed_pipeline_should_rotate_the_segments_by_items(compressed_output, spider, output_format,
+                                                                  open_segment):
+    items = [{'property': index} for index in range(5)]
+    pipeline = CompressedJsonLinesWriterPipeline(compressed_output, output_format, rotate_items=2)
+    pipeline.open_spider(spider)
+    for item in items:
+        assert pipeline.process_item(item, spider) == item
+    pipeline.close_spider(spider)
+
+    manifest = _read_manifest(compressed_output)
+    assert manifest['format'] == output_format
+    assert manifest['items'] == 5
+    assert [segment['items'] for segment in manifest['segments']] == [2, 2, 1]
+    assert manifest['segments'][0]['path'] == 'data-00000' + SEGMENT_EXTENSIONS[output_format]
+
+    segment_items = []
+    for segment in manifest['segments']:
+        with open_segment(os.path.join(os.path.dirname(compressed_output), segment['path']), 'rt') as segment_file:
+            segment_items.extend(json.loads(line) for line in segment_file)
+    assert segment_items == items
+
+
+def test_compressed_pipeline_should_rotate_the_segments_by_size(compressed_output, spider):
+    pipeline = CompressedJsonLinesWriterPipeline(compressed_output, rotate_bytes=1)
+    pipeline.open_spider(spider)
+    for index in range(3):
+        pipeline.process_item({'property': index}, spider)
+
+    manifest = _read_manifest(compressed_output)
+    pipeline.close_spider(spider)
+
+    assert [segment['items'] for segment in manifest['segments']] == [1, 1, 1]
+    assert all(segment['bytes'] > 0 for segment in manifest['segments'])
+
+
+def test_compressed_pipeline_should_write_an_empty_manifest_without_items(compressed_output, spider):
+    pipeline = CompressedJsonLinesWriterPipeline(compressed_output)
+    pipeline.open_spider(spider)
+    pipeline.close_spider(spider)
+
+    assert _read_manifest(compressed_output) == {'format': JSON_LINES_GZIP_FORMAT, 'items': 0, 'segments': []}
+
+
+def test_compressed_pipeline_should_read_the_settings(compressed_output):
+    pipeline = CompressedJsonLinesWriterPipeline.from_crawler(_crawler({
+        OUTPUT_PATH_SETTING: compressed_output,
+        OUTPUT_FORMAT_SETTING: JSON_LINES_LZMA_FORMAT,
+        COMPRESSION_LEVEL_SETTING: 1,
+        ROTATE_ITEMS_SETTING: 10,
+        ROTATE_BYTES_SETTING: 20,
+    }))
+
+    assert pipeline.output_path == compressed_output
+    assert pipeline.output_format == JSON_LINES_LZMA_FORMAT
+    assert (pipeline.compression_level, pipeline.rotate_items, pipeline.rotate_bytes) == (1, 10, 20)
+
+
+def test_compressed_pipeline_should_reject_uncompressed_formats(compressed_output):
+    with pytest.raises(ValueError):
+        CompressedJsonLinesWriterPipeline(compressed_output, JSON_LINES_FORMAT)
+
+
+def test_compressed_pipeline_should_drop_the_segments_written_after_the_checkpoint(compressed_output, tmp_path):
+    checkpoint_spider = Mock(checkpoint=CrawlCheckpoint(str(tmp_path / 'checkpoint')))
+    pipeline = CompressedJsonLinesWriterPipeline(compressed_output)
+    pipeline.open_spider(checkpoint_spider)
+    pipeline.process_item({'property': 1}, checkpoint_spider)
+    checkpoint_spider.checkpoint.save()
+    pipeline.process_item({'property': 2}, checkpoint_spider)
+    pipeline.process_item({'property': 3}, checkpoint_spider)
+    pipeline.close_spider(checkpoint_spider)
+
+    resumed_spider = Mock(checkpoint=CrawlCheckpoint(str(tmp_path / 'checkpoint'), resume=True))
+    resumed_pipeline = CompressedJsonLinesWriterPipeline(compressed_output)
+    resumed_pipeline.open_spider(resumed_spider)
+    assert sorted(os.listdir(tmp_path)) == ['checkpoint', 'data-00000.jl.gz', 'data.manifest.json']
+    resumed_pipeline.process_item({'property': 4}, resumed_spider)
+    resumed_pipeline.close_spider(resumed_spider)
+
+    manifest = _read_manifest(compressed_output)
+    assert manifest['items'] == 2
+    with gzip.open(os.path.join(tmp_path, manifest['segments'][1]['path']), 'rt') as segment_file:
+        assert [json.loads(line) for line in segment_file] == [{'property': 4}]
+
+
+def test_compressed_pipeline_should_remove_the_segments_of_an_earlier_crawl(compressed_output, spider, tmp_path):
+    pipeline = CompressedJsonLinesWriterPipeline(compressed_output, rotate_items=1)
+    pipeline.open_spider(spider)
+    for index in range(3):
+        pipeline.process_item({'property': index}, spider)
+    pipeline.close_spider(spider)
+    reextract_pipeline = CompressedJsonLinesWriterPipeline(compressed_output + '-reextract', JSON_LINES_LZMA_FORMAT)
+    reextract_pipeline.open_spider(spider)
+    reextract_pipeline.process_item({'property': 0}, spider)
+    reextract_pipeline.close_spider(spider)
+
+    fresh_pipeline = CompressedJsonLinesWriterPipeline(compressed_output, JSON_LINES_LZMA_FORMAT)
+    fresh_pipeline.open_spider(spider)
+    assert _read_manifest(compressed_output) == {'format': JSON_LINES_LZMA_FORMAT, 'items': 0, 'segments': []}
+    fresh_pipeline.process_item({'property': 3}, spider)
+    fresh_pipeline.close_spider(spider)
+
+    assert sorted(os.listdir(tmp_path)) == ['data-00000.jl.xz', 'data-reextract-00000.jl.xz',
+                                            'data-reextract.manifest.json', 'data.manifest.json']
+    assert _read_manifest(compressed_output)['items'] == 1
+
+
+@pytest.fixture()
+def sqlite_output(tmp_path):
+    return str(tmp_path / 'data.sqlite')
+
+
+@pytest.fixture()
+def property_item():
+    return {'link': 'https://www.daft.ie/1', 'price': 375000, 'bedrooms': 3, 'floor_area_m2': 54.5,
+            'region': 'Ranelagh', 'dart_station': 'Sandymount', 'dart_distance_m': 342, 'schools_distance_m': 10}
+
+
+def test_sqlite_pipeline_should_insert_the_items_in_batches(sqlite_output, spider, property_item):
+    pipeline = SqliteWriterPipeline(sqlite_output, batch_size=2)
+    pipeline.open_spider(spider)
+
+    assert pipeline.process_item(property_item, spider) == property_item
+    assert _read_sqlite(sqlite_output, 'SELECT COUNT(*) FROM properties') == [(0,)]
+
+    pipeline.process_item(dict(property_item, link='https://www.daft.ie/2'), spider)
+    assert _read_sqlite(sqlite_output, 'SELECT COUNT(*) FROM properties') == [(2,)]
+
+    pipeline.process_item(dict(property_item, link='https://www.daft.ie/3'), spider)
+    pipeline.close_spider(spider)
+    assert _read_sqlite(sqlite_output, 'SELECT COUNT(*) FROM properties') == [(3,)]
+
+
+def test_sqlite_pipeline_should_upsert_on_the_link(sqlite_output, spider, property_item):
+    pipeline = SqliteWriterPipeline(sqlite_output)
+    pipeline.open_spider(spider)
+    pipeline.process_item(property_item, spider)
+    pipeline.close_spider(spider)
+
+    pipeline.open_spider(spider)
+    pipeline.process_item(dict(property_item, price=350000), spider)
+    pipeline.close_spider(spider)
+
+    assert _read_sqlite(sqlite_output, 'SELECT link, price, bedrooms, floor_area_m2, region, dart_station,'
+                                       ' dart_distance_m, extra FROM properties') == \
+        [('https://www.daft.ie/1', 350000, 3, 54.5, 'Ranelagh', 'Sandymount', 342, '{"schools_distance_m": 10}')]
+
+
+def test_sqlite_pipeline_should_keep_the_values_missing_from_partial_items(sqlite_output, spider, property_item):
+    pipeline = SqliteWriterPipeline(sqlite_output)
+    pipeline.open_spider(spider)
+    pipeline.process_item(dict(property_item, description='Detailed description'), spider)
+    pipeline.process_item({'link': property_item['link'], 'price': 360000, 'description': None}, spider)
+    pipeline.close_spider(spider)
+
+    assert _read_sqlite(sqlite_output, 'SELECT price, description FROM properties') == \
+        [(360000, 'Detailed description')]
+
+
+def test_sqlite_pipeline_should_create_the_indexes_and_use_wal(sqlite_output, spider):
+    pipeline = SqliteWriterPipeline(sqlite_output)
+    pipeline.open_spider(spider)
+    pipeline.close_spider(spider)
+
+    indexes = {row[0] for row in _read_sqlite(sqlite_output, "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {f'properties_{column}_idx' for column in SQLITE_INDEXED_COLUMNS} <= indexes
+    assert _read_sqlite(sqlite_output, 'PRAGMA journal_mode') == [('wal',)]
+
+
+def test_sqlite_pipeline_should_add_missing_columns_to_old_databases(sqlite_output, spider, property_item):
+    connection = sqlite3.connect(sqlite_output)
+    connection.execute('CREATE TABLE properties (link TEXT PRIMARY KEY, price INTEGER)')
+    connection.close()
+
+    pipeline = SqliteWriterPipeline(sqlite_output)
+    pipeline.open_spider(spider)
+    pipeline.process_item(property_item, spider)
+    pipeline.close_spider(spider)
+
+    assert _read_sqlite(sqlite_output, 'SELECT price, dart_distance_m FROM properties') == [(375000, 342)]
+
+
+def test_sqlite_pipeline_should_read_the_settings(sqlite_output):
+    pipeline = SqliteWriterPipeline.from_crawler(_crawler({OUTPUT_PATH_SETTING: sqlite_output,
+                                                           BATCH_SIZE_SETTING: 7}))
+
+    assert (pipeline.output_path, pipeline.batch_size) == (sqlite_output, 7)
+
+
+@pytest.fixture()
+def csv_output(tmp_path):
+    return str(tmp_path / 'data.csv')
+
+
+def test_csv_pipeline_should_write_a_header_and_one_row_per_item(csv_output, spider, property_item):
+    pipeline = CsvWriterPipeline(csv_output)
+    pipeline.open_spider(spider)
+
+    assert pipeline.process_item(property_item, spider) == property_item
+    pipeline.process_item(DaftProperty(**dict(property_item, link='https://www.daft.ie/2')), spider)
+    pipeline.close_spider(spider)
+
+    with open(csv_output, newline='') as output:
+        rows = list(csv.DictReader(output))
+    assert list(rows[0]) == list(CSV_COLUMNS)
+    assert [(row['link'], row['price'], row['floor_area_m2'], row['ber_rating'], row['extra']) for row in rows] == [
+        ('https://www.daft.ie/1', '375000', '54.5', '', '{"schools_distance_m": 10}'),
+        ('https://www.daft.ie/2', '375000', '54.5', '', '{"schools_distance_m": 10}'),
+    ]
+
+
+def test_csv_pipeline_should_truncate_the_rows_written_after_the_checkpoint(csv_output, tmp_path):
+    spider = Mock(Spider)
+    spider.checkpoint = CrawlCheckpoint(str(tmp_path / 'checkpoint'))
+    pipeline = CsvWriterPipeline(csv_output)
+    pipeline.open_spider(spider)
+    pipeline.process_item({'link': 'https://www.daft.ie/1'}, spider)
+    spider.checkpoint.save()
+    pipeline.process_item({'link': 'https://www.daft.ie/2'}, spider)
+    pipeline.close_spider(spider)
+
+    resumed_spider = Mock(Spider)
+    resumed_spider.checkpoint = CrawlCheckpoint(str(tmp_path / 'checkpoint'), resume=True)
+    resumed_pipeline = CsvWriterPipeline(csv_output)
+    resumed_pipeline.open_spider(resumed_spider)
+    resumed_pipeline.process_item({'link': 'https://www.daft.ie/3'}, resumed_spider)
+    resumed_pipeline.close_spider(resumed_spider)
+
+    with open(csv_output, newline='') as output:
+        assert [row['link'] for row in csv.DictReader(output)] == ['https://www.daft.ie/1', 'https://www.daft.ie/3']
+    assert resumed_pipeline.items_written == 2
+
+
+def test_csv_pipeline_should_read_the_settings(csv_output):
+    pipeline = CsvWriterPipeline.from_crawler(_crawler({OUTPUT_PATH_SETTING: csv_output, FLUSH_INTERVAL_SETTING: 5}))
+    default_pipeline = CsvWriterPipeline.from_crawler(_crawler({}))
+
+    assert (pipeline.output_path, pipeline.flush_interval) == (csv_output, 5)
+    assert default_pipeline.output_path == DEFAULT_CSV_OUTPUT
+
+
+@pytest.mark.parametrize('output_format', list(OUTPUT_PIPELINES))
+def test_every_pipeline_should_write_daft_properties_like_dicts(output_format, spider, property_item, tmp_path):
+    pipeline_path, _ = OUTPUT_PIPELINES[output_format]
+    outputs = {}
+    for name, item in [('dict', property_item), ('property', DaftProperty(**property_item))]:
+        output_path = str(tmp_path / f'{name}.{output_format}')
+        pipeline = load_object(pipeline_path).from_crawler(
+            _crawler({OUTPUT_PATH_SETTING: output_path, OUTPUT_FORMAT_SETTING: output_format}))
+        pipeline.open_spider(spider)
+        pipeline.process_item(dict(DaftProperty(**property_item)) if name == 'dict' else item, spider)
+        pipeline.close_spider(spider)
+        outputs[name] = _read_output(output_path, output_format)
+
+    assert outputs['property'] == outputs['dict']
+
+
+def _read_output(output_path, output_format):
+    if output_format == SQLITE_FORMAT:
+        return _read_sqlite(output_path, 'SELECT * FROM properties')
+    if output_format in SEGMENT_EXTENSIONS:
+        segment_path = f'{output_path}-00000{SEGMENT_EXTENSIONS[output_format]}'
+        opener = gzip.open if output_format == JSON_LINES_GZIP_FORMAT else lzma.open
+        with opener(segment_path, 'rb') as segment_file:
+            return segment_file.read()
+    with open(output_path, 'rb') as output:
+        return output.read()
+
+
+def _read_sqlite(path, query):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(query).fetchall()
+    finally:
+        connection.close()
+
+
+def _read_manifest(output_path):
+    with open(output_path + MANIFEST_EXTENSION) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _crawler(settings):
+    crawler = Mock()
+    crawler.settings = Settings(settings)
+    return crawler
+
+
+def _read_json_lines(path):
+    with open(path) as output:
+        return [json.loads(line) for line in output]
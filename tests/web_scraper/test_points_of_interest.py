@@ -0,0 +1,103 @@
+import json
+
+import numpy as np
+import pytest
+from geopy import distance
+
+from web_scraper.points_of_interest import PointOfInterest, PointOfInterestLayer, KdTree, parse_coords, \
+    to_unit_vectors
+
+COORDS = (53.3382, -6.2591)
+
+
+@pytest.fixture()
+def random_points():
+    generator = np.random.default_rng(42)
+    coords = np.column_stack((generator.uniform(53.2, 53.5, 2000), generator.uniform(-6.5, -6.0, 2000)))
+    return [PointOfInterest(f'point {index}', (lat, lon)) for index, (lat, lon) in enumerate(coords)]
+
+
+@pytest.fixture()
+def layer(random_points):
+    return PointOfInterestLayer('points', random_points)
+
+
+def _brute_force_distances(points, coords):
+    return sorted((int(distance.great_circle(coords, point.coords).m), point.name) for point in points)
+
+
+@pytest.mark.parametrize('coords, expected', [
+    (None, None),
+    ('', None),
+    ('53.3', None),
+    ('53.3, -6.2', (53.3, -6.2)),
+])
+def test_parse_coords(coords, expected):
+    assert parse_coords(coords) == expected
+
+
+def test_nearest_should_return_the_k_closest_points(layer, random_points):
+    expected = _brute_force_distances(random_points, COORDS)[:5]
+
+    result = layer.nearest(COORDS, k=5)
+
+    assert [point.name for point, _ in result] == [name for _, name in expected]
+    for (_, result_distance), (expected_distance, _) in zip(result, expected):
+        assert abs(result_distance - expected_distance) <= 1
+
+
+def test_within_radius_should_return_all_points_inside_the_radius(layer, random_points):
+    expected = [name for point_distance, name in _brute_force_distances(random_points, COORDS)
+                if point_distance < 1500]
+
+    result = layer.within_radius(COORDS, 1500)
+
+    assert [point.name for point, _ in result] == expected
+    assert all(point_distance <= 1500 for _, point_distance in result)
+
+
+def test_empty_layer_should_not_find_anything():
+    layer = PointOfInterestLayer('empty', [])
+
+    assert layer.nearest(COORDS) == []
+    assert layer.within_radius(COORDS, 1000) == []
+
+
+def test_kd_tree_should_work_with_points_smaller_than_a_leaf():
+    points = to_unit_vectors(np.array([[53.0, -6.0], [54.0, -7.0]]))
+
+    result = KdTree(points).nearest(to_unit_vectors(np.array([53.9, -6.9]))[0], k=3)
+
+    assert [index for _, index in result] == [1, 0]
+
+
+def test_load_should_read_csv_files(tmp_path):
+    csv_path = tmp_path / 'schools.csv'
+    csv_path.write_text('Name,Lat,Lon\nSchool 1,53.33,-6.25\nSchool 2,53.40,-6.10\n')
+
+    layer = PointOfInterestLayer.load('schools', str(csv_path))
+
+    assert layer.name == 'schools'
+    assert layer.points == [PointOfInterest('School 1', (53.33, -6.25)), PointOfInterest('School 2', (53.40, -6.10))]
+
+
+def test_load_should_fail_for_csv_files_without_coordinates(tmp_path):
+    csv_path = tmp_path / 'schools.csv'
+    csv_path.write_text('name,address\nSchool 1,Somewhere\n')
+
+    with pytest.raises(ValueError, match='latitude'):
+        PointOfInterestLayer.load('schools', str(csv_path))
+
+
+def test_load_should_read_geojson_point_features(tmp_path):
+    geojson_path = tmp_path / 'parks.geojson'
+    geojson_path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': 'Park 1'},
+         'geometry': {'type': 'Point', 'coordinates': [-6.25, 53.33]}},
+        {'type': 'Feature', 'properties': {'name': 'Area'},
+         'geometry': {'type': 'Polygon', 'coordinates': []}},
+    ]}))
+
+    layer = PointOfInterestLayer.load('parks', str(geojson_path))
+
+    assert layer.points == [PointOfInterest('Park 1', (53.33, -6.25))]
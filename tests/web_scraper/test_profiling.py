@@ -0,0 +1,49 @@
+import pstats
+import time
+
+import pytest
+
+from web_scraper.profiling import CpuProfiler, MemoryProfiler, create_profiler, PROFILE_CPU, PROFILE_MEMORY
+
+
+def busy_function():
+    return sum(index * index for index in range(20000))
+
+
+def test_cpu_profiler_should_save_the_profile_and_its_summary(tmp_path, capsys):
+    output = str(tmp_path / 'crawl.pstats')
+
+    with CpuProfiler(output, top=2):
+        busy_function()
+
+    assert any(function == 'busy_function' for _, _, function in pstats.Stats(output).stats)
+    with open(output + '.txt') as summary:
+        summary_text = summary.read()
+    assert 'busy_function' in summary_text
+    assert 'List reduced' in summary_text
+    assert f"Saved the cpu profile on '{output}'" in capsys.readouterr().out
+
+
+def test_memory_profiler_should_report_the_allocation_sites_growing_fastest(tmp_path):
+    output = tmp_path / 'memory.txt'
+    retained = []
+
+    with MemoryProfiler(str(output), top=3, interval=0.05) as profiler:
+        for _ in range(10):
+            retained.append(bytearray(256 * 1024))
+            time.sleep(0.01)
+
+    report = output.read_text()
+    assert profiler.snapshots >= 2
+    assert 'Peak traced memory' in report
+    whole_run = report[report.index('Whole run'):].splitlines()
+    assert len(whole_run) <= 4
+    assert 'test_profiling.py' in whole_run[1] and 'KiB/s' in whole_run[1]
+
+
+def test_create_profiler_should_create_every_profile(tmp_path):
+    assert isinstance(create_profiler(PROFILE_CPU), CpuProfiler)
+    assert create_profiler(PROFILE_CPU).output == '/tmp/web-scraper.pstats'
+    assert create_profiler(PROFILE_MEMORY, str(tmp_path / 'memory.txt'), 5, 1.0).interval == 1.0
+    with pytest.raises(ValueError):
+        create_profiler('io')
@@ -1,4 +1,10 @@
-from web_scraper.public_transport import PublicTransport, GREEN_LUAS_STATIONS, RED_LUAS_STATIONS, DART_STATIONS
+import numpy as np
+import pytest
+
+from web_scraper.public_transport import PublicTransport, GREEN_LUAS_STATIONS, RED_LUAS_STATIONS, DART_STATIONS, \
+    GREEN_LUAS_INDEX, RED_LUAS_INDEX, DART_INDEX, BATCH_CHUNK_SIZE, GREEN_LUAS, RED_LUAS, DART, STATION_INDEXES, \
+    NearestStationGrid, StationIndex, PublicTransportCache
+from web_scraper.points_of_interest import parse_coords
 
 
 def test_get_closest_green_luas_should_return_the_closest_station():
@@ -53,3 +59,238 @@ def test_get_closest_dart_should_return_a_default_for_invalid_coords():
 
     assert result[0] == DART_STATIONS[0]
     assert result[1] == -1
+
+
+@pytest.mark.parametrize('station_index', [GREEN_LUAS_INDEX, RED_LUAS_INDEX, DART_INDEX])
+def test_closest_stations_should_match_the_single_coordinate_lookup(station_index):
+    coords = np.array([[53.244746, -6.144861], [53.284235, -6.428219], [53.2355839, -6.11813], [53.349, -6.26]])
+
+    indices, distances = station_index.closest_stations(coords)
+
+    for row, row_coords in enumerate(coords):
+        station, station_distance = station_index.closest_station((row_coords[0], row_coords[1]))
+        assert station_index.stations[indices[row]] == station
+        assert int(distances[row]) == station_distance
+
+
+def test_closest_stations_should_return_a_default_for_invalid_coords():
+    coords = np.array([[np.nan, np.nan], [53.244746, -6.144861]])
+
+    indices, distances = GREEN_LUAS_INDEX.closest_stations(coords)
+
+    assert list(indices) == [0, 1]
+    assert distances[0] == -1
+    assert int(distances[1]) == 40
+
+
+def test_closest_stations_without_refine_should_be_close_to_the_geodesic_distance():
+    coords = np.array([[53.2355839, -6.11813], [53.40, -6.30], [53.30, -6.45]])
+
+    refined_indices, refined_distances = DART_INDEX.closest_stations(coords)
+    indices, distances = DART_INDEX.closest_stations(coords, refine=False)
+
+    assert list(indices) == list(refined_indices)
+    assert np.allclose(distances, refined_distances, rtol=0.005)
+
+
+def test_closest_stations_should_process_batches_bigger_than_a_chunk():
+    coords = np.tile([53.244746, -6.144861], (BATCH_CHUNK_SIZE + 10, 1))
+
+    indices, distances = GREEN_LUAS_INDEX.closest_stations(coords, refine=False)
+
+    assert len(indices) == BATCH_CHUNK_SIZE + 10
+    assert (indices == 1).all()
+    assert np.allclose(distances, distances[0])
+
+
+def test_get_closest_stations_should_return_the_closest_station_of_every_line():
+    coords = "53.2355839, -6.11813"
+
+    result = PublicTransport.get_closest_stations(coords)
+
+    assert set(result) == {GREEN_LUAS, RED_LUAS, DART}
+    assert result[GREEN_LUAS] == PublicTransport.get_closest_green_luas(coords)
+    assert result[RED_LUAS] == PublicTransport.get_closest_red_luas(coords)
+    assert result[DART] == (DART_STATIONS[1], 342)
+
+
+@pytest.mark.parametrize('coords', [None, '', '53.2355839'])
+def test_get_closest_stations_should_return_defaults_for_invalid_coords(coords):
+    result = PublicTransport.get_closest_stations(coords)
+
+    assert result[GREEN_LUAS] == (GREEN_LUAS_STATIONS[0], -1)
+    assert result[RED_LUAS] == (RED_LUAS_STATIONS[0], -1)
+    assert result[DART] == (DART_STATIONS[0], -1)
+
+
+def test_get_layer_should_index_the_stations_of_the_line():
+    layer = PublicTransport.get_layer(DART)
+
+    station, station_distance = layer.nearest((53.2355839, -6.11813))[0]
+
+    assert station == DART_STATIONS[1]
+    assert abs(station_distance - 342) < 3
+
+
+GRID_BOUNDING_BOX = (53.33, -6.27, 53.35, -6.24)
+
+
+@pytest.fixture(scope='module')
+def grid():
+    return NearestStationGrid.build(GRID_BOUNDING_BOX, 0.002)
+
+
+@pytest.fixture()
+def grid_in_use(grid):
+    PublicTransport.use_grid(grid)
+    yield grid
+    PublicTransport.use_grid(None)
+
+
+def test_grid_lookup_should_be_inside_the_max_error(grid):
+    for lat in np.linspace(53.3301, 53.3499, 7):
+        for lon in np.linspace(-6.2699, -6.2401, 7):
+            expected = PublicTransport.get_closest_stations(f'{lat},{lon}')
+            result = grid.lookup((lat, lon))
+            for line in expected:
+                assert abs(result[line][1] - expected[line][1]) <= grid.max_error_m
+
+
+def test_grid_lookup_should_be_inside_the_max_error_for_random_points(grid):
+    random = np.random.default_rng(0)
+    points = np.column_stack([random.uniform(grid.lat_min, grid.lat_max, 2000),
+                              random.uniform(grid.lon_min, grid.lon_max, 2000)])
+    points = points[(points[:, 0] < grid.lat_max) & (points[:, 1] < grid.lon_max)]
+
+    for line, station_index in STATION_INDEXES.items():
+        _, distances = station_index.closest_stations(points)
+        for point, distance in zip(points, distances):
+            assert abs(grid.lookup(tuple(point))[line][1] - int(distance)) <= grid.max_error_m
+
+
+def test_grid_lookup_should_return_none_outside_of_the_grid(grid):
+    assert grid.lookup((53.2355839, -6.11813)) is None
+
+
+def test_grid_should_be_loaded_from_the_saved_file(grid, tmp_path):
+    grid_path = str(tmp_path / 'grid.bin')
+    grid.save(grid_path)
+
+    loaded_grid = NearestStationGrid.load(grid_path)
+
+    assert (loaded_grid.rows, loaded_grid.cols, loaded_grid.step) == (grid.rows, grid.cols, grid.step)
+    assert loaded_grid.lookup((53.3402, -6.2513)) == grid.lookup((53.3402, -6.2513))
+
+
+def test_grid_load_should_fail_for_other_files(tmp_path):
+    grid_path = tmp_path / 'grid.bin'
+    grid_path.write_bytes(b'not a grid')
+
+    with pytest.raises(ValueError):
+        NearestStationGrid.load(str(grid_path))
+
+
+def test_grid_load_should_fail_when_the_stations_changed(grid, tmp_path, monkeypatch):
+    grid_path = str(tmp_path / 'grid.bin')
+    grid.save(grid_path)
+    monkeypatch.setitem(STATION_INDEXES, DART, StationIndex(DART_STATIONS[1:]))
+
+    with pytest.raises(ValueError, match='rebuild'):
+        NearestStationGrid.load(grid_path)
+
+
+def test_get_closest_stations_should_use_the_grid(grid_in_use):
+    coords = (53.3402, -6.2513)
+
+    assert PublicTransport.get_closest_stations(f'{coords[0]},{coords[1]}') == grid_in_use.lookup(coords)
+
+
+def test_get_closest_stations_should_fall_back_outside_of_the_grid(grid_in_use):
+    coords = "53.2355839, -6.11813"
+
+    assert PublicTransport.get_closest_stations(coords)[DART] == (DART_STATIONS[1], 342)
+
+
+BATCH_COORDS = ["53.2355839, -6.11813", None, "53.3402, -6.2513", "invalid", "53.30, -6.20", "53.3402, -6.2513"]
+
+
+def test_get_closest_stations_batch_should_match_the_single_lookups():
+    parsed_coords = [parse_coords(coords) for coords in BATCH_COORDS]
+
+    assert PublicTransport.get_closest_stations_batch(parsed_coords) == \
+        [PublicTransport.get_closest_stations(coords) for coords in BATCH_COORDS]
+
+
+def test_get_closest_stations_batch_should_use_the_grid(grid_in_use):
+    parsed_coords = [parse_coords(coords) for coords in BATCH_COORDS]
+
+    results = PublicTransport.get_closest_stations_batch(parsed_coords)
+
+    assert results == [PublicTransport.get_closest_stations(coords) for coords in BATCH_COORDS]
+    assert results[2] == grid_in_use.lookup(parsed_coords[2])
+
+
+def test_cache_batch_should_reuse_the_closest_stations_of_close_coords():
+    cache = PublicTransportCache()
+    cache.get_closest_stations("53.2355841, -6.1181302")
+
+    results = cache.get_closest_stations_batch(BATCH_COORDS)
+
+    single_cache = PublicTransportCache()
+    assert results == [single_cache.get_closest_stations(coords) for coords in BATCH_COORDS]
+    assert (cache.hits, cache.misses, len(cache)) == (1, 4, 3)
+
+
+def test_cache_should_reuse_the_closest_stations_of_close_coords():
+    cache = PublicTransportCache()
+
+    first_result = cache.get_closest_stations("53.2355839, -6.11813")
+    second_result = cache.get_closest_stations("53.2355841, -6.1181302")
+
+    assert first_result is second_result
+    assert first_result[DART] == (DART_STATIONS[1], 342)
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+
+
+def test_cache_should_not_count_invalid_coords():
+    cache = PublicTransportCache()
+
+    result = cache.get_closest_stations(None)
+
+    assert result[DART] == (DART_STATIONS[0], -1)
+    assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+
+def test_cache_should_evict_the_least_recently_used_coords():
+    cache = PublicTransportCache(max_size=2)
+
+    cache.get_closest_stations("53.30, -6.20")
+    cache.get_closest_stations("53.31, -6.20")
+    cache.get_closest_stations("53.30, -6.20")
+    cache.get_closest_stations("53.32, -6.20")
+    cache.get_closest_stations("53.30, -6.20")
+    cache.get_closest_stations("53.31, -6.20")
+
+    assert (cache.hits, cache.misses, len(cache)) == (2, 4, 2)
+
+
+def test_cache_should_be_persisted(tmp_path):
+    cache_path = str(tmp_path / 'cache.json')
+    cache = PublicTransportCache(path=cache_path)
+    expected = cache.get_closest_stations("53.2355839, -6.11813")
+    cache.save()
+
+    loaded_cache = PublicTransportCache(path=cache_path)
+
+    assert loaded_cache.get_closest_stations("53.2355839, -6.11813") == expected
+    assert (loaded_cache.hits, loaded_cache.misses) == (1, 0)
+
+
+def test_cache_should_ignore_persisted_entries_of_unknown_stations(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / 'cache.json')
+    cache = PublicTransportCache(path=cache_path)
+    cache.get_closest_stations("53.2355839, -6.11813")
+    cache.save()
+    monkeypatch.setitem(STATION_INDEXES, DART, StationIndex(DART_STATIONS[2:]))
+
+    assert len(PublicTransportCache(path=cache_path)) == 0
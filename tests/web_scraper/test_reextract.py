@@ -0,0 +1,70 @@
+import json
+import os
+from unittest.mock import Mock
+
+from scrapy.settings import Settings
+
+from web_scraper.html_archive import HtmlArchiveWriter, HtmlArchiveReader
+from web_scraper.pipelines import OUTPUT_PATH_SETTING, OUTPUT_FORMAT_SETTING, JSON_LINES_FORMAT
+from web_scraper import spiders
+from web_scraper.reextract import Reextraction, reextract_chunk
+from web_scraper.spiders import init_pool_spider
+
+DETAIL_URL = 'https://www.daft.ie/for-sale/house-1'
+with open(os.path.join(os.path.dirname(__file__), 'pages', 'detail.html')) as detail_file:
+    DETAIL_HTML = detail_file.read()
+BROKEN_HTML = '<html><body><div data-testid="price"><p><span>Not a price</span></p></div></body></html>'
+
+
+def _archive(archive_dir, pages):
+    writer = HtmlArchiveWriter(archive_dir)
+    for url, html, status in pages:
+        writer.add(url, html.encode(), status)
+    writer.close()
+
+
+def test_reextract_chunk_should_extract_the_archived_pages(tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    _archive(archive_dir, [(DETAIL_URL, DETAIL_HTML, 200), (DETAIL_URL + '-broken', BROKEN_HTML, 200)])
+    init_pool_spider({'transport_cache_size': 0})
+    try:
+        items, errors = reextract_chunk(archive_dir, list(HtmlArchiveReader(archive_dir).entries()))
+    finally:
+        spiders._pool_spider = None
+
+    assert errors == 1
+    assert len(items) == 1
+    assert items[0]['link'] == DETAIL_URL
+    assert (items[0]['price'], items[0]['bedrooms'], items[0]['region']) == (375000, 3, 'Dun Laoghaire')
+    assert items[0]['geolocation'] == '53.29,-6.13'
+    assert items[0]['dart_station']
+
+
+def test_reextraction_should_write_the_items_to_the_output(tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    output = str(tmp_path / 'data.jl')
+    _archive(archive_dir, [(DETAIL_URL, DETAIL_HTML, 200), (DETAIL_URL + '-missing', '', 404)])
+    crawler = Mock(settings=Settings({OUTPUT_PATH_SETTING: output, OUTPUT_FORMAT_SETTING: JSON_LINES_FORMAT}))
+
+    reextraction = Reextraction(crawler, archive_dir, {'transport_cache_size': 0}, workers=1)
+    reextraction.run()
+
+    with open(output) as output_file:
+        assert [json.loads(line)['link'] for line in output_file] == [DETAIL_URL]
+    assert (reextraction.pages, reextraction.items_written, reextraction.errors) == (1, 1, 0)
+
+
+def test_reextraction_should_only_extract_the_newest_page_of_every_property(tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    output = str(tmp_path / 'data.jl')
+    _archive(archive_dir, [(DETAIL_URL, DETAIL_HTML.replace('€375,000', '€390,000'), 200),
+                           (DETAIL_URL + '-sold', DETAIL_HTML, 200)])
+    _archive(archive_dir, [(DETAIL_URL, DETAIL_HTML, 200), (DETAIL_URL + '-sold', '', 404)])
+    crawler = Mock(settings=Settings({OUTPUT_PATH_SETTING: output, OUTPUT_FORMAT_SETTING: JSON_LINES_FORMAT}))
+
+    reextraction = Reextraction(crawler, archive_dir, {'transport_cache_size': 0}, workers=1)
+    reextraction.run()
+
+    with open(output) as output_file:
+        assert [(item['link'], item['price']) for item in map(json.loads, output_file)] == [(DETAIL_URL, 375000)]
+    assert reextraction.pages == 1
@@ -3,8 +3,17 @@ from unittest.mock import Mock
 
 import pytest
 
-from web_scraper.runner import USER_AGENT_SETTING
-from web_scraper.spiders import DaftSaleUsedSpider
+from web_scraper.public_transport import DUBLIN_BOUNDING_BOX, DEFAULT_CACHE_SIZE
+from web_scraper.pipelines import OUTPUT_PATH_SETTING, FLUSH_INTERVAL_SETTING, DEFAULT_JSON_LINES_OUTPUT, \
+    DEFAULT_COMPRESSED_OUTPUT, OUTPUT_FORMAT_SETTING, COMPRESSION_LEVEL_SETTING, ROTATE_ITEMS_SETTING, \
+    ROTATE_BYTES_SETTING, DEFAULT_SQLITE_OUTPUT, BATCH_SIZE_SETTING
+from web_scraper.http_cache import LISTING_TTL_SETTING, DETAIL_TTL_SETTING, DEFAULT_DETAIL_TTL_S
+from web_scraper.checkpoint import DEFAULT_CHECKPOINT_INTERVAL_S
+from web_scraper.metrics import METRICS_EXTENSION, METRICS_EXTENSION_ORDER, METRICS_FILE_SETTING, \
+    METRICS_PORT_SETTING, METRICS_INTERVAL_SETTING
+from web_scraper.seen_listings import DEFAULT_TTL_HOURS
+from web_scraper.runner import USER_AGENT_SETTING, ITEM_PIPELINES_SETTING
+from web_scraper.spiders import DaftSaleUsedSpider, DAFT_ADDRESS
 from web_scraper import Runner, WebSources
 AREAS_TO_LOOK = f"area1"
 MIN_PRICE = 1000
@@ -57,9 +66,282 @@ def test_runner_should_parse_daft_with_correct_areas(runner):
                                                   min_price=MIN_PRICE,
                                                   max_price=MAX_PRICE,
                                                   min_beds=MIN_BEDS,
-                                                  max_beds=MAX_BEDS
+                                                  max_beds=MAX_BEDS,
+                                                  poi_layers=None,
+                                                  transport_grid=None,
+                                                  transport_cache_size=DEFAULT_CACHE_SIZE,
+                                                  transport_cache_file=None,
+                                                  seen_listings=None,
+                                                  seen_ttl_hours=DEFAULT_TTL_HOURS,
+                                                  force_refresh=False,
+                                                  cards_only=False,
+                                                  detail_on_change=False,
+                                                  max_band_results=None,
+                                                  split_beds=False,
+                                                  checkpoint_dir=None,
+                                                  checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL_S,
+                                                  resume=False,
+                                                  html_archive=None,
+                                                  extraction_mode='compiled',
+                                                  defer_enrichment=False,
+                                                  daft_address=DAFT_ADDRESS
                                                   )
 
 
 def test_crawler_identify_it_self_as_google_bot(runner):
     assert 'Googlebot' in runner.crawler_settings[USER_AGENT_SETTING]
+
+
+def test_runner_should_parse_the_poi_layers(runner):
+    args = runner.get_arg_parser().parse_args(args=['houses-for-sale',
+                                                    '--poi-layers', 'schools=/tmp/schools.csv',
+                                                    'parks = /tmp/parks.geojson'])
+    runner.run(args)
+    assert runner._process.crawl.call_args[1]['poi_layers'] == {'schools': '/tmp/schools.csv',
+                                                                 'parks': '/tmp/parks.geojson'}
+
+
+def test_runner_should_reject_poi_layers_without_a_path(runner):
+    with pytest.raises(SystemExit):
+        runner.get_arg_parser().parse_args(args=['houses-for-sale', '--poi-layers', 'schools'])
+
+
+@mock.patch('web_scraper.runner.NearestStationGrid')
+def test_runner_should_build_the_transport_grid_without_crawling(grid_mock, runner):
+    grid_mock.build.return_value.max_error_m = 10.0
+    runner.run(runner.get_arg_parser().parse_args(args=['build-transport-grid', '--output', '/tmp/grid.bin',
+                                                        '--step', '0.01']))
+
+    grid_mock.build.assert_called_once_with(DUBLIN_BOUNDING_BOX, 0.01)
+    grid_mock.build.return_value.save.assert_called_once_with('/tmp/grid.bin')
+    runner._process.start.assert_not_called()
+
+
+def test_runner_should_stream_json_lines_by_default(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale']))
+
+    settings = _applied_settings(runner)
+    assert settings[ITEM_PIPELINES_SETTING] == {'web_scraper.pipelines.JsonLinesWriterPipeline': 250}
+    assert settings[OUTPUT_PATH_SETTING] == DEFAULT_JSON_LINES_OUTPUT
+    assert settings[FLUSH_INTERVAL_SETTING] == 100
+    assert runner.crawler_settings[OUTPUT_PATH_SETTING] == DEFAULT_JSON_LINES_OUTPUT
+
+
+def test_runner_should_use_the_selected_output(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--output-format', 'json',
+                                                        '--output', '/tmp/output.json',
+                                                        '--flush-interval', '10']))
+
+    settings = _applied_settings(runner)
+    assert settings[ITEM_PIPELINES_SETTING] == {'web_scraper.pipelines.JsonWriterPipeline': 250}
+    assert settings[OUTPUT_PATH_SETTING] == '/tmp/output.json'
+    assert settings[FLUSH_INTERVAL_SETTING] == 10
+
+
+def test_runner_should_configure_the_compressed_output(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--output-format', 'jsonl.xz',
+                                                        '--compression-level', '9',
+                                                        '--rotate-items', '1000',
+                                                        '--rotate-bytes', '2048']))
+
+    settings = _applied_settings(runner)
+    assert settings[ITEM_PIPELINES_SETTING] == {'web_scraper.pipelines.CompressedJsonLinesWriterPipeline': 250}
+    assert settings[OUTPUT_PATH_SETTING] == DEFAULT_COMPRESSED_OUTPUT
+    assert settings[OUTPUT_FORMAT_SETTING] == 'jsonl.xz'
+    assert settings[COMPRESSION_LEVEL_SETTING] == 9
+    assert settings[ROTATE_ITEMS_SETTING] == 1000
+    assert settings[ROTATE_BYTES_SETTING] == 2048
+
+
+def _applied_settings(runner):
+    runner._process.settings.setdict.assert_called_once()
+    assert runner._process.settings.setdict.call_args[1] == {'priority': 'cmdline'}
+    return runner._process.settings.setdict.call_args[0][0]
+
+
+def test_runner_should_configure_the_sqlite_output(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--output-format', 'sqlite',
+                                                        '--batch-size', '50']))
+
+    settings = _applied_settings(runner)
+    assert settings[ITEM_PIPELINES_SETTING] == {'web_scraper.pipelines.SqliteWriterPipeline': 250}
+    assert settings[OUTPUT_PATH_SETTING] == DEFAULT_SQLITE_OUTPUT
+    assert settings[BATCH_SIZE_SETTING] == 50
+
+
+def test_runner_should_configure_the_seen_listings(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--seen-listings', '/tmp/seen.sqlite',
+                                                        '--seen-ttl-hours', '12', '--force-refresh']))
+
+    crawl_args = runner._process.crawl.call_args[1]
+    assert crawl_args['seen_listings'] == '/tmp/seen.sqlite'
+    assert crawl_args['seen_ttl_hours'] == 12
+    assert crawl_args['force_refresh']
+
+
+def test_runner_should_configure_the_cards_only_mode(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--cards-only', '--detail-on-change',
+                                                        '--seen-listings', '/tmp/seen.sqlite']))
+
+    crawl_args = runner._process.crawl.call_args[1]
+    assert crawl_args['cards_only']
+    assert crawl_args['detail_on_change']
+
+
+def test_runner_should_not_fetch_changed_details_without_the_seen_listings(runner):
+    with pytest.raises(SystemExit):
+        runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--cards-only',
+                                                            '--detail-on-change']))
+    runner._process.start.assert_not_called()
+
+
+def test_runner_should_configure_the_price_bands(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--max-band-results', '1000',
+                                                        '--split-beds']))
+
+    crawl_args = runner._process.crawl.call_args[1]
+    assert crawl_args['max_band_results'] == 1000
+    assert crawl_args['split_beds']
+
+
+@mock.patch('web_scraper.runner.ShardedCrawl')
+def test_runner_should_shard_the_crawl_between_the_workers(sharded_crawl_mock, runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--workers', '4',
+                                                        '--locations', 'area1', 'area2']))
+
+    sharded_crawl_mock.assert_called_once()
+    _, settings, spider_kwargs, workers = sharded_crawl_mock.call_args[0]
+    assert settings is runner.crawler_settings
+    assert spider_kwargs['locations'] == ['area1', 'area2']
+    assert workers == 4
+    sharded_crawl_mock.return_value.run.assert_called_once_with()
+    runner._process.crawl.assert_not_called()
+    runner._process.start.assert_not_called()
+
+
+def test_runner_should_configure_the_checkpoints(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--checkpoint-dir', '/tmp/checkpoint',
+                                                        '--checkpoint-interval', '30', '--resume']))
+
+    crawl_args = runner._process.crawl.call_args[1]
+    assert crawl_args['checkpoint_dir'] == '/tmp/checkpoint'
+    assert crawl_args['checkpoint_interval'] == 30.0
+    assert crawl_args['resume']
+
+
+@pytest.mark.parametrize('args', [
+    ['--resume'],
+    ['--checkpoint-dir', '/tmp/checkpoint', '--workers', '2'],
+    ['--checkpoint-dir', '/tmp/checkpoint', '--output-format', 'json'],
+])
+def test_runner_should_not_start_unsupported_checkpoints(runner, args):
+    with pytest.raises(SystemExit):
+        runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale'] + args))
+    runner._process.start.assert_not_called()
+
+
+def test_runner_should_configure_the_http_cache(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--http-cache', '/tmp/cache',
+                                                        '--http-cache-listing-ttl', '600']))
+
+    settings = _applied_settings(runner)
+    assert settings['HTTPCACHE_ENABLED']
+    assert settings['HTTPCACHE_DIR'] == '/tmp/cache'
+    assert settings['HTTPCACHE_GZIP']
+    assert settings['DOWNLOADER_MIDDLEWARES'] == {'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': None,
+                                                  'web_scraper.http_cache.DaftHttpCacheMiddleware': 900}
+    assert settings[LISTING_TTL_SETTING] == 600.0
+    assert settings[DETAIL_TTL_SETTING] == DEFAULT_DETAIL_TTL_S
+    assert runner.crawler_settings['HTTPCACHE_POLICY'] == 'web_scraper.http_cache.DaftCachePolicy'
+
+
+def test_runner_should_not_cache_by_default(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale']))
+
+    assert 'HTTPCACHE_ENABLED' not in _applied_settings(runner)
+
+
+def test_runner_should_crawl_another_address_with_the_given_concurrency(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--daft-address', 'http://127.0.0.1:8080',
+                                                        '--concurrent-requests', '64']))
+
+    settings = _applied_settings(runner)
+    assert runner._process.crawl.call_args[1]['daft_address'] == 'http://127.0.0.1:8080'
+    assert (settings['CONCURRENT_REQUESTS'], settings['CONCURRENT_REQUESTS_PER_DOMAIN']) == (64, 64)
+
+
+def test_runner_should_keep_the_default_concurrency(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale']))
+
+    assert 'CONCURRENT_REQUESTS' not in _applied_settings(runner)
+
+
+def test_runner_should_export_the_metrics(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--metrics-file', '/tmp/crawl.prom',
+                                                        '--metrics-port', '9410', '--metrics-interval', '5']))
+
+    settings = _applied_settings(runner)
+    assert settings['EXTENSIONS'] == {METRICS_EXTENSION: METRICS_EXTENSION_ORDER}
+    assert (settings[METRICS_FILE_SETTING], settings[METRICS_PORT_SETTING], settings[METRICS_INTERVAL_SETTING]) == \
+        ('/tmp/crawl.prom', 9410, 5)
+
+
+def test_runner_should_not_export_the_metrics_by_default(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale']))
+
+    assert 'EXTENSIONS' not in _applied_settings(runner)
+
+
+def test_runner_should_reject_exporting_the_metrics_of_workers(runner):
+    with pytest.raises(SystemExit):
+        runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--metrics-port', '9410',
+                                                            '--workers', '2']))
+
+
+@pytest.mark.parametrize('args', [
+    ['--transport-cache-file', '/tmp/transport-cache.json'],
+    ['--seen-listings', '/tmp/seen.sqlite'],
+])
+def test_runner_should_reject_the_shared_files_of_workers(runner, args):
+    with pytest.raises(SystemExit):
+        runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--workers', '2'] + args))
+    runner._process.start.assert_not_called()
+
+
+@mock.patch('web_scraper.runner.create_profiler')
+def test_runner_should_profile_the_whole_run(create_profiler_mock, runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['--profile', 'memory', '--profile-output', '/tmp/memory.txt',
+                                                        '--profile-top', '10', '--profile-interval', '5',
+                                                        'houses-for-sale']))
+
+    create_profiler_mock.assert_called_once_with('memory', '/tmp/memory.txt', 10, 5)
+    create_profiler_mock.return_value.__enter__.assert_called_once_with()
+    create_profiler_mock.return_value.__exit__.assert_called_once_with(None, None, None)
+    runner._process.start.assert_called_once_with()
+
+
+@mock.patch('web_scraper.runner.create_profiler')
+def test_runner_should_not_profile_by_default(create_profiler_mock, runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale']))
+
+    create_profiler_mock.assert_not_called()
+    runner._process.start.assert_called_once_with()
+
+
+def test_runner_should_configure_the_html_archive(runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['houses-for-sale', '--html-archive', '/tmp/archive']))
+
+    assert runner._process.crawl.call_args[1]['html_archive'] == '/tmp/archive'
+
+
+@mock.patch('web_scraper.runner.Reextraction')
+def test_runner_should_reextract_the_html_archive(reextraction_mock, runner):
+    runner.run(runner.get_arg_parser().parse_args(args=['reextract', '--archive', '/tmp/archive', '--workers', '3',
+                                                        '--output-format', 'sqlite']))
+
+    _, archive, spider_kwargs, workers = reextraction_mock.call_args[0]
+    assert (archive, workers) == ('/tmp/archive', 3)
+    assert spider_kwargs == {'poi_layers': None, 'transport_grid': None, 'extraction_mode': 'compiled'}
+    assert _applied_settings(runner)[OUTPUT_PATH_SETTING] == '/tmp/data-reextract.sqlite'
+    reextraction_mock.return_value.run.assert_called_once_with()
+    runner._process.start.assert_not_called()
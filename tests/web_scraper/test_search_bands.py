@@ -0,0 +1,45 @@
+import pytest
+
+from web_scraper.search_bands import SearchBand, SearchBandPlanner, OPEN_PRICE_PIVOT
+
+
+@pytest.fixture
+def planner():
+    return SearchBandPlanner(max_band_results=100)
+
+
+def test_split_should_keep_the_bands_with_few_results(planner):
+    assert planner.split(SearchBand(1000, 2000), 100) == []
+
+
+def test_split_should_size_the_bands_from_the_results_count(planner):
+    assert planner.split(SearchBand(100000, 399999, 2), 250) == [
+        SearchBand(100000, 199999, 2), SearchBand(200000, 299999, 2), SearchBand(300000, 399999, 2)]
+
+
+def test_split_should_split_the_open_price_bands_in_two(planner):
+    assert planner.split(SearchBand(), 5000) == [SearchBand(0, OPEN_PRICE_PIVOT - 1), SearchBand(OPEN_PRICE_PIVOT)]
+    assert planner.split(SearchBand(800000), 5000) == [SearchBand(800000, 1599999), SearchBand(1600000)]
+
+
+def test_split_should_not_overlap_the_bands_of_small_ranges(planner):
+    assert planner.split(SearchBand(100, 102), 5000) == [SearchBand(100, 100), SearchBand(101, 101),
+                                                         SearchBand(102, 102)]
+
+
+def test_split_should_stop_on_single_price_bands(planner):
+    assert planner.split(SearchBand(100, 100), 5000) == []
+
+
+def test_split_should_split_the_single_price_bands_by_beds():
+    planner = SearchBandPlanner(max_band_results=100, split_beds=True)
+
+    assert planner.split(SearchBand(100, 100), 300) == [SearchBand(100, 100, 0, 3), SearchBand(100, 100, 4)]
+    assert planner.split(SearchBand(100, 100, 0, 3), 300) == [
+        SearchBand(100, 100, 0, 1), SearchBand(100, 100, 2, 3)]
+    assert planner.split(SearchBand(100, 100, 2, 2), 300) == []
+
+
+def test_planner_should_not_accept_empty_bands():
+    with pytest.raises(ValueError):
+        SearchBandPlanner(max_band_results=0)
@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from web_scraper.seen_listings import SeenListingsStore
+
+LINK = 'https://www.daft.ie/for-sale/1'
+NOW = 1600000000.0
+HOUR = 3600
+
+
+@pytest.fixture()
+def store_path(tmp_path):
+    return str(tmp_path / 'seen.sqlite')
+
+
+@pytest.fixture()
+def store(store_path):
+    result = SeenListingsStore(store_path, ttl_hours=24)
+    yield result
+    result.close()
+
+
+def test_should_scrape_new_listings(store):
+    assert store.should_scrape(LINK, NOW)
+    assert store.should_scrape(LINK, NOW + HOUR)
+    assert store.skipped == 0
+
+
+def test_should_not_scrape_listings_scraped_inside_the_ttl(store):
+    store.mark_scraped(LINK, NOW)
+
+    assert not store.should_scrape(LINK, NOW + 23 * HOUR)
+    assert store.skipped == 1
+    assert store.scraped == 1
+
+
+def test_should_scrape_listings_scraped_before_the_ttl(store):
+    store.mark_scraped(LINK, NOW)
+
+    assert store.should_scrape(LINK, NOW + 25 * HOUR)
+
+
+def test_should_scrape_everything_on_force_refresh(store_path):
+    store = SeenListingsStore(store_path, force_refresh=True)
+    store.mark_scraped(LINK, NOW)
+
+    assert store.should_scrape(LINK, NOW + HOUR)
+    store.close()
+
+
+def test_should_persist_the_scraped_listings(store, store_path):
+    store.mark_scraped(LINK, NOW)
+    store.close()
+
+    reopened_store = SeenListingsStore(store_path)
+    assert not reopened_store.should_scrape(LINK, NOW + HOUR)
+    reopened_store.close()
+
+
+def test_should_fail_after_being_closed(store):
+    store.close()
+
+    with pytest.raises(RuntimeError):
+        store.should_scrape(LINK)
+
+
+def test_card_changed_should_be_true_for_new_and_changed_cards(store):
+    assert store.card_changed(LINK, 'hash1', NOW)
+    assert not store.card_changed(LINK, 'hash1', NOW + HOUR)
+    assert store.card_changed(LINK, 'hash2', NOW + 2 * HOUR)
+    assert store.skipped == 1
+
+
+def test_card_changed_should_add_the_card_hash_to_old_stores(store_path):
+    connection = sqlite3.connect(store_path)
+    connection.execute('CREATE TABLE seen_listings (link TEXT PRIMARY KEY, first_seen_at REAL NOT NULL,'
+                       ' last_seen_at REAL NOT NULL, scraped_at REAL)')
+    connection.close()
+
+    store = SeenListingsStore(store_path)
+
+    assert store.card_changed(LINK, 'hash1', NOW)
+    store.close()
@@ -1,11 +1,22 @@
+import os
+import re
 from typing import Any
 from unittest.mock import MagicMock, call, patch
 
 import pytest
-from scrapy import Selector
-from scrapy.http import Response
-
-from web_scraper.spiders import DaftSaleUsedSpider, DaftExtractor, ExtractorException, DAFT_ADDRESS, \
+from scrapy import Selector, Request
+from scrapy.http import Response, HtmlResponse
+
+from web_scraper.public_transport import GREEN_LUAS, RED_LUAS, DART, GREEN_LUAS_STATIONS, RED_LUAS_STATIONS, \
+    DART_STATIONS
+from web_scraper.checkpoint import DEFAULT_CHECKPOINT_INTERVAL_S, CHECKPOINT_FILE
+from web_scraper.html_archive import HtmlArchiveReader
+from web_scraper.search_bands import SearchBand
+from web_scraper.spiders import DaftSaleUsedSpider, DaftExtractor, DaftCardExtractor, ExtractorException, \
+    DAFT_ADDRESS, CARD_SELECTOR, RESULTS_COUNT_SELECTOR, LISTING_PAGE_PRIORITY, PAGE_FROM_META, PAGE_CHAIN_META, \
+    SEARCH_BAND_META, EXTRACTION_MODE_COMPILED, EXTRACTION_MODES, EXTRACTION_MODE_NEXT_DATA, \
+    EXTRACTION_MODE_STREAMING, STREAMING_CHUNK_BYTES, CompiledDaftExtractor, NextDataDaftExtractor, \
+    StreamingDaftExtractor, EXTRACTION_MODE_CSS, \
     PROPERTIES_FOR_SALE, PROPERTY_CARD_SELECTOR, PROPERTY_TYPE_SELECTOR, PRICE_SELECTOR, \
     FLOOR_AREA_SELECTOR, MAIN_ADDRESS_SELECTOR, STREET_VIEW_SELECTOR, DESCRIPTION_SELECTOR, STATISTICS_SELECTOR, \
     BER_RATING_ALT_SELECTOR, BEDS_SELECTOR, BATHS_SELECTOR, PAGE_SIZE, DEFAULT_PAGE_SIZE, IRELAND_AREA
@@ -130,11 +141,9 @@ def test_daft_sale_used_spider_init(spider, expected_start_url):
 
 @patch('web_scraper.spiders.Request')
 def test_daft_sale_should_parse_property_cards(request_mock, daft_sale_used):
-    mock_list_response = MagicMock()
     property1 = _generate_selector(SHORT_LINK_1)
     property2 = _generate_selector(SHORT_LINK_2)
-
-    mock_list_response.css.side_effect = [[property1, property2], []]
+    mock_list_response = _list_response([property1, property2])
 
     results = _get_results_from_parsing_response(daft_sale_used, mock_list_response)
     assert len(results) == 3
@@ -150,22 +159,505 @@ def test_daft_sale_should_parse_property_cards(request_mock, daft_sale_used):
 
 @patch('web_scraper.spiders.Request')
 def test_daft_sale_should_try_to_parse_next_page(request_mock, daft_sale_used):
-    mock_list_response = MagicMock()
     property1 = _generate_selector(SHORT_LINK_1)
     property2 = _generate_selector(SHORT_LINK_2)
 
-    mock_list_response.css.side_effect = [[property1, property2], []]
-
-    results = _get_results_from_parsing_response(daft_sale_used, mock_list_response)
+    results = _get_results_from_parsing_response(daft_sale_used, _list_response([property1, property2]))
     assert len(results) == 3
 
     request_mock.assert_has_calls([call(
         daft_sale_used.base_url + daft_sale_used.base_url_args + f"from={DEFAULT_PAGE_SIZE}&",
-        callback=daft_sale_used.parse)])
+        callback=daft_sale_used.parse, priority=LISTING_PAGE_PRIORITY,
+        meta={PAGE_FROM_META: DEFAULT_PAGE_SIZE, PAGE_CHAIN_META: True, SEARCH_BAND_META: SearchBand()})])
 
     # stops on the second page since there is nothing on the page
-    results = _get_results_from_parsing_response(daft_sale_used, mock_list_response)
+    results = _get_results_from_parsing_response(daft_sale_used, _list_response([], meta={
+        PAGE_FROM_META: DEFAULT_PAGE_SIZE, PAGE_CHAIN_META: True}))
     assert len(results) == 0
+    assert daft_sale_used.start_from == 0
+
+
+@patch('web_scraper.spiders.Request')
+def test_daft_sale_should_request_all_the_pages_from_the_results_count(request_mock, daft_sale_used):
+    results = _get_results_from_parsing_response(daft_sale_used, _list_response(
+        [_generate_selector(SHORT_LINK_1)], results_count_text='1,045 Properties for Sale in Ireland'))
+
+    page_calls = [page_call for page_call in request_mock.mock_calls if page_call[2].get('callback') ==
+                  daft_sale_used.parse]
+    assert len(results) == 1 + 52
+    assert [page_call[2]['meta'][PAGE_FROM_META] for page_call in page_calls] == \
+        list(range(DEFAULT_PAGE_SIZE, 1045, DEFAULT_PAGE_SIZE))
+    assert [page_call[2]['meta'][PAGE_CHAIN_META] for page_call in page_calls] == [False] * 51 + [True]
+    assert page_calls[0][1][0] == daft_sale_used.base_url + daft_sale_used.base_url_args + "from=20&"
+    assert daft_sale_used.start_from == 0
+
+
+@patch('web_scraper.spiders.Request')
+def test_daft_sale_should_not_chain_the_pages_requested_at_once(request_mock, daft_sale_used):
+    results = _get_results_from_parsing_response(daft_sale_used, _list_response(
+        [_generate_selector(SHORT_LINK_1)], meta={PAGE_FROM_META: 40, PAGE_CHAIN_META: False}))
+
+    assert len(results) == 1
+    request_mock.assert_called_once_with(FULL_LINK_1, callback=daft_sale_used.parse_detailed_page)
+
+
+@patch('web_scraper.spiders.Request')
+def test_daft_sale_should_split_the_searches_with_too_many_results_in_price_bands(request_mock):
+    spider = DaftSaleUsedSpider(min_price=MIN_PRICE, max_price=300999, max_band_results=500)
+
+    results = _get_results_from_parsing_response(spider, _list_response(
+        [_generate_selector(SHORT_LINK_1)], results_count_text='1,200 Properties for Sale in Ireland'))
+
+    assert len(results) == 3
+    assert [band_call[2]['meta'][SEARCH_BAND_META] for band_call in request_mock.mock_calls] == [
+        SearchBand(1000, 100999), SearchBand(101000, 200999), SearchBand(201000, 300999)]
+    assert request_mock.mock_calls[1][1][0] == \
+        INITIAL_URL + "/" + IRELAND_AREA + "?" + INITIAL_ARGS + "salePrice_from=101000&salePrice_to=200999&"
+    assert spider.search_bands_count == 3
+
+
+@patch('web_scraper.spiders.Request')
+def test_daft_sale_should_crawl_the_bands_with_few_results(request_mock):
+    spider = DaftSaleUsedSpider(max_band_results=500)
+    search_band = SearchBand(1000, 100999)
+
+    _get_results_from_parsing_response(spider, _list_response(
+        [_generate_selector(SHORT_LINK_1)], results_count_text='45 Properties for Sale in Ireland',
+        meta={SEARCH_BAND_META: search_band}))
+
+    request_mock.assert_any_call(FULL_LINK_1, callback=spider.parse_detailed_page)
+    assert [page_call[2]['meta'] for page_call in request_mock.mock_calls[1:]] == [
+        {PAGE_FROM_META: 20, PAGE_CHAIN_META: False, SEARCH_BAND_META: search_band},
+        {PAGE_FROM_META: 40, PAGE_CHAIN_META: True, SEARCH_BAND_META: search_band}]
+
+
+@patch('web_scraper.spiders.Request')
+def test_daft_sale_should_dedupe_the_properties_listed_in_several_bands(request_mock):
+    spider = DaftSaleUsedSpider(max_band_results=500)
+    page_meta = {PAGE_FROM_META: 20, PAGE_CHAIN_META: False}
+
+    _get_results_from_parsing_response(spider, _list_response(
+        [_generate_selector(SHORT_LINK_1), _generate_selector(SHORT_LINK_2)], meta=page_meta))
+    _get_results_from_parsing_response(spider, _list_response([_generate_selector(SHORT_LINK_2)], meta=page_meta))
+
+    assert request_mock.mock_calls == [call(FULL_LINK_1, callback=spider.parse_detailed_page),
+                                       call(FULL_LINK_2, callback=spider.parse_detailed_page)]
+    assert spider.duplicated_links == 1
+
+
+@patch('web_scraper.spiders.task')
+def test_daft_sale_should_resume_the_pending_requests_of_the_checkpoint(task_mock, tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    spider = DaftSaleUsedSpider(checkpoint_dir=checkpoint_dir, max_band_results=500)
+    start_requests = list(spider.start_requests())
+    first_page = _list_response([_generate_selector(SHORT_LINK_1), _generate_selector(SHORT_LINK_2)],
+                                results_count_text='45 Properties for Sale in Ireland')
+    first_page.url = start_requests[0].url
+
+    results = _get_results_from_parsing_response(spider, first_page)
+    spider.item_scraped({'link': FULL_LINK_1})
+    spider.checkpoint.save()
+
+    resumed_spider = DaftSaleUsedSpider(checkpoint_dir=checkpoint_dir, max_band_results=500, resume=True)
+    resumed_requests = list(resumed_spider.start_requests())
+    resumed_results = _get_results_from_parsing_response(resumed_spider, first_page)
+
+    assert len(results) == 4
+    assert {request.url: request.callback.__name__ for request in resumed_requests} == {
+        FULL_LINK_2: 'parse_detailed_page', results[2].url: 'parse', results[3].url: 'parse'}
+    assert [request.meta for request in resumed_requests if request.callback == resumed_spider.parse] == \
+        [result.meta for result in results[2:]]
+    assert [result.url for result in resumed_results] == [FULL_LINK_2] + [result.url for result in results[2:]]
+
+
+@patch('web_scraper.spiders.task')
+def test_daft_sale_should_save_the_checkpoint_periodically_once_opened(task_mock, tmp_path):
+    spider = DaftSaleUsedSpider(checkpoint_dir=str(tmp_path))
+
+    spider.spider_opened()
+
+    task_mock.LoopingCall.assert_called_with(spider.checkpoint.save)
+    task_mock.LoopingCall.return_value.start.assert_called_with(DEFAULT_CHECKPOINT_INTERVAL_S, now=False)
+
+
+@pytest.mark.parametrize('scraped', [True, False])
+@patch('web_scraper.spiders.DaftExtractor')
+@patch('web_scraper.spiders.task')
+def test_daft_sale_should_keep_the_detailed_page_pending_until_the_item_is_scraped(task_mock, extractor, scraped,
+                                                                                 tmp_path):
+    spider = DaftSaleUsedSpider(checkpoint_dir=str(tmp_path), defer_enrichment=True)
+    request = Request(FULL_LINK_1, callback=spider.parse_detailed_page)
+    spider.checkpoint.add_pending(request.url, request.callback.__name__, {})
+    response = HtmlResponse(FULL_LINK_1, body=b'<html></html>', request=request)
+
+    items = list(spider.parse_detailed_page(response))
+
+    assert FULL_LINK_1 in spider.checkpoint.pending
+    if scraped:
+        spider.item_scraped(items[0], response)
+    else:
+        spider.item_failed(items[0], response)
+    assert FULL_LINK_1 not in spider.checkpoint.pending
+    assert (FULL_LINK_1 in spider.checkpoint.completed) == scraped
+
+
+@pytest.mark.parametrize('reason, checkpoint_kept', [('finished', False), ('shutdown', True)])
+@patch('web_scraper.spiders.task')
+def test_daft_sale_should_save_the_checkpoint_unless_the_crawl_finished(task_mock, reason, checkpoint_kept, tmp_path):
+    spider = DaftSaleUsedSpider(checkpoint_dir=str(tmp_path), transport_cache_size=0)
+    spider.crawler = MagicMock()
+    spider.checkpoint.save()
+
+    spider.closed(reason)
+
+    assert (tmp_path / CHECKPOINT_FILE).exists() == checkpoint_kept
+
+
+@patch('web_scraper.spiders.Request')
+def test_daft_sale_should_skip_the_properties_already_scraped(request_mock, tmp_path):
+    spider = DaftSaleUsedSpider(seen_listings=str(tmp_path / 'seen.sqlite'))
+    spider.seen_listings.mark_scraped(FULL_LINK_1)
+    mock_list_response = _list_response([_generate_selector(SHORT_LINK_1), _generate_selector(SHORT_LINK_2)])
+
+    _get_results_from_parsing_response(spider, mock_list_response)
+
+    assert call(FULL_LINK_1, callback=spider.parse_detailed_page) not in request_mock.mock_calls
+    request_mock.assert_any_call(FULL_LINK_2, callback=spider.parse_detailed_page)
+
+
+@patch('web_scraper.spiders.DaftExtractor')
+def test_daft_sale_should_mark_the_properties_as_scraped_once_the_pipelines_wrote_them(extractor, tmp_path):
+    spider = DaftSaleUsedSpider(seen_listings=str(tmp_path / 'seen.sqlite'), defer_enrichment=True)
+    spider.crawler = MagicMock()
+    request = Request(FULL_LINK_1, callback=spider.parse_detailed_page)
+    response = HtmlResponse(FULL_LINK_1, body=b'<html></html>', request=request)
+
+    items = list(spider.parse_detailed_page(response))
+    assert spider.seen_listings.scraped == 0
+    spider.item_scraped(items[0], response)
+    spider.item_scraped(CARD_ITEM, _html_list_response(CARD_HTML))
+    spider.closed('finished')
+
+    spider.crawler.stats.set_value.assert_any_call('seen_listings/scraped', 1)
+    assert not DaftSaleUsedSpider(seen_listings=str(tmp_path / 'seen.sqlite')).seen_listings.should_scrape(FULL_LINK_1)
+
+
+CARD_HTML = '''
+<ul>
+  <li data-testid="result-1">
+    <a href="/for-sale/house-1">
+      <div data-testid="price"><h3>€375,000</h3></div>
+      <p data-testid="address">7 Crofton Terrace, Dun Laoghaire, South Co. Dublin</p>
+      <p data-testid="beds">3 Bed</p>
+      <p data-testid="baths">2 Bath</p>
+      <p data-testid="floor-area">54 m²</p>
+      <p data-testid="property-type">House</p>
+    </a>
+  </li>
+  <li data-testid="result-2">
+    <a href="/for-sale/apartment-2">
+      <div data-testid="price"><h3>Price on Application</h3></div>
+      <p data-testid="address">SingleAdress</p>
+    </a>
+  </li>
+</ul>
+'''
+
+CARD_ITEM = {
+    'link': DAFT_ADDRESS + '/for-sale/house-1',
+    'property_type': 'House',
+    'price': PRICE,
+    'bedrooms': BEDROOMS,
+    'bathrooms': BATHROOMS,
+    'floor_area_m2': FLOOR_AREA,
+    'main_address': MAIN_ADDRESS_NO_DISTRICT_DUN_LAOGHAIRE,
+    'sector': MAIN_ADDRESS_NO_DISTRICT_DUN_LAOGHAIRE_SECTOR,
+    'region': MAIN_ADDRESS_NO_DISTRICT_DUN_LAOGHAIRE_REGION,
+}
+
+
+def test_daft_card_extractor_should_extract_the_card_fields():
+    cards = Selector(text=CARD_HTML).css(CARD_SELECTOR)
+
+    assert DaftCardExtractor.extract_card(cards[0]) == CARD_ITEM
+    assert DaftCardExtractor.extract_card(cards[1]) == {
+        'link': DAFT_ADDRESS + '/for-sale/apartment-2',
+        'property_type': None,
+        'price': None,
+        'bedrooms': None,
+        'bathrooms': None,
+        'floor_area_m2': None,
+        'main_address': MAIN_ADDRESS_SINGLE_RAW,
+        'sector': None,
+        'region': None,
+    }
+
+
+@patch('web_scraper.spiders.Request')
+def test_daft_sale_should_crawl_another_daft_address(request_mock):
+    spider = DaftSaleUsedSpider(daft_address='http://127.0.0.1:8080/')
+    _get_results_from_parsing_response(spider, _list_response([_generate_selector(SHORT_LINK_1)]))
+
+    assert spider.start_urls == ['http://127.0.0.1:8080' + PROPERTIES_FOR_SALE + '/' + IRELAND_AREA + '?' +
+                                 INITIAL_ARGS]
+    request_mock.assert_any_call('http://127.0.0.1:8080' + SHORT_LINK_1, callback=spider.parse_detailed_page)
+    assert DaftCardExtractor.extract_card(Selector(text=CARD_HTML).css(CARD_SELECTOR)[0], 'http://127.0.0.1:8080') \
+        == {**CARD_ITEM, 'link': 'http://127.0.0.1:8080/for-sale/house-1'}
+
+
+def test_daft_card_extractor_should_skip_cards_without_link():
+    card = Selector(text='<li data-testid="result-1"><p data-testid="address">Address</p></li>').css(CARD_SELECTOR)
+
+    assert DaftCardExtractor.extract_card(card[0]) is None
+
+
+def test_daft_sale_cards_only_should_yield_the_cards_without_requesting_the_details():
+    spider = DaftSaleUsedSpider(cards_only=True)
+    response = _html_list_response(CARD_HTML)
+
+    results = _get_results_from_parsing_response(spider, response)
+
+    assert results[0] == CARD_ITEM
+    assert results[1]['link'] == DAFT_ADDRESS + '/for-sale/apartment-2'
+    assert isinstance(results[2], Request)
+    assert results[2].callback == spider.parse
+
+
+def test_daft_sale_cards_only_should_request_the_details_of_new_and_changed_cards(tmp_path):
+    seen_listings = str(tmp_path / 'seen.sqlite')
+    spider = DaftSaleUsedSpider(cards_only=True, detail_on_change=True, seen_listings=seen_listings)
+    response = _html_list_response(CARD_HTML)
+
+    first_results = _get_results_from_parsing_response(spider, response)
+    second_results = _get_results_from_parsing_response(spider, response)
+    changed_response = _html_list_response(CARD_HTML.replace('375,000', '350,000'))
+    changed_results = _get_results_from_parsing_response(spider, changed_response)
+
+    assert [result.url for result in first_results[:2]] == [CARD_ITEM['link'], DAFT_ADDRESS + '/for-sale/apartment-2']
+    assert all(result.callback == spider.parse_detailed_page for result in first_results[:2])
+    assert second_results[0] == CARD_ITEM
+    assert changed_results[0].url == CARD_ITEM['link']
+    assert changed_results[1]['link'] == DAFT_ADDRESS + '/for-sale/apartment-2'
+
+
+def test_daft_sale_should_not_fetch_the_changed_details_without_the_seen_listings():
+    with pytest.raises(ValueError):
+        DaftSaleUsedSpider(cards_only=True, detail_on_change=True)
+
+
+@patch('web_scraper.spiders.DaftExtractor')
+def test_daft_sale_should_archive_the_property_pages(extractor, tmp_path):
+    spider = DaftSaleUsedSpider(html_archive=str(tmp_path / 'archive'), transport_cache_size=0)
+    spider.crawler = MagicMock()
+    extractor.extract_geolocation.return_value = None
+    detail_response = HtmlResponse(FULL_LINK_1, body=b'<html>House</html>', request=Request(FULL_LINK_1))
+
+    list(spider.parse_detailed_page(detail_response))
+    spider.closed('finished')
+
+    reader = HtmlArchiveReader(str(tmp_path / 'archive'))
+    entries = list(reader.entries())
+    assert [entry['url'] for entry in entries] == [FULL_LINK_1]
+    assert reader.read(entries[0]) == b'<html>House</html>'
+    spider.crawler.stats.set_value.assert_any_call('html_archive/pages', 1)
+    reader.close()
+
+
+with open(os.path.join(os.path.dirname(__file__), 'pages', 'detail.html')) as detail_file:
+    DETAIL_HTML = detail_file.read()
+
+
+@pytest.mark.parametrize('html', [
+    DETAIL_HTML,
+    DETAIL_HTML.replace('alt="C1"', f'alt="{BER_RATING_RAW_EXEMPT}"').replace('€375,000', 'Price on Application'),
+    DETAIL_HTML.replace('Dun Laoghaire, South Co. Dublin', 'Rathmines, Dublin 6, Dublin City'),
+    '<html><body><div data-testid="price"><p><span>€90,000</span></p></div>'
+    '<p data-testid="beds">1 Bed</p></body></html>',
+])
+@pytest.mark.parametrize('extraction_mode', [EXTRACTION_MODE_COMPILED, EXTRACTION_MODE_STREAMING])
+def test_extraction_modes_should_extract_the_same_fields_as_the_css_selectors(extraction_mode, html):
+    detail_response = HtmlResponse(FULL_LINK_1, body=html.encode(), encoding='utf-8', request=Request(FULL_LINK_1))
+
+    css_fields = DaftSaleUsedSpider(transport_cache_size=0)._extract_fields(detail_response)
+    mode_fields = DaftSaleUsedSpider(transport_cache_size=0, extraction_mode=extraction_mode) \
+        ._extract_fields(detail_response)
+
+    assert mode_fields == css_fields
+
+
+def test_streaming_extractor_should_stop_once_every_target_was_seen():
+    html = DETAIL_HTML.replace('</body>', '<p>' + 'x' * 2 * STREAMING_CHUNK_BYTES + '</p>'
+                                          '<div data-testid="description">Not parsed</div></body>')
+
+    fields = StreamingDaftExtractor.extract_fields(html.encode(), 'utf-8')
+
+    assert fields['description'] == 'A lovely house close to the sea'
+    assert fields['price'] == 375000
+
+
+def test_streaming_extractor_should_copy_only_the_target_elements():
+    html = '<html><body><div id="page"><div data-testid="price"><p><span>€90,000</span></p>' \
+           '<p data-testid="beds">2 Bed</p></div><p>Footer</p></div></body></html>'
+
+    targets = StreamingDaftExtractor.extract_targets(html.encode(), 'utf-8')
+
+    assert [element.get('data-testid') for element in targets] == ['price']
+    assert targets.xpath('string()') == '€90,0002 Bed'
+
+
+def test_streaming_extractor_should_copy_the_targets_split_between_chunks():
+    description = 'A lovely house ' * STREAMING_CHUNK_BYTES
+    html = f'<html><body><div data-testid="description"><p>{description}</p></div>' \
+           '<p data-testid="beds">2 Bed</p></body></html>'
+
+    targets = StreamingDaftExtractor.extract_targets(html.encode(), 'utf-8')
+
+    assert [element.get('data-testid') for element in targets] == ['description', 'beds']
+    assert targets[0].xpath('string()') == description
+
+
+@pytest.mark.parametrize('extraction_mode', EXTRACTION_MODES)
+def test_daft_sale_should_fail_on_a_detail_page_without_price_on_every_extraction_mode(extraction_mode):
+    html = DETAIL_HTML.replace('data-testid="price"', 'data-testid="no-price"').replace('"price":"€375,000",', '')
+    detail_response = HtmlResponse(FULL_LINK_1, body=html.encode(), encoding='utf-8', request=Request(FULL_LINK_1))
+
+    with pytest.raises(ExtractorException):
+        DaftSaleUsedSpider(transport_cache_size=0, extraction_mode=extraction_mode)._extract_fields(detail_response)
+
+
+def test_compiled_extractor_should_extract_the_detail_page():
+    fields = CompiledDaftExtractor.extract_fields(Selector(text=DETAIL_HTML).root)
+
+    assert fields == {
+        'property_type': 'House',
+        'ber_rating': 'C1',
+        'price': 375000,
+        'bedrooms': 3,
+        'bathrooms': 2,
+        'floor_area_m2': 54.0,
+        'main_address': '7 Crofton Terrace, Dun Laoghaire, South Co. Dublin',
+        'sector': 'South Co. Dublin',
+        'region': 'Dun Laoghaire',
+        'geolocation': '53.29,-6.13',
+        'description': 'A lovely house close to the sea',
+        'updated_at': '2020-04-05',
+        'views': 1234,
+    }
+
+
+def test_next_data_extractor_should_extract_the_same_fields_as_the_css_selectors():
+    detail_response = HtmlResponse(FULL_LINK_1, body=DETAIL_HTML.encode(), encoding='utf-8',
+                                   request=Request(FULL_LINK_1))
+    spider = DaftSaleUsedSpider(transport_cache_size=0, extraction_mode=EXTRACTION_MODE_NEXT_DATA)
+
+    fields = spider._extract_fields(detail_response)
+
+    assert fields == DaftSaleUsedSpider(transport_cache_size=0)._extract_fields(detail_response)
+    assert spider.next_data_pages == 1
+    assert spider.css_fallback_pages == 0
+
+
+@pytest.mark.parametrize('next_data', [
+    '',
+    '<script id="__NEXT_DATA__" type="application/json">{"props":</script>',
+    '<script id="__NEXT_DATA__" type="application/json">{"props":{"pageProps":{}}}</script>',
+])
+def test_next_data_extractor_should_fall_back_to_the_css_selectors(next_data):
+    html = re.sub('<script id="__NEXT_DATA__".*?</script>', next_data, DETAIL_HTML, flags=re.DOTALL) \
+        .replace('close to the sea', 'close to the beach')
+    detail_response = HtmlResponse(FULL_LINK_1, body=html.encode(), encoding='utf-8', request=Request(FULL_LINK_1))
+    spider = DaftSaleUsedSpider(transport_cache_size=0, extraction_mode=EXTRACTION_MODE_NEXT_DATA)
+
+    fields = spider._extract_fields(detail_response)
+
+    assert fields['description'] == 'A lovely house close to the beach'
+    assert fields['price'] == 375000
+    assert spider.next_data_pages == 0
+    assert spider.css_fallback_pages == 1
+
+
+def test_daft_sale_should_count_the_pages_of_every_extraction_path():
+    spider = DaftSaleUsedSpider(transport_cache_size=0, extraction_mode=EXTRACTION_MODE_NEXT_DATA)
+    spider.crawler = MagicMock()
+    spider.next_data_pages = 3
+    spider.css_fallback_pages = 1
+
+    spider.closed('finished')
+
+    spider.crawler.stats.set_value.assert_any_call('extraction/next_data', 3)
+    spider.crawler.stats.set_value.assert_any_call('extraction/css_fallback', 1)
+
+
+@pytest.mark.parametrize('extraction_mode, extraction_stages', [
+    (EXTRACTION_MODE_CSS, {'extract/property_type', 'extract/price', 'extract/geolocation', 'extract/views'}),
+    (EXTRACTION_MODE_COMPILED, {'extract/html', 'extract/compiled'}),
+    (EXTRACTION_MODE_STREAMING, {'extract/streaming'}),
+    (EXTRACTION_MODE_NEXT_DATA, {'extract/next_data'}),
+])
+def test_daft_sale_should_time_every_stage_of_the_detail_pages(extraction_mode, extraction_stages):
+    spider = DaftSaleUsedSpider(transport_cache_size=0, extraction_mode=extraction_mode)
+    spider.crawler = MagicMock()
+    detail_response = HtmlResponse(FULL_LINK_1, body=DETAIL_HTML.encode(), encoding='utf-8',
+                                   request=Request(FULL_LINK_1, meta={'download_latency': 0.25}))
+
+    list(spider.parse_detailed_page(detail_response))
+    spider.closed('finished')
+
+    assert extraction_stages | {'download', 'enrichment', 'parse_detailed_page'} <= set(spider.timings.stages)
+    assert spider.timings.stages['download'].total == 0.25
+    spider.crawler.stats.set_value.assert_any_call('timing/parse_detailed_page/count', 1)
+    spider.crawler.stats.set_value.assert_any_call('timing/download/p99_s', 0.25)
+
+
+def test_daft_sale_should_time_the_listing_pages(daft_sale_used):
+    list(daft_sale_used.parse(_list_response([_generate_selector(SHORT_LINK_1)])))
+
+    assert daft_sale_used.timings.stages['parse'].count == 1
+    assert 'download' not in daft_sale_used.timings.stages
+
+
+def test_next_data_extractor_should_read_the_listing_without_the_html():
+    body = b'<script id="__NEXT_DATA__" type="application/json">{"props":{"pageProps":{"listing":{' \
+           b'"title":"1 Main Street, Rathmines, Dublin 6, Dublin City","price":"Price on Application",' \
+           b'"ber":{"rating":"SI_666"},"numBedrooms":"2 Bed"}}}}</script>'
+
+    assert NextDataDaftExtractor.extract_fields(body) == {
+        'property_type': 'None',
+        'ber_rating': None,
+        'price': None,
+        'bedrooms': 2,
+        'bathrooms': None,
+        'floor_area_m2': None,
+        'main_address': '1 Main Street, Rathmines, Dublin 6, Dublin City',
+        'sector': 'Dublin City',
+        'region': 'Rathmines',
+        'geolocation': None,
+        'description': '',
+        'updated_at': None,
+        'views': None,
+    }
+
+
+def test_next_data_extractor_should_read_the_numeric_fields():
+    body = b'<script id="__NEXT_DATA__" type="application/json">{"props":{"pageProps":{"listing":{' \
+           b'"title":"1 Main Street, Rathmines, Dublin 6, Dublin City","price":375000,"numBedrooms":3,' \
+           b'"numBathrooms":2,"floorArea":{"value":54.5}}}}}</script>'
+
+    fields = NextDataDaftExtractor.extract_fields(body)
+
+    assert (fields['price'], fields['bedrooms'], fields['bathrooms'], fields['floor_area_m2']) == (375000, 3, 2, 54.5)
+
+
+def test_next_data_extractor_should_use_the_selectors_when_a_field_can_not_be_parsed():
+    body = b'<script id="__NEXT_DATA__" type="application/json">{"props":{"pageProps":{"listing":{' \
+           b'"numBedrooms":"Studio","point":{"coordinates":[-6.2]}}}}}</script>'
+
+    assert NextDataDaftExtractor.extract_fields(body) is None
+
+
+def test_daft_sale_should_reject_unknown_extraction_modes():
+    with pytest.raises(ValueError):
+        DaftSaleUsedSpider(extraction_mode='regex')
 
 
 @patch('web_scraper.spiders.DaftExtractor')
@@ -256,6 +748,86 @@ def test_daft_sale_should_parse_the_views(extractor, daft_sale_used, response):
                              VIEWS, 'views')
 
 
+@patch('web_scraper.spiders.PublicTransport')
+@patch('web_scraper.spiders.DaftExtractor')
+def test_daft_sale_should_add_the_closest_stations(extractor, public_transport, response):
+    daft_sale_used = DaftSaleUsedSpider(transport_cache_size=0)
+    extractor.extract_geolocation.side_effect = [GEOLOCATION]
+    public_transport.get_closest_stations.side_effect = [{
+        GREEN_LUAS: (GREEN_LUAS_STATIONS[1], 40),
+        RED_LUAS: (RED_LUAS_STATIONS[1], 180),
+        DART: (DART_STATIONS[0], -1),
+    }]
+
+    results = [value for value in daft_sale_used.parse_detailed_page(response)]
+
+    public_transport.get_closest_stations.assert_called_once_with(GEOLOCATION)
+    assert results[0]['green_luas_station'] == GREEN_LUAS_STATIONS[1].name
+    assert results[0]['green_luas_distance_m'] == 40
+    assert results[0]['red_luas_station'] == RED_LUAS_STATIONS[1].name
+    assert results[0]['red_luas_distance_m'] == 180
+    assert results[0]['dart_station'] is None
+    assert results[0]['dart_distance_m'] == -1
+
+
+@patch('web_scraper.spiders.DaftExtractor')
+def test_daft_sale_should_add_the_closest_points_of_interest(extractor, response, tmp_path):
+    csv_path = tmp_path / 'schools.csv'
+    csv_path.write_text('name,latitude,longitude\nSchool 1,53.33,-6.25\nSchool 2,53.40,-6.10\n')
+    extractor.extract_geolocation.side_effect = ['53.331,-6.251']
+    spider = DaftSaleUsedSpider(poi_layers={'schools': str(csv_path)})
+
+    results = [value for value in spider.parse_detailed_page(response)]
+
+    assert results[0]['schools_closest'] == 'School 1'
+    assert 0 < results[0]['schools_distance_m'] < 200
+
+
+def test_daft_sale_should_leave_the_enrichment_to_the_pipeline_when_deferred(tmp_path):
+    csv_path = tmp_path / 'schools.csv'
+    csv_path.write_text('name,latitude,longitude\nSchool 1,53.33,-6.25\nSchool 2,53.40,-6.10\n')
+    detail_response = HtmlResponse(FULL_LINK_1, body=DETAIL_HTML.encode(), encoding='utf-8',
+                                   request=Request(FULL_LINK_1))
+    inline_spider = DaftSaleUsedSpider(poi_layers={'schools': str(csv_path)})
+    deferred_spider = DaftSaleUsedSpider(poi_layers={'schools': str(csv_path)}, defer_enrichment=True)
+
+    inline_item = next(inline_spider.parse_detailed_page(detail_response))
+    deferred_item = next(deferred_spider.parse_detailed_page(detail_response))
+
+    assert deferred_item['dart_station'] is None
+    assert 'schools_closest' not in deferred_item
+    assert deferred_spider.enrich_batch([deferred_item]) == [inline_item]
+    assert deferred_spider.enrichment_kwargs == {'poi_layers': {'schools': str(csv_path)}, 'transport_grid': None,
+                                                 'transport_cache_size': None}
+
+
+@patch('web_scraper.spiders.DaftExtractor')
+def test_daft_sale_should_cache_the_closest_stations(extractor, response, tmp_path):
+    cache_path = str(tmp_path / 'cache.json')
+    extractor.extract_geolocation.side_effect = [GEOLOCATION, GEOLOCATION]
+    spider = DaftSaleUsedSpider(transport_cache_file=cache_path)
+    spider.crawler = MagicMock()
+
+    first_results = [value for value in spider.parse_detailed_page(response)]
+    second_results = [value for value in spider.parse_detailed_page(response)]
+    spider.closed('finished')
+
+    assert first_results == second_results
+    spider.crawler.stats.set_value.assert_has_calls([call('public_transport_cache/hits', 1),
+                                                     call('public_transport_cache/misses', 1)])
+    assert len(DaftSaleUsedSpider(transport_cache_file=cache_path).transport_cache) == 1
+
+
+@pytest.mark.parametrize('raw_value, expected_value', [
+    ('1,045 Properties for Sale in Ireland', 1045),
+    ('12 Properties for Sale in Dublin 4', 12),
+    ('Properties for Sale', None),
+    (None, None),
+])
+def test_daft_extractor_should_extract_results_count(raw_value, expected_value):
+    _assert_parsed_by_extractor(DaftExtractor.extract_results_count, RESULTS_COUNT_SELECTOR, raw_value, expected_value)
+
+
 def test_daft_extractor_should_extract_property_type():
     _assert_parsed_by_extractor(DaftExtractor.extract_property_type, PROPERTY_TYPE_SELECTOR,
                                 PROPERTY_TYPE_RAW, PROPERTY_TYPE)
@@ -417,6 +989,20 @@ def _assert_parsed_by_extractor(extractor, selector, raw_value, expected_value,
     response.css.assert_called_once_with(selector)
 
 
+def _list_response(properties, results_count_text=None, meta=None):
+    mock_list_response = MagicMock()
+    mock_list_response.meta = meta or {}
+    selectors = {PROPERTY_CARD_SELECTOR: properties, RESULTS_COUNT_SELECTOR: MagicMock()}
+    selectors[RESULTS_COUNT_SELECTOR].get.return_value = results_count_text
+    mock_list_response.css.side_effect = lambda selector: selectors[selector]
+    return mock_list_response
+
+
+def _html_list_response(html):
+    list_url = DAFT_ADDRESS + PROPERTIES_FOR_SALE
+    return HtmlResponse(list_url, body=html.encode(), encoding='utf-8', request=Request(list_url))
+
+
 def _get_results_from_parsing_response(daft_sale_used, mock_list_response):
     detailed_request_generator = daft_sale_used.parse(mock_list_response)
     results = [value for value in detailed_request_generator]
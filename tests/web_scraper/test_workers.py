@@ -0,0 +1,159 @@
+import json
+import queue
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+from scrapy import Spider
+from scrapy.settings import Settings
+
+from web_scraper import workers
+from web_scraper.enrichment import ENRICHMENT_PIPELINE, ENRICHMENT_PIPELINE_ORDER
+from web_scraper.pipelines import OUTPUT_PATH_SETTING, OUTPUT_FORMAT_SETTING, JSON_LINES_FORMAT
+from web_scraper.search_bands import SHARD_OPEN_PRICE_LIMIT
+from web_scraper.workers import ShardedCrawl, WorkerQueuePipeline, shard_spider_kwargs, ITEMS_MESSAGE, \
+    STATS_MESSAGE
+
+SPIDER_KWARGS = {'locations': ['area1'], 'min_price': None, 'max_price': None, 'cards_only': True}
+
+
+class InlineProcess:
+    def __init__(self, target, args, name):
+        self.target = target
+        self.args = args
+        self.exitcode = None
+
+    def start(self):
+        self.target(*self.args)
+        self.exitcode = 0
+
+    def join(self):
+        pass
+
+
+class InlineContext:
+    Process = InlineProcess
+
+    @staticmethod
+    def Queue():
+        return queue.Queue()
+
+
+def test_shard_spider_kwargs_should_shard_by_location():
+    shards = shard_spider_kwargs(dict(SPIDER_KWARGS, locations=['area1', 'area2', 'area3']), 2)
+
+    assert [shard['locations'] for shard in shards] == [['area1', 'area3'], ['area2']]
+    assert all(shard['cards_only'] for shard in shards)
+
+
+def test_shard_spider_kwargs_should_not_create_more_shards_than_locations():
+    assert len(shard_spider_kwargs(dict(SPIDER_KWARGS, locations=['area1', 'area2']), 8)) == 2
+
+
+def test_shard_spider_kwargs_should_shard_a_single_location_by_price():
+    shards = shard_spider_kwargs(dict(SPIDER_KWARGS, min_price=100000, max_price=399999), 3)
+
+    assert [(shard['min_price'], shard['max_price']) for shard in shards] == [
+        (100000, 199999), (200000, 299999), (300000, 399999)]
+
+
+def test_shard_spider_kwargs_should_keep_the_open_prices_on_their_own_shard():
+    shards = shard_spider_kwargs(SPIDER_KWARGS, 3)
+
+    assert [(shard['min_price'], shard['max_price']) for shard in shards] == [
+        (0, SHARD_OPEN_PRICE_LIMIT // 2 - 1), (SHARD_OPEN_PRICE_LIMIT // 2, SHARD_OPEN_PRICE_LIMIT - 1),
+        (SHARD_OPEN_PRICE_LIMIT, None)]
+
+
+def test_worker_queue_pipeline_should_send_the_items_in_batches():
+    worker_queue = queue.Queue()
+    pipeline = WorkerQueuePipeline(batch_size=2)
+
+    with patch('web_scraper.workers._worker_queue', worker_queue):
+        for index in range(3):
+            pipeline.process_item({'link': index}, Mock(Spider))
+        pipeline.close_spider(Mock(Spider))
+
+    assert worker_queue.get_nowait() == (ITEMS_MESSAGE, [{'link': 0}, {'link': 1}])
+    assert worker_queue.get_nowait() == (ITEMS_MESSAGE, [{'link': 2}])
+    assert worker_queue.empty()
+
+
+def _fake_worker(settings, spider_kwargs, worker_queue):
+    worker_queue.put((ITEMS_MESSAGE, [{'link': location} for location in spider_kwargs['locations']]))
+    worker_queue.put((STATS_MESSAGE, {'item_scraped_count': len(spider_kwargs['locations']), 'finish_reason': 'ok'}))
+
+
+@patch('web_scraper.workers.run_worker', _fake_worker)
+@patch('web_scraper.workers.multiprocessing.get_context', Mock(return_value=InlineContext))
+def test_sharded_crawl_should_merge_the_items_and_stats_of_the_workers(tmp_path):
+    output = str(tmp_path / 'data.jl')
+    crawler = Mock(settings=Settings({OUTPUT_PATH_SETTING: output, OUTPUT_FORMAT_SETTING: JSON_LINES_FORMAT}))
+    sharded_crawl = ShardedCrawl(crawler, {}, dict(SPIDER_KWARGS, locations=['area1', 'area2', 'area3']), 2)
+
+    sharded_crawl.run()
+
+    with open(output) as output_file:
+        assert sorted(json.loads(line)['link'] for line in output_file) == ['area1', 'area2', 'area3']
+    assert sharded_crawl.stats == {'workers/count': 2, 'workers/failed': 0, 'workers/items_written': 3,
+                                   'item_scraped_count': 3}
+
+
+def test_sharded_crawl_should_keep_the_slowest_quantiles_of_the_workers():
+    sharded_crawl = ShardedCrawl(Mock(), {}, dict(SPIDER_KWARGS, locations=['area1', 'area2']), 2)
+    sharded_crawl.worker_stats = [{'timing/parse/count': 2, 'timing/parse/p99_s': 0.5},
+                                  {'timing/parse/count': 3, 'timing/parse/p99_s': 0.25}]
+
+    assert sharded_crawl.stats['timing/parse/count'] == 5
+    assert sharded_crawl.stats['timing/parse/p99_s'] == 0.5
+
+
+def test_sharded_crawl_should_keep_the_whole_crawl_stats_of_the_first_and_last_workers():
+    sharded_crawl = ShardedCrawl(Mock(), {}, dict(SPIDER_KWARGS, locations=['area1', 'area2']), 2)
+    sharded_crawl.worker_stats = [
+        {'start_time': datetime(2020, 5, 1, 10, 0, 5), 'finish_time': datetime(2020, 5, 1, 10, 30),
+         'elapsed_time_seconds': 1795.0, 'memusage/max': 200, 'memusage/startup': 90},
+        {'start_time': datetime(2020, 5, 1, 10, 0, 0), 'finish_time': datetime(2020, 5, 1, 10, 20),
+         'elapsed_time_seconds': 1200.0, 'memusage/max': 300, 'memusage/startup': 80}]
+
+    stats = sharded_crawl.stats
+
+    assert (stats['start_time'], stats['finish_time']) == (datetime(2020, 5, 1, 10, 0, 0),
+                                                           datetime(2020, 5, 1, 10, 30))
+    assert (stats['elapsed_time_seconds'], stats['memusage/max'], stats['memusage/startup']) == (1795.0, 300, 90)
+
+
+@patch('web_scraper.workers.multiprocessing.get_context', Mock(return_value=InlineContext))
+def test_sharded_crawl_should_send_the_items_of_the_workers_to_the_parent(tmp_path):
+    worker_settings = []
+
+    def recording_worker(settings, spider_kwargs, worker_queue):
+        worker_settings.append(settings)
+        worker_queue.put((STATS_MESSAGE, {}))
+
+    crawler = Mock(settings=Settings({OUTPUT_PATH_SETTING: str(tmp_path / 'data.jl'),
+                                      OUTPUT_FORMAT_SETTING: JSON_LINES_FORMAT}))
+    with patch('web_scraper.workers.run_worker', recording_worker):
+        ShardedCrawl(crawler, {'ITEM_PIPELINES': {'web_scraper.pipelines.JsonWriterPipeline': 250,
+                                                  ENRICHMENT_PIPELINE: ENRICHMENT_PIPELINE_ORDER}},
+                     SPIDER_KWARGS, 1).run()
+
+    # the other pipelines still run on the workers, only the output one is replaced
+    assert worker_settings == [{'ITEM_PIPELINES': {ENRICHMENT_PIPELINE: ENRICHMENT_PIPELINE_ORDER,
+                                                   workers.WORKER_PIPELINE: workers.WORKER_PIPELINE_ORDER},
+                                'TELNETCONSOLE_ENABLED': False}]
+
+
+@patch('web_scraper.workers.multiprocessing.get_context', Mock(return_value=InlineContext))
+def test_sharded_crawl_should_archive_the_pages_of_every_worker_apart(tmp_path):
+    worker_kwargs = []
+
+    def recording_worker(settings, spider_kwargs, worker_queue):
+        worker_kwargs.append(spider_kwargs)
+        worker_queue.put((STATS_MESSAGE, {}))
+
+    crawler = Mock(settings=Settings({OUTPUT_PATH_SETTING: str(tmp_path / 'data.jl'),
+                                      OUTPUT_FORMAT_SETTING: JSON_LINES_FORMAT}))
+    with patch('web_scraper.workers.run_worker', recording_worker):
+        ShardedCrawl(crawler, {}, dict(SPIDER_KWARGS, locations=['area1', 'area2'], html_archive='archive'), 2).run()
+
+    assert [kwargs['html_archive_writer'] for kwargs in worker_kwargs] == ['worker0', 'worker1']
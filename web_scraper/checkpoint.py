@@ -0,0 +1,76 @@
+import json
+import os
+from typing import Any, Dict, Optional, Set
+
+DEFAULT_CHECKPOINT_INTERVAL_S = 60.0
+CHECKPOINT_FILE = 'checkpoint.json'
+CHECKPOINT_VERSION = 1
+
+
+class CrawlCheckpoint:
+    # Keeps the requests that were scheduled but not completed, the properties already written and the state of the
+    # outputs at that moment, so a resumed crawl truncates the outputs and continues without duplicates or gaps
+
+    def __init__(self, directory: str, resume: bool = False) -> None:
+        self.directory = directory
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.completed: Set[str] = set()
+        self.saves = 0
+        self._outputs: Dict[str, Any] = {}
+        self._output_states: Dict[str, Any] = {}
+        os.makedirs(directory, exist_ok=True)
+        self.resumed = resume and self._load()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, CHECKPOINT_FILE)
+
+    def add_pending(self, url: str, callback: str, meta: Dict[str, Any]) -> None:
+        self.pending[url] = {'callback': callback, 'meta': meta}
+
+    def complete_pending(self, url: str) -> None:
+        self.pending.pop(url, None)
+
+    def mark_completed(self, link: str) -> None:
+        self.completed.add(link)
+        self.pending.pop(link, None)
+
+    def register_output(self, name: str, output: Any) -> Optional[Dict[str, Any]]:
+        self._outputs[name] = output
+        return self._output_states.get(name) if self.resumed else None
+
+    def save(self) -> None:
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'outputs': {name: output.checkpoint_state() for name, output in self._outputs.items()},
+            'pending': self.pending,
+            'completed': sorted(self.completed),
+        }
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, self.path)
+        self.saves += 1
+
+    def finish(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path):
+            print(f"There is no checkpoint on '{self.directory}', starting from the beginning")
+            return False
+
+        with open(self.path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"The checkpoint '{self.path}' has an unknown version: {checkpoint.get('version')}")
+
+        self.pending = checkpoint['pending']
+        self.completed = set(checkpoint['completed'])
+        self._output_states = checkpoint['outputs']
+        print(f"Resuming from '{self.path}': {len(self.pending)} pending requests,"
+              f" {len(self.completed)} completed properties")
+        return True
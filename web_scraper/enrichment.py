@@ -0,0 +1,148 @@
+import multiprocessing
+from time import perf_counter
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List, Optional, Set, Tuple
+
+from scrapy import Spider
+from scrapy.crawler import Crawler
+from twisted.internet.defer import Deferred, DeferredList
+
+from .spiders import DaftSaleUsedSpider, init_pool_spider, pool_spider
+
+ENRICHMENT_PIPELINE = 'web_scraper.enrichment.EnrichmentPipeline'
+# before the output pipelines
+ENRICHMENT_PIPELINE_ORDER = 100
+
+ENRICHMENT_POOL_SETTING = 'WEB_SCRAPER_ENRICHMENT_POOL'
+ENRICHMENT_WORKERS_SETTING = 'WEB_SCRAPER_ENRICHMENT_WORKERS'
+ENRICHMENT_BATCH_SIZE_SETTING = 'WEB_SCRAPER_ENRICHMENT_BATCH_SIZE'
+ENRICHMENT_MAX_DELAY_SETTING = 'WEB_SCRAPER_ENRICHMENT_MAX_DELAY'
+
+THREAD_POOL = 'thread'
+PROCESS_POOL = 'process'
+ENRICHMENT_POOLS = (THREAD_POOL, PROCESS_POOL)
+
+DEFAULT_ENRICHMENT_WORKERS = 1
+DEFAULT_ENRICHMENT_BATCH_SIZE = 50
+DEFAULT_ENRICHMENT_MAX_DELAY_S = 0.2
+
+def enrich_items(items: List[Any]) -> List[Any]:
+    return pool_spider().enrich_batch(items)
+
+
+class EnrichmentPipeline:
+    # Adds the transport and points of interest fields out of the reactor thread. The items are collected in
+    # batches of batch_size, or whatever arrived in max_delay seconds, and every batch is enriched on the pool while
+    # the crawl goes on. Only used when the spider defers its enrichment
+
+    def __init__(self, pool: str = THREAD_POOL, workers: int = DEFAULT_ENRICHMENT_WORKERS,
+                 batch_size: int = DEFAULT_ENRICHMENT_BATCH_SIZE, max_delay: float = DEFAULT_ENRICHMENT_MAX_DELAY_S,
+                 stats: Any = None) -> None:
+        if pool not in ENRICHMENT_POOLS:
+            raise ValueError(f"Unknown enrichment pool '{pool}', expected one of {ENRICHMENT_POOLS}")
+        self.pool = pool
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.stats = stats
+        self.batches = 0
+        self._spider: Optional[DaftSaleUsedSpider] = None
+        self._executor: Optional[Executor] = None
+        self._batch: List[Tuple[Any, Deferred]] = []
+        self._delayed_flush: Any = None
+        self._running: Set[Deferred] = set()
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> 'EnrichmentPipeline':
+        settings = crawler.settings
+        return cls(settings.get(ENRICHMENT_POOL_SETTING, THREAD_POOL),
+                   settings.getint(ENRICHMENT_WORKERS_SETTING, DEFAULT_ENRICHMENT_WORKERS),
+                   settings.getint(ENRICHMENT_BATCH_SIZE_SETTING, DEFAULT_ENRICHMENT_BATCH_SIZE),
+                   settings.getfloat(ENRICHMENT_MAX_DELAY_SETTING, DEFAULT_ENRICHMENT_MAX_DELAY_S),
+                   crawler.stats)
+
+    def open_spider(self, spider: Spider) -> None:
+        if not getattr(spider, 'defer_enrichment', False):
+            return
+
+        self._spider = spider
+        if self.pool == PROCESS_POOL:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=init_pool_spider,
+                                                 initargs=(spider.enrichment_kwargs,))
+        else:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='web-scraper-enrichment')
+
+    def process_item(self, item: Any, spider: Spider) -> Any:
+        if not self._executor:
+            return item
+
+        item_deferred: Deferred = Deferred()
+        self._batch.append((item, item_deferred))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+        elif self._delayed_flush is None:
+            from twisted.internet import reactor
+            self._delayed_flush = reactor.callLater(self.max_delay, self._flush)
+        return item_deferred
+
+    def close_spider(self, spider: Spider) -> Optional[Deferred]:
+        if not self._executor:
+            return None
+
+        self._flush()
+        finished = DeferredList(list(self._running))
+        finished.addBoth(self._shutdown)
+        return finished
+
+    def _flush(self) -> None:
+        if self._delayed_flush is not None:
+            if self._delayed_flush.active():
+                self._delayed_flush.cancel()
+            self._delayed_flush = None
+        if not self._batch or not self._executor or not self._spider:
+            return
+
+        batch, self._batch = self._batch, []
+        items = [item for item, _ in batch]
+        if self.pool == PROCESS_POOL:
+            future = self._executor.submit(enrich_items, items)
+        else:
+            future = self._executor.submit(self._spider.enrich_batch, items)
+
+        batch_deferred: Deferred = Deferred()
+        self._running.add(batch_deferred)
+        submitted = perf_counter()
+
+        def batch_done(done_future: Future) -> None:
+            from twisted.internet import reactor
+            reactor.callFromThread(self._batch_done, done_future, batch, batch_deferred, perf_counter() - submitted)
+
+        future.add_done_callback(batch_done)
+
+    def _batch_done(self, future: Future, batch: List[Tuple[Any, Deferred]], batch_deferred: Deferred,
+                    elapsed: float) -> None:
+        self._running.discard(batch_deferred)
+        self.batches += 1
+        if self._spider:
+            # from its submission, so the time waiting for a busy pool is included
+            self._spider.timings.observe('enrichment/batch', elapsed)
+        error = future.exception()
+        if error is not None:
+            for _, item_deferred in batch:
+                item_deferred.errback(error)
+        else:
+            # the process pool sends back copies of the items
+            for (_, item_deferred), enriched_item in zip(batch, future.result()):
+                item_deferred.callback(enriched_item)
+            if self.stats:
+                self.stats.inc_value('enrichment/items', len(batch))
+        if self.stats:
+            self.stats.inc_value('enrichment/batches')
+        batch_deferred.callback(None)
+
+    def _shutdown(self, result: Any) -> Any:
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return result
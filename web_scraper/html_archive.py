@@ -0,0 +1,116 @@
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, Generator, List, Optional, BinaryIO, IO
+
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024
+DEFAULT_ARCHIVE_COMPRESSION_LEVEL = 6
+SEGMENT_PREFIX = 'archive-'
+SEGMENT_EXTENSION = '.zz'
+INDEX_FILE = 'index.jl'
+INDEX_PREFIX = 'index-'
+INDEX_EXTENSION = '.jl'
+
+
+class HtmlArchiveWriter:
+    # Appends every page, zlib compressed, to "archive-<segment>.zz" and its position to "index.jl". Every crawl
+    # starts a new segment, so the segments of the previous crawls are never written again. The writers of the
+    # processes crawling together have their own segments and index, "archive-<writer>-<segment>.zz" and
+    # "index-<writer>.jl", as they can not append to the same files
+
+    def __init__(self, directory: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 compression_level: int = DEFAULT_ARCHIVE_COMPRESSION_LEVEL, writer: Optional[str] = None) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.compression_level = compression_level
+        self.writer = writer
+        self.pages = 0
+        os.makedirs(directory, exist_ok=True)
+        self._segment_index = len(HtmlArchiveWriter._segment_names(directory))
+        self._segment: Optional[BinaryIO] = None
+        index_file = f'{INDEX_PREFIX}{writer}{INDEX_EXTENSION}' if writer else INDEX_FILE
+        self._index: Optional[IO[str]] = open(os.path.join(directory, index_file), 'a')
+
+    def add(self, url: str, body: bytes, status: int = 200) -> None:
+        if not self._index:
+            raise RuntimeError(f"The archive '{self.directory}' is closed")
+
+        segment = self._segment or self._open_segment()
+        record = zlib.compress(body, self.compression_level)
+        offset = segment.tell()
+        segment.write(record)
+        # the record is on disk before the index points to it
+        segment.flush()
+        self._index.write(json.dumps({
+            'url': url,
+            'status': status,
+            'segment': os.path.basename(segment.name),
+            'offset': offset,
+            'length': len(record),
+            'archived_at': time.time(),
+        }) + '\n')
+        self._index.flush()
+        self.pages += 1
+
+        if segment.tell() >= self.segment_bytes:
+            segment.close()
+            self._segment = None
+
+    def close(self) -> None:
+        if self._segment:
+            self._segment.close()
+            self._segment = None
+        if self._index:
+            self._index.close()
+            self._index = None
+
+    def _open_segment(self) -> BinaryIO:
+        writer_prefix = f'{self.writer}-' if self.writer else ''
+        segment_path = os.path.join(self.directory,
+                                    f'{SEGMENT_PREFIX}{writer_prefix}{self._segment_index:05d}{SEGMENT_EXTENSION}')
+        self._segment_index += 1
+        self._segment = open(segment_path, 'ab')
+        return self._segment
+
+    @staticmethod
+    def _segment_names(directory: str) -> List[str]:
+        return sorted(file_name for file_name in os.listdir(directory)
+                      if file_name.startswith(SEGMENT_PREFIX) and file_name.endswith(SEGMENT_EXTENSION))
+
+
+class HtmlArchiveReader:
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._segments: Dict[str, BinaryIO] = {}
+
+    def entries(self) -> Generator[Dict[str, Any], None, None]:
+        # the pages of the single process crawls, then the ones of every writer of the crawls with workers
+        for index_name in HtmlArchiveReader._index_names(self.directory):
+            with open(os.path.join(self.directory, index_name)) as index_file:
+                for line in index_file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # the last line of an interrupted crawl can be incomplete
+                        continue
+
+    def read(self, entry: Dict[str, Any]) -> bytes:
+        segment = self._segments.get(entry['segment'])
+        if not segment:
+            segment = open(os.path.join(self.directory, entry['segment']), 'rb')
+            self._segments[entry['segment']] = segment
+        segment.seek(entry['offset'])
+        return zlib.decompress(segment.read(entry['length']))
+
+    def close(self) -> None:
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+
+    @staticmethod
+    def _index_names(directory: str) -> List[str]:
+        writer_index_names = sorted(file_name for file_name in os.listdir(directory)
+                                    if file_name.startswith(INDEX_PREFIX) and file_name.endswith(INDEX_EXTENSION))
+        return ([INDEX_FILE] if os.path.exists(os.path.join(directory, INDEX_FILE)) else []) + writer_index_names
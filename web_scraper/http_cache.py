@@ -0,0 +1,85 @@
+from time import time
+from typing import Any, Union, Optional
+
+from scrapy import Request
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.extensions.httpcache import RFC2616Policy, rfc1123_to_epoch
+from scrapy.http import Response
+from scrapy.settings import Settings
+
+from .spiders import PROPERTIES_FOR_SALE
+
+LISTING_TTL_SETTING = 'WEB_SCRAPER_HTTPCACHE_LISTING_TTL'
+DETAIL_TTL_SETTING = 'WEB_SCRAPER_HTTPCACHE_DETAIL_TTL'
+
+DEFAULT_LISTING_TTL_S = 3600.0
+DEFAULT_DETAIL_TTL_S = 24 * 3600.0
+
+BYTES_SAVED_STAT = 'httpcache/bytes_saved'
+# stored with the cached pages, the Date of the server can be missing or wrong
+CACHED_AT_HEADER = 'X-Web-Scraper-Cached-At'
+
+
+def is_listing_request(request: Request) -> bool:
+    return PROPERTIES_FOR_SALE in request.url
+
+
+class DaftCachePolicy(RFC2616Policy):  # type: ignore
+    # The search results change much more often than the properties, so every kind of page has its own TTL, counted
+    # from the time the page was cached. Once it expires the page is revalidated with its ETag or Last-Modified, when
+    # the server sent them
+
+    def __init__(self, settings: Settings) -> None:
+        super(DaftCachePolicy, self).__init__(settings)
+        self.listing_ttl = settings.getfloat(LISTING_TTL_SETTING, DEFAULT_LISTING_TTL_S)
+        self.detail_ttl = settings.getfloat(DETAIL_TTL_SETTING, DEFAULT_DETAIL_TTL_S)
+
+    def should_cache_response(self, response: Response, request: Request) -> bool:
+        # the pages are cached even without expiration or validators, the TTLs decide when they are requested again
+        should_cache = response.status == 200 or \
+            bool(super(DaftCachePolicy, self).should_cache_response(response, request))
+        if should_cache:
+            # called right before storing the page, also when a revalidated one is stored again
+            response.headers[CACHED_AT_HEADER] = str(time())
+        return should_cache
+
+    def is_cached_response_fresh(self, cachedresponse: Response, request: Request) -> bool:
+        ttl = self.listing_ttl if is_listing_request(request) else self.detail_ttl
+        cached_at = DaftCachePolicy._cached_at(cachedresponse, request)
+        if cached_at is not None and time() - cached_at < ttl:
+            return True
+
+        DaftCachePolicy._set_validators(request, cachedresponse)
+        return False
+
+    @staticmethod
+    def _cached_at(cachedresponse: Response, request: Request) -> Optional[float]:
+        # the pages cached by older versions have no timestamp of their own, a page without any is expired
+        if CACHED_AT_HEADER in cachedresponse.headers:
+            return float(cachedresponse.headers[CACHED_AT_HEADER])
+        if 'cache_timestamp' in request.meta:
+            return float(request.meta['cache_timestamp'])
+        return rfc1123_to_epoch(cachedresponse.headers.get(b'Date'))
+
+    @staticmethod
+    def _set_validators(request: Request, cachedresponse: Response) -> None:
+        if b'Last-Modified' in cachedresponse.headers:
+            request.headers[b'If-Modified-Since'] = cachedresponse.headers[b'Last-Modified']
+        if b'ETag' in cachedresponse.headers:
+            request.headers[b'If-None-Match'] = cachedresponse.headers[b'ETag']
+
+
+class DaftHttpCacheMiddleware(HttpCacheMiddleware):  # type: ignore
+
+    def process_request(self, request: Request, *args: Any) -> Optional[Response]:
+        cached_response = super(DaftHttpCacheMiddleware, self).process_request(request, *args)
+        if isinstance(cached_response, Response):
+            self.stats.inc_value(BYTES_SAVED_STAT, len(cached_response.body))
+        return cached_response
+
+    def process_response(self, request: Request, response: Response, *args: Any) -> Union[Request, Response]:
+        cached_response = request.meta.get('cached_response')
+        result = super(DaftHttpCacheMiddleware, self).process_response(request, response, *args)
+        if cached_response is not None and result is cached_response and response.status == 304:
+            self.stats.inc_value(BYTES_SAVED_STAT, len(cached_response.body) - len(response.body))
+        return result
@@ -0,0 +1,199 @@
+import json
+import math
+import sys
+from json.encoder import encode_basestring_ascii  # type: ignore
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+DAFT_PROPERTY_FIELDS: Tuple[str, ...] = (
+    'link', 'property_type', 'ber_rating', 'price', 'bedrooms', 'bathrooms', 'floor_area_m2', 'main_address', 'sector',
+    'region', 'geolocation', 'description', 'updated_at', 'views', 'green_luas_station', 'green_luas_distance_m',
+    'red_luas_station', 'red_luas_distance_m', 'dart_station', 'dart_distance_m',
+)
+# any other field, like the points of interest ones, is kept as JSON on this column
+EXTRA_FIELD = 'extra'
+CSV_COLUMNS: Tuple[str, ...] = DAFT_PROPERTY_FIELDS + (EXTRA_FIELD,)
+
+BER_RATINGS: Tuple[str, ...] = ('A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3', 'D1', 'D2', 'E1', 'E2', 'F', 'G')
+_BER_CODES = {ber_rating: code for code, ber_rating in enumerate(BER_RATINGS)}
+
+# the same few values are repeated on most of the properties, so a single copy of every one is kept
+INTERNED_FIELDS = frozenset(('property_type', 'sector', 'region', 'green_luas_station', 'red_luas_station',
+                             'dart_station'))
+
+_FIELD_NAMES = frozenset(DAFT_PROPERTY_FIELDS)
+_FIELD_VALUES = attrgetter(*DAFT_PROPERTY_FIELDS)
+_JSON_TEMPLATE = ', '.join(encode_basestring_ascii(field) + ': %s' for field in DAFT_PROPERTY_FIELDS)
+
+
+class DaftProperty(dict):
+    # A property scraped from its page. Every field has a slot instead of a dict entry and the BER rating is kept as
+    # its position on BER_RATINGS. It is a dict, so every Scrapy version accepts it as an item, but the dict itself
+    # stays empty: every method reads and updates the slots, so the pipelines handle it like the dicts of the search
+    # result cards. json.dumps skips the methods of the empty dict, to_json has to be used instead
+    __slots__ = ('link', 'property_type', '_ber_code', 'price', 'bedrooms', 'bathrooms', 'floor_area_m2',
+                 'main_address', 'sector', 'region', 'geolocation', 'description', 'updated_at', 'views',
+                 'green_luas_station', 'green_luas_distance_m', 'red_luas_station', 'red_luas_distance_m',
+                 'dart_station', 'dart_distance_m', 'extra')
+
+    link: str
+    property_type: Optional[str]
+    price: Optional[int]
+    bedrooms: Optional[int]
+    bathrooms: Optional[int]
+    floor_area_m2: Optional[float]
+    main_address: Optional[str]
+    sector: Optional[str]
+    region: Optional[str]
+    geolocation: Optional[str]
+    description: Optional[str]
+    updated_at: Optional[str]
+    views: Optional[int]
+    green_luas_station: Optional[str]
+    green_luas_distance_m: Optional[int]
+    red_luas_station: Optional[str]
+    red_luas_distance_m: Optional[int]
+    dart_station: Optional[str]
+    dart_distance_m: Optional[int]
+    extra: Optional[Dict[str, Any]]
+
+    def __init__(self, link: str, **fields: Any) -> None:
+        self.link = link
+        self.extra = None
+        for field in DAFT_PROPERTY_FIELDS[1:]:
+            self[field] = fields.pop(field, None)
+        for field, value in fields.items():
+            self[field] = value
+
+    @property
+    def ber_rating(self) -> Optional[str]:
+        ber_code = self._ber_code
+        return BER_RATINGS[ber_code] if isinstance(ber_code, int) else ber_code
+
+    @ber_rating.setter
+    def ber_rating(self, ber_rating: Optional[str]) -> None:
+        # the unknown ratings are kept as they are
+        self._ber_code = _BER_CODES.get(ber_rating, ber_rating) if ber_rating is not None else None
+
+    def __getitem__(self, field: str) -> Any:
+        if field in _FIELD_NAMES:
+            return getattr(self, field)
+        if self.extra is not None and field in self.extra:
+            return self.extra[field]
+        raise KeyError(field)
+
+    def __setitem__(self, field: str, value: Any) -> None:
+        if field in _FIELD_NAMES:
+            if field in INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, field, value)
+        elif self.extra is None:
+            self.extra = {field: value}
+        else:
+            self.extra[field] = value
+
+    def __contains__(self, field: object) -> bool:
+        return field in _FIELD_NAMES or (self.extra is not None and field in self.extra)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(DAFT_PROPERTY_FIELDS) + (len(self.extra) if self.extra else 0)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, dict):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other: object) -> bool:
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({dict(self.items())!r})'
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # the fields are set again on unpickling, the dict has none
+        return type(self), (self.link,), None, None, iter(self.items()[1:])
+
+    def __delitem__(self, field: str) -> None:
+        raise TypeError(f"The fields of a {type(self).__name__} can not be removed")
+
+    def pop(self, field: str, *default: Any) -> Any:
+        raise TypeError(f"The fields of a {type(self).__name__} can not be removed")
+
+    def popitem(self) -> Tuple[str, Any]:
+        raise TypeError(f"The fields of a {type(self).__name__} can not be removed")
+
+    def clear(self) -> None:
+        raise TypeError(f"The fields of a {type(self).__name__} can not be removed")
+
+    def copy(self) -> 'DaftProperty':
+        return DaftProperty(self.link, **dict(self.items()[1:]))
+
+    def update(self, *others: Any, **fields: Any) -> None:
+        for field, value in dict(*others, **fields).items():
+            self[field] = value
+
+    def setdefault(self, field: str, default: Any = None) -> Any:
+        if field not in self:
+            self[field] = default
+        return self[field]
+
+    def get(self, field: str, default: Any = None) -> Any:
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    # lists rather than the views of the dict, which would read its empty storage
+    def keys(self) -> List[str]:  # type: ignore
+        return list(DAFT_PROPERTY_FIELDS) + (list(self.extra) if self.extra else [])
+
+    def values(self) -> List[Any]:  # type: ignore
+        return [self[field] for field in self.keys()]
+
+    def items(self) -> List[Tuple[str, Any]]:  # type: ignore
+        return [(field, self[field]) for field in self.keys()]
+
+    def to_json(self) -> str:
+        # same output as json.dumps of the item as a dict, without building it
+        fields = _JSON_TEMPLATE % tuple([_JSON_ENCODERS.get(type(value), json.dumps)(value)
+                                         for value in _FIELD_VALUES(self)])
+        if self.extra:
+            return '{' + fields + ', ' + json.dumps(self.extra)[1:-1] + '}'
+        return '{' + fields + '}'
+
+    def to_csv_row(self) -> List[Any]:
+        row = list(_FIELD_VALUES(self))
+        row.append(json.dumps(self.extra) if self.extra else None)
+        return row
+
+
+def to_json(item: Any) -> str:
+    if isinstance(item, DaftProperty):
+        return item.to_json()
+    return json.dumps(item)
+
+
+def to_csv_row(item: Any) -> List[Any]:
+    if isinstance(item, DaftProperty):
+        return item.to_csv_row()
+    row = [item.get(field) for field in DAFT_PROPERTY_FIELDS]
+    extra = {field: value for field, value in item.items() if field not in _FIELD_NAMES}
+    row.append(json.dumps(extra) if extra else None)
+    return row
+
+
+def _json_float(value: float) -> str:
+    return float.__repr__(value) if math.isfinite(value) else json.dumps(value)
+
+
+# the types of the fields, encoded as json does. Anything else, like booleans, goes through json.dumps
+_JSON_ENCODERS: Dict[type, Callable[[Any], str]] = {
+    type(None): lambda value: 'null',
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _json_float,
+}
@@ -0,0 +1,219 @@
+import functools
+import math
+import os
+from time import perf_counter
+from typing import Any, Callable, Dict, Generator, Iterable, Optional
+
+from scrapy import Spider, signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+METRICS_EXTENSION = 'web_scraper.metrics.StageMetricsExporter'
+METRICS_EXTENSION_ORDER = 500
+
+METRICS_FILE_SETTING = 'WEB_SCRAPER_METRICS_FILE'
+METRICS_PORT_SETTING = 'WEB_SCRAPER_METRICS_PORT'
+METRICS_HOST_SETTING = 'WEB_SCRAPER_METRICS_HOST'
+METRICS_INTERVAL_SETTING = 'WEB_SCRAPER_METRICS_INTERVAL'
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+DEFAULT_METRICS_INTERVAL_S = 15.0
+
+TIMING_STATS_PREFIX = 'timing/'
+QUANTILES = (0.5, 0.95, 0.99)
+QUANTILE_STAT_SUFFIXES = tuple(f'/p{round(quantile * 100)}_s' for quantile in QUANTILES)
+
+# buckets from 1us, 8 per doubling, so every one is ~9% wide
+HISTOGRAM_MIN_S = 1e-6
+HISTOGRAM_BUCKETS_PER_DOUBLING = 8
+
+PROMETHEUS_CONTENT_TYPE = b'text/plain; version=0.0.4; charset=utf-8'
+PROMETHEUS_STAGE_METRIC = 'web_scraper_stage_seconds'
+PROMETHEUS_STAT_METRIC = 'web_scraper_crawl_stat'
+
+
+class StageHistogram:
+    # Durations counted on logarithmic buckets, so the quantiles are estimated within a bucket width with constant
+    # memory however many durations are observed
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets: Dict[int, int] = {}
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = int(math.log2(seconds / HISTOGRAM_MIN_S) * HISTOGRAM_BUCKETS_PER_DOUBLING) + 1 \
+            if seconds > HISTOGRAM_MIN_S else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def quantile(self, quantile: float) -> float:
+        rank = quantile * self.count
+        observed = 0
+        for bucket in sorted(self.buckets):
+            observed += self.buckets[bucket]
+            if observed >= rank:
+                # the upper bound of the bucket, never over the slowest duration
+                return min(self.max, HISTOGRAM_MIN_S * 2 ** (bucket / HISTOGRAM_BUCKETS_PER_DOUBLING))
+        return self.max
+
+
+class StageTimings:
+    # Histograms of the time spent on every stage of the crawl: the downloads, the parsing, every extracted field,
+    # the enrichment and the pipelines
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageHistogram] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = StageHistogram()
+        histogram.observe(seconds)
+
+    def timed(self, stage: str, iterable: Iterable[Any]) -> Generator[Any, None, None]:
+        # only the time spent producing the values, not the one of whoever consumes them
+        elapsed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += perf_counter() - start
+                yield value
+        finally:
+            self.observe(stage, elapsed)
+
+    def publish(self, stats: Any) -> None:
+        for stage, histogram in self.stages.items():
+            stats.set_value(f'{TIMING_STATS_PREFIX}{stage}/count', histogram.count)
+            stats.set_value(f'{TIMING_STATS_PREFIX}{stage}/total_s', histogram.total)
+            for quantile, suffix in zip(QUANTILES, QUANTILE_STAT_SUFFIXES):
+                stats.set_value(f'{TIMING_STATS_PREFIX}{stage}{suffix}', histogram.quantile(quantile))
+
+
+def timed_process_item(process_item: Callable[..., Any]) -> Callable[..., Any]:
+    # times the process_item of a pipeline on the timings of the spider
+    @functools.wraps(process_item)
+    def timed(pipeline: Any, item: Any, spider: Spider) -> Any:
+        start = perf_counter()
+        try:
+            return process_item(pipeline, item, spider)
+        finally:
+            timings = getattr(spider, 'timings', None)
+            if timings is not None:
+                timings.observe(f'process_item/{type(pipeline).__name__}', perf_counter() - start)
+    return timed
+
+
+def to_prometheus(timings: StageTimings, stats: Dict[str, Any]) -> str:
+    lines = [f'# HELP {PROMETHEUS_STAGE_METRIC} Time spent on every stage of the crawl.',
+             f'# TYPE {PROMETHEUS_STAGE_METRIC} summary']
+    for stage, histogram in sorted(timings.stages.items()):
+        label = _label_value(stage)
+        for quantile in QUANTILES:
+            lines.append(f'{PROMETHEUS_STAGE_METRIC}{{stage="{label}",quantile="{quantile}"}} '
+                         f'{histogram.quantile(quantile)!r}')
+        lines.append(f'{PROMETHEUS_STAGE_METRIC}_sum{{stage="{label}"}} {histogram.total!r}')
+        lines.append(f'{PROMETHEUS_STAGE_METRIC}_count{{stage="{label}"}} {histogram.count}')
+
+    lines += [f'# HELP {PROMETHEUS_STAT_METRIC} Numeric stats of the crawl.',
+              f'# TYPE {PROMETHEUS_STAT_METRIC} gauge']
+    for name, value in sorted(stats.items()):
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and not name.startswith(TIMING_STATS_PREFIX):
+            lines.append(f'{PROMETHEUS_STAT_METRIC}{{name="{_label_value(name)}"}} {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def _label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, exporter: 'StageMetricsExporter') -> None:
+        super().__init__()
+        self.exporter = exporter
+
+    def render_GET(self, request: Any) -> bytes:
+        request.setHeader(b'Content-Type', PROMETHEUS_CONTENT_TYPE)
+        return self.exporter.render().encode()
+
+
+class StageMetricsExporter:
+    # Publishes the stage timings of the spider on the crawl stats and exports them, with the numeric stats, in the
+    # Prometheus text format: every interval seconds to a file, written atomically for the node exporter textfile
+    # collector, and on an HTTP endpoint, rendered on every scrape
+
+    def __init__(self, stats: Any, metrics_file: Optional[str] = None, metrics_port: Optional[int] = None,
+                 metrics_host: str = DEFAULT_METRICS_HOST, interval: float = DEFAULT_METRICS_INTERVAL_S) -> None:
+        self.stats = stats
+        self.metrics_file = metrics_file
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.interval = interval
+        self.timings = StageTimings()
+        self.exports = 0
+        self.listening_port: Any = None
+        self._export_loop: Optional[task.LoopingCall] = None
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> 'StageMetricsExporter':
+        settings = crawler.settings
+        metrics_port = settings.get(METRICS_PORT_SETTING)
+        if not settings.get(METRICS_FILE_SETTING) and metrics_port is None:
+            raise NotConfigured('Neither a metrics file nor a metrics port were configured')
+        exporter = cls(crawler.stats, settings.get(METRICS_FILE_SETTING),
+                       None if metrics_port is None else int(metrics_port),
+                       settings.get(METRICS_HOST_SETTING, DEFAULT_METRICS_HOST),
+                       settings.getfloat(METRICS_INTERVAL_SETTING, DEFAULT_METRICS_INTERVAL_S))
+        crawler.signals.connect(exporter.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(exporter.spider_closed, signal=signals.spider_closed)
+        return exporter
+
+    def spider_opened(self, spider: Spider) -> None:
+        self.timings = getattr(spider, 'timings', None) or self.timings
+        if self.metrics_port is not None:
+            from twisted.internet import reactor
+            self.listening_port = reactor.listenTCP(self.metrics_port, Site(MetricsResource(self)),
+                                                    interface=self.metrics_host)
+        if self.metrics_file:
+            self._export_loop = task.LoopingCall(self.export)
+            self._export_loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider: Spider) -> Any:
+        if self._export_loop and self._export_loop.running:
+            self._export_loop.stop()
+        self.export()
+        if self.listening_port is not None:
+            listening_port, self.listening_port = self.listening_port, None
+            return listening_port.stopListening()
+        return None
+
+    def render(self) -> str:
+        self.timings.publish(self.stats)
+        return to_prometheus(self.timings, self.stats.get_stats())
+
+    def export(self) -> None:
+        metrics = self.render()
+        if not self.metrics_file:
+            return
+        # the collector never reads a half written file
+        partial_file = f'{self.metrics_file}.{os.getpid()}.tmp'
+        with open(partial_file, 'w') as metrics_output:
+            metrics_output.write(metrics)
+        os.replace(partial_file, self.metrics_file)
+        self.exports += 1
@@ -1,20 +1,413 @@
+import csv
+import gzip
 import json
-from typing import Any, List
+import lzma
+import os
+import sqlite3
+from typing import Any, List, Optional, IO, Dict, Tuple, BinaryIO, Union
 
 from scrapy import Spider
+from scrapy.crawler import Crawler
+
+from .items import CSV_COLUMNS, EXTRA_FIELD, to_json, to_csv_row
+from .metrics import timed_process_item
+
+OUTPUT_PATH_SETTING = 'WEB_SCRAPER_OUTPUT'
+FLUSH_INTERVAL_SETTING = 'WEB_SCRAPER_FLUSH_INTERVAL'
+OUTPUT_FORMAT_SETTING = 'WEB_SCRAPER_OUTPUT_FORMAT'
+COMPRESSION_LEVEL_SETTING = 'WEB_SCRAPER_COMPRESSION_LEVEL'
+ROTATE_ITEMS_SETTING = 'WEB_SCRAPER_ROTATE_ITEMS'
+ROTATE_BYTES_SETTING = 'WEB_SCRAPER_ROTATE_BYTES'
+BATCH_SIZE_SETTING = 'WEB_SCRAPER_BATCH_SIZE'
+
+DEFAULT_JSON_OUTPUT = '/tmp/data.json'
+DEFAULT_JSON_LINES_OUTPUT = '/tmp/data.jl'
+DEFAULT_COMPRESSED_OUTPUT = '/tmp/data'
+DEFAULT_SQLITE_OUTPUT = '/tmp/data.sqlite'
+DEFAULT_CSV_OUTPUT = '/tmp/data.csv'
+DEFAULT_FLUSH_INTERVAL = 100
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_COMPRESSION_LEVEL = 6
+DEFAULT_ROTATE_ITEMS = 0
+DEFAULT_ROTATE_BYTES = 128 * 1024 * 1024
+DEFAULT_BATCH_SIZE = 500
+
+JSON_FORMAT = 'json'
+JSON_LINES_FORMAT = 'jsonl'
+JSON_LINES_GZIP_FORMAT = 'jsonl.gz'
+JSON_LINES_LZMA_FORMAT = 'jsonl.xz'
+SQLITE_FORMAT = 'sqlite'
+CSV_FORMAT = 'csv'
+
+SEGMENT_EXTENSIONS = {
+    JSON_LINES_GZIP_FORMAT: '.jl.gz',
+    JSON_LINES_LZMA_FORMAT: '.jl.xz',
+}
+MANIFEST_EXTENSION = '.manifest.json'
+
+SQLITE_TABLE = 'properties'
+SQLITE_KEY_COLUMN = 'link'
+SQLITE_EXTRA_COLUMN = EXTRA_FIELD
+SQLITE_COLUMNS: List[Tuple[str, str]] = [
+    (SQLITE_KEY_COLUMN, 'TEXT PRIMARY KEY'),
+    ('property_type', 'TEXT'),
+    ('ber_rating', 'TEXT'),
+    ('price', 'INTEGER'),
+    ('bedrooms', 'INTEGER'),
+    ('bathrooms', 'INTEGER'),
+    ('floor_area_m2', 'REAL'),
+    ('main_address', 'TEXT'),
+    ('sector', 'TEXT'),
+    ('region', 'TEXT'),
+    ('geolocation', 'TEXT'),
+    ('description', 'TEXT'),
+    ('updated_at', 'TEXT'),
+    ('views', 'INTEGER'),
+    ('green_luas_station', 'TEXT'),
+    ('green_luas_distance_m', 'INTEGER'),
+    ('red_luas_station', 'TEXT'),
+    ('red_luas_distance_m', 'INTEGER'),
+    ('dart_station', 'TEXT'),
+    ('dart_distance_m', 'INTEGER'),
+    (SQLITE_EXTRA_COLUMN, 'TEXT'),
+]
+SQLITE_COLUMN_NAMES = [column for column, _ in SQLITE_COLUMNS]
+SQLITE_INDEXED_COLUMNS = ['price', 'bedrooms', 'region', 'green_luas_distance_m', 'red_luas_distance_m',
+                          'dart_distance_m']
+
+# output format -> (pipeline, default output path)
+OUTPUT_PIPELINES: Dict[str, Tuple[str, str]] = {
+    JSON_LINES_FORMAT: ('web_scraper.pipelines.JsonLinesWriterPipeline', DEFAULT_JSON_LINES_OUTPUT),
+    JSON_FORMAT: ('web_scraper.pipelines.JsonWriterPipeline', DEFAULT_JSON_OUTPUT),
+    JSON_LINES_GZIP_FORMAT: ('web_scraper.pipelines.CompressedJsonLinesWriterPipeline', DEFAULT_COMPRESSED_OUTPUT),
+    JSON_LINES_LZMA_FORMAT: ('web_scraper.pipelines.CompressedJsonLinesWriterPipeline', DEFAULT_COMPRESSED_OUTPUT),
+    SQLITE_FORMAT: ('web_scraper.pipelines.SqliteWriterPipeline', DEFAULT_SQLITE_OUTPUT),
+    CSV_FORMAT: ('web_scraper.pipelines.CsvWriterPipeline', DEFAULT_CSV_OUTPUT),
+}
+
+
+def _register_checkpoint_output(spider: Spider, output: Any) -> Optional[Dict[str, Any]]:
+    checkpoint = getattr(spider, 'checkpoint', None)
+    if not checkpoint:
+        return None
+    return checkpoint.register_output(type(output).__name__, output)
 
 
 class JsonWriterPipeline:
-    def __init__(self) -> None:
+    def __init__(self, output_path: str = DEFAULT_JSON_OUTPUT) -> None:
+        self.output_path = output_path
         self.data: List[Any] = []
 
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> 'JsonWriterPipeline':
+        return cls(crawler.settings.get(OUTPUT_PATH_SETTING, DEFAULT_JSON_OUTPUT))
+
     def open_spider(self, spider: Spider) -> None:
         self.data = []
 
     def close_spider(self, spider: Spider) -> None:
-        with open('/tmp/data.json', 'w') as outfile:
-            outfile.write(json.dumps(self.data))
+        with open(self.output_path, 'w') as outfile:
+            outfile.write('[' + ', '.join(to_json(item) for item in self.data) + ']')
 
+    @timed_process_item
     def process_item(self, item: Any, spider: Spider) -> Any:
         self.data.append(item)
         return item
+
+
+class TextFileWriterPipeline:
+    # Writes the items to a single text file as they are scraped, on resume the file is truncated back to the size it
+    # had on the checkpoint
+    default_output_path = DEFAULT_JSON_LINES_OUTPUT
+    newline: Optional[str] = None
+
+    def __init__(self, output_path: Optional[str] = None, flush_interval: int = DEFAULT_FLUSH_INTERVAL) -> None:
+        self.output_path = output_path or self.default_output_path
+        self.flush_interval = flush_interval
+        self.items_written = 0
+        self._file: Optional[IO[str]] = None
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> 'TextFileWriterPipeline':
+        return cls(crawler.settings.get(OUTPUT_PATH_SETTING, cls.default_output_path),
+                   crawler.settings.getint(FLUSH_INTERVAL_SETTING, DEFAULT_FLUSH_INTERVAL))
+
+    def open_spider(self, spider: Spider) -> None:
+        self.items_written = 0
+        checkpoint_state = _register_checkpoint_output(spider, self)
+        if checkpoint_state:
+            # everything written after the checkpoint is scraped again
+            os.truncate(self.output_path, checkpoint_state['bytes'])
+            self.items_written = checkpoint_state['items']
+            self._file = open(self.output_path, 'a', newline=self.newline, buffering=OUTPUT_BUFFER_SIZE)
+        else:
+            self._file = open(self.output_path, 'w', newline=self.newline, buffering=OUTPUT_BUFFER_SIZE)
+        self._opened(self._file, bool(checkpoint_state))
+
+    def close_spider(self, spider: Spider) -> None:
+        if not self._file:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    @timed_process_item
+    def process_item(self, item: Any, spider: Spider) -> Any:
+        if not self._file:
+            raise RuntimeError('The pipeline was not opened')
+        self._write(self._file, item)
+        self.items_written += 1
+        if self.flush_interval > 0 and self.items_written % self.flush_interval == 0:
+            self._file.flush()
+        return item
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return {'bytes': os.path.getsize(self.output_path), 'items': self.items_written}
+
+    def _opened(self, output_file: IO[str], resumed: bool) -> None:
+        pass
+
+    def _write(self, output_file: IO[str], item: Any) -> None:
+        raise NotImplementedError
+
+
+class JsonLinesWriterPipeline(TextFileWriterPipeline):
+    default_output_path = DEFAULT_JSON_LINES_OUTPUT
+
+    def _write(self, output_file: IO[str], item: Any) -> None:
+        output_file.write(to_json(item) + '\n')
+
+
+class CsvWriterPipeline(TextFileWriterPipeline):
+    # One row per property with the columns of CSV_COLUMNS
+    default_output_path = DEFAULT_CSV_OUTPUT
+    newline = ''
+
+    def __init__(self, output_path: Optional[str] = None, flush_interval: int = DEFAULT_FLUSH_INTERVAL) -> None:
+        super(CsvWriterPipeline, self).__init__(output_path, flush_interval)
+        self._writer: Any = None
+
+    def close_spider(self, spider: Spider) -> None:
+        super(CsvWriterPipeline, self).close_spider(spider)
+        self._writer = None
+
+    def _opened(self, output_file: IO[str], resumed: bool) -> None:
+        self._writer = csv.writer(output_file)
+        if not resumed:
+            self._writer.writerow(CSV_COLUMNS)
+
+    def _write(self, output_file: IO[str], item: Any) -> None:
+        self._writer.writerow(to_csv_row(item))
+
+
+class CompressedJsonLinesWriterPipeline:
+    # Writes the items to the "<output>-<segment>.jl.gz|xz" segments and lists them on "<output>.manifest.json"
+
+    def __init__(self, output_path: str = DEFAULT_COMPRESSED_OUTPUT,
+                 output_format: str = JSON_LINES_GZIP_FORMAT,
+                 compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+                 rotate_items: int = DEFAULT_ROTATE_ITEMS,
+                 rotate_bytes: int = DEFAULT_ROTATE_BYTES) -> None:
+        if output_format not in SEGMENT_EXTENSIONS:
+            raise ValueError(f"'{output_format}' is not a compressed output format")
+        self.output_path = output_path
+        self.output_format = output_format
+        self.compression_level = compression_level
+        self.rotate_items = rotate_items
+        self.rotate_bytes = rotate_bytes
+        self.segments: List[Dict[str, Any]] = []
+        self._raw_file: Optional[BinaryIO] = None
+        self._compressed_file: Optional[Union[gzip.GzipFile, lzma.LZMAFile]] = None
+        self._segment_items = 0
+        self._segment_uncompressed_bytes = 0
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> 'CompressedJsonLinesWriterPipeline':
+        settings = crawler.settings
+        return cls(settings.get(OUTPUT_PATH_SETTING, DEFAULT_COMPRESSED_OUTPUT),
+                   settings.get(OUTPUT_FORMAT_SETTING, JSON_LINES_GZIP_FORMAT),
+                   settings.getint(COMPRESSION_LEVEL_SETTING, DEFAULT_COMPRESSION_LEVEL),
+                   settings.getint(ROTATE_ITEMS_SETTING, DEFAULT_ROTATE_ITEMS),
+                   settings.getint(ROTATE_BYTES_SETTING, DEFAULT_ROTATE_BYTES))
+
+    @property
+    def manifest_path(self) -> str:
+        return self.output_path + MANIFEST_EXTENSION
+
+    def open_spider(self, spider: Spider) -> None:
+        self.segments = []
+        checkpoint_state = _register_checkpoint_output(spider, self)
+        if checkpoint_state:
+            # the segments written after the checkpoint are scraped again
+            self.segments = checkpoint_state['segments']
+        # like the other writers overwrite their file, the segments of an earlier crawl are not mixed with this one
+        self._remove_stale_segments()
+        self._write_manifest()
+
+    def close_spider(self, spider: Spider) -> None:
+        self._close_segment()
+        self._write_manifest()
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        # only closed segments are part of a checkpoint, so the open one is rotated
+        self._close_segment()
+        self._write_manifest()
+        return {'segments': self.segments}
+
+    @timed_process_item
+    def process_item(self, item: Any, spider: Spider) -> Any:
+        compressed_file = self._compressed_file or self._open_segment()
+
+        line = (to_json(item) + '\n').encode()
+        compressed_file.write(line)
+        self._segment_items += 1
+        self._segment_uncompressed_bytes += len(line)
+
+        if (self.rotate_items > 0 and self._segment_items >= self.rotate_items) or \
+                (self.rotate_bytes > 0 and self._segment_bytes() >= self.rotate_bytes):
+            self._close_segment()
+            self._write_manifest()
+        return item
+
+    def _open_segment(self) -> Union[gzip.GzipFile, lzma.LZMAFile]:
+        segment_path = f'{self.output_path}-{len(self.segments):05d}{SEGMENT_EXTENSIONS[self.output_format]}'
+        raw_file = open(segment_path, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+        compressed_file: Union[gzip.GzipFile, lzma.LZMAFile]
+        if self.output_format == JSON_LINES_GZIP_FORMAT:
+            compressed_file = gzip.GzipFile(filename='', mode='wb', fileobj=raw_file,
+                                            compresslevel=self.compression_level)
+        else:
+            compressed_file = lzma.LZMAFile(raw_file, 'wb', preset=self.compression_level)
+
+        self._raw_file = raw_file
+        self._compressed_file = compressed_file
+        self._segment_items = 0
+        self._segment_uncompressed_bytes = 0
+        return compressed_file
+
+    def _segment_bytes(self) -> int:
+        return self._raw_file.tell() if self._raw_file else 0
+
+    def _close_segment(self) -> None:
+        if not self._compressed_file or not self._raw_file:
+            return
+
+        self._compressed_file.close()
+        self._raw_file.flush()
+        os.fsync(self._raw_file.fileno())
+        self.segments.append({
+            'path': os.path.basename(self._raw_file.name),
+            'items': self._segment_items,
+            'bytes': self._raw_file.tell(),
+            'uncompressed_bytes': self._segment_uncompressed_bytes,
+        })
+        self._raw_file.close()
+        self._raw_file = None
+        self._compressed_file = None
+
+    def _remove_stale_segments(self) -> None:
+        kept_segments = {segment['path'] for segment in self.segments}
+        output_directory = os.path.dirname(os.path.abspath(self.output_path))
+        segment_prefix = os.path.basename(self.output_path) + '-'
+        for file_name in os.listdir(output_directory):
+            if not file_name.startswith(segment_prefix) or file_name in kept_segments:
+                continue
+            for extension in SEGMENT_EXTENSIONS.values():
+                # only "<output>-<number><extension>", not the segments of "<output>-reextract"
+                if file_name.endswith(extension) and file_name[len(segment_prefix):-len(extension)].isdigit():
+                    os.remove(os.path.join(output_directory, file_name))
+                    break
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            'format': self.output_format,
+            'items': sum(segment['items'] for segment in self.segments),
+            'segments': self.segments,
+        }
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        os.replace(temporary_path, self.manifest_path)
+
+
+class SqliteWriterPipeline:
+    def __init__(self, output_path: str = DEFAULT_SQLITE_OUTPUT, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.output_path = output_path
+        self.batch_size = batch_size
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pending_rows: List[Tuple[Any, ...]] = []
+
+        # partial items, like the ones from the search result cards, keep the values they don't have
+        updates = ', '.join(f'{column} = COALESCE(excluded.{column}, {column})'
+                            for column in SQLITE_COLUMN_NAMES if column != SQLITE_KEY_COLUMN)
+        self._upsert_statement = f'INSERT INTO {SQLITE_TABLE} ({", ".join(SQLITE_COLUMN_NAMES)})' \
+                                 f' VALUES ({", ".join("?" for _ in SQLITE_COLUMN_NAMES)})' \
+                                 f' ON CONFLICT({SQLITE_KEY_COLUMN}) DO UPDATE SET {updates}'
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> 'SqliteWriterPipeline':
+        return cls(crawler.settings.get(OUTPUT_PATH_SETTING, DEFAULT_SQLITE_OUTPUT),
+                   crawler.settings.getint(BATCH_SIZE_SETTING, DEFAULT_BATCH_SIZE))
+
+    def open_spider(self, spider: Spider) -> None:
+        self._pending_rows = []
+        # the properties scraped again after resuming a checkpoint are upserted, so there is nothing to restore
+        _register_checkpoint_output(spider, self)
+        self._connection = sqlite3.connect(self.output_path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._connection:
+            self._create_schema(self._connection)
+
+    def close_spider(self, spider: Spider) -> None:
+        if not self._connection:
+            return
+        self._flush()
+        self._connection.execute('PRAGMA optimize')
+        self._connection.close()
+        self._connection = None
+
+    @timed_process_item
+    def process_item(self, item: Any, spider: Spider) -> Any:
+        self._pending_rows.append(SqliteWriterPipeline._to_row(item))
+        if len(self._pending_rows) >= self.batch_size:
+            self._flush()
+        return item
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        if self._connection:
+            self._flush()
+        return {}
+
+    def _flush(self) -> None:
+        if not self._connection:
+            raise RuntimeError('The pipeline was not opened')
+        if not self._pending_rows:
+            return
+        with self._connection:
+            self._connection.executemany(self._upsert_statement, self._pending_rows)
+        self._pending_rows = []
+
+    @staticmethod
+    def _create_schema(connection: sqlite3.Connection) -> None:
+        columns_definition = ', '.join(f'{column} {column_type}' for column, column_type in SQLITE_COLUMNS)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {SQLITE_TABLE} ({columns_definition})')
+
+        existing_columns = {row[1] for row in connection.execute(f'PRAGMA table_info({SQLITE_TABLE})')}
+        for column, column_type in SQLITE_COLUMNS:
+            if column not in existing_columns:
+                connection.execute(f'ALTER TABLE {SQLITE_TABLE} ADD COLUMN {column} {column_type}')
+
+        for column in SQLITE_INDEXED_COLUMNS:
+            connection.execute(f'CREATE INDEX IF NOT EXISTS {SQLITE_TABLE}_{column}_idx ON {SQLITE_TABLE} ({column})')
+
+    @staticmethod
+    def _to_row(item: Any) -> Tuple[Any, ...]:
+        extra = {key: value for key, value in item.items() if key not in SQLITE_COLUMN_NAMES}
+        row = [item.get(column) for column in SQLITE_COLUMN_NAMES]
+        row[SQLITE_COLUMN_NAMES.index(SQLITE_EXTRA_COLUMN)] = json.dumps(extra) if extra else None
+        return tuple(row)
@@ -0,0 +1,205 @@
+import csv
+import heapq
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from typing import Tuple, List, Optional, Sequence, Any
+
+EARTH_RADIUS_M = 6371008.8
+DEFAULT_LEAF_SIZE = 16
+
+CSV_NAME_COLUMNS = ('name', 'title')
+CSV_LATITUDE_COLUMNS = ('latitude', 'lat')
+CSV_LONGITUDE_COLUMNS = ('longitude', 'lon', 'lng')
+GEOJSON_NAME_PROPERTIES = ('name', 'title')
+GEOJSON_EXTENSIONS = ('.geojson', '.json')
+
+
+@dataclass
+class PointOfInterest:
+    name: str
+    coords: Tuple[float, float]
+
+
+def parse_coords(coords: Optional[str]) -> Optional[Tuple[float, float]]:
+    if not coords:
+        return None
+
+    split_coords = coords.split(",")
+    if len(split_coords) != 2:
+        print(f"Could not correctly parse the coords: '{coords}'")
+        return None
+
+    return float(split_coords[0]), float(split_coords[1])
+
+
+def to_unit_vectors(coords: np.ndarray) -> np.ndarray:
+    radians = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+    cos_lats = np.cos(radians[:, 0])
+    return np.column_stack((cos_lats * np.cos(radians[:, 1]),
+                            cos_lats * np.sin(radians[:, 1]),
+                            np.sin(radians[:, 0])))
+
+
+def chord_to_meters(chord: Any) -> Any:
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def meters_to_chord(meters: float) -> float:
+    return float(2 * np.sin(min(meters / (2 * EARTH_RADIUS_M), np.pi / 2)))
+
+
+class KdTree:
+    # Points live on the unit sphere, so the euclidean (chord) order is the same as the great circle order
+
+    def __init__(self, points: np.ndarray, leaf_size: int = DEFAULT_LEAF_SIZE) -> None:
+        self._points = points
+        self._leaf_size = leaf_size
+        self._order = np.arange(len(points))
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._children: List[Tuple[int, int]] = []
+        self._mins: List[np.ndarray] = []
+        self._maxs: List[np.ndarray] = []
+
+        if len(points):
+            self._build(0, len(points))
+
+    def nearest(self, point: np.ndarray, k: int = 1) -> List[Tuple[float, int]]:
+        if not self._starts or k < 1:
+            return []
+
+        best: List[Tuple[float, int]] = []
+        queue = [(0.0, 0)]
+        while queue:
+            bound, node = heapq.heappop(queue)
+            if len(best) == k and bound > -best[0][0]:
+                break
+
+            left, right = self._children[node]
+            if left < 0:
+                indices = self._order[self._starts[node]:self._ends[node]]
+                squared_distances = ((self._points[indices] - point) ** 2).sum(axis=1)
+                for squared_distance, index in zip(squared_distances, indices):
+                    if len(best) < k:
+                        heapq.heappush(best, (-squared_distance, int(index)))
+                    elif squared_distance < -best[0][0]:
+                        heapq.heapreplace(best, (-squared_distance, int(index)))
+            else:
+                heapq.heappush(queue, (self._box_distance(left, point), left))
+                heapq.heappush(queue, (self._box_distance(right, point), right))
+
+        return sorted((float(np.sqrt(-squared_distance)), index) for squared_distance, index in best)
+
+    def within(self, point: np.ndarray, radius: float) -> List[Tuple[float, int]]:
+        if not self._starts:
+            return []
+
+        squared_radius = radius ** 2
+        result: List[Tuple[float, int]] = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > squared_radius:
+                continue
+
+            left, right = self._children[node]
+            if left < 0:
+                indices = self._order[self._starts[node]:self._ends[node]]
+                squared_distances = ((self._points[indices] - point) ** 2).sum(axis=1)
+                matches = squared_distances <= squared_radius
+                result.extend(zip(np.sqrt(squared_distances[matches]).tolist(), indices[matches].tolist()))
+            else:
+                stack.extend((left, right))
+
+        return sorted(result)
+
+    def _build(self, start: int, end: int) -> int:
+        node = len(self._starts)
+        node_points = self._points[self._order[start:end]]
+        self._starts.append(start)
+        self._ends.append(end)
+        self._mins.append(node_points.min(axis=0))
+        self._maxs.append(node_points.max(axis=0))
+        self._children.append((-1, -1))
+
+        if end - start > self._leaf_size:
+            split_dimension = int(np.argmax(self._maxs[node] - self._mins[node]))
+            node_indices = self._order[start:end]
+            self._order[start:end] = node_indices[np.argsort(node_points[:, split_dimension], kind='stable')]
+            middle = (start + end) // 2
+            left = self._build(start, middle)
+            right = self._build(middle, end)
+            self._children[node] = (left, right)
+
+        return node
+
+    def _box_distance(self, node: int, point: np.ndarray) -> float:
+        gap = np.maximum(0.0, np.maximum(self._mins[node] - point, point - self._maxs[node]))
+        return float((gap ** 2).sum())
+
+
+class PointOfInterestLayer:
+
+    def __init__(self, name: str, points: Sequence[PointOfInterest], leaf_size: int = DEFAULT_LEAF_SIZE) -> None:
+        self.name = name
+        self.points = list(points)
+        self._tree = KdTree(to_unit_vectors(np.array([point.coords for point in self.points])), leaf_size)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def nearest(self, coords: Tuple[float, float], k: int = 1) -> List[Tuple[PointOfInterest, int]]:
+        return self._to_results(self._tree.nearest(to_unit_vectors(np.array(coords))[0], k))
+
+    def within_radius(self, coords: Tuple[float, float], radius_m: float) -> List[Tuple[PointOfInterest, int]]:
+        return self._to_results(self._tree.within(to_unit_vectors(np.array(coords))[0], meters_to_chord(radius_m)))
+
+    def _to_results(self, matches: List[Tuple[float, int]]) -> List[Tuple[PointOfInterest, int]]:
+        return [(self.points[index], int(chord_to_meters(chord))) for chord, index in matches]
+
+    @staticmethod
+    def load(name: str, path: str) -> 'PointOfInterestLayer':
+        if Path(path).suffix.lower() in GEOJSON_EXTENSIONS:
+            return PointOfInterestLayer.from_geojson(name, path)
+        return PointOfInterestLayer.from_csv(name, path)
+
+    @staticmethod
+    def from_csv(name: str, path: str) -> 'PointOfInterestLayer':
+        with open(path, newline='') as csv_file:
+            reader = csv.DictReader(csv_file)
+            columns = {column.strip().lower(): column for column in reader.fieldnames or []}
+            name_column = PointOfInterestLayer._find_column(columns, CSV_NAME_COLUMNS, path)
+            latitude_column = PointOfInterestLayer._find_column(columns, CSV_LATITUDE_COLUMNS, path)
+            longitude_column = PointOfInterestLayer._find_column(columns, CSV_LONGITUDE_COLUMNS, path)
+
+            points = [PointOfInterest(row[name_column], (float(row[latitude_column]), float(row[longitude_column])))
+                      for row in reader]
+
+        return PointOfInterestLayer(name, points)
+
+    @staticmethod
+    def from_geojson(name: str, path: str) -> 'PointOfInterestLayer':
+        with open(path) as geojson_file:
+            geojson = json.load(geojson_file)
+
+        points = []
+        for feature in geojson.get('features', []):
+            geometry = feature.get('geometry') or {}
+            if geometry.get('type') != 'Point':
+                continue
+            properties = feature.get('properties') or {}
+            point_name = next((str(properties[key]) for key in GEOJSON_NAME_PROPERTIES if properties.get(key)), '')
+            longitude, latitude = geometry['coordinates'][:2]
+            points.append(PointOfInterest(point_name, (float(latitude), float(longitude))))
+
+        return PointOfInterestLayer(name, points)
+
+    @staticmethod
+    def _find_column(columns: Any, candidates: Tuple[str, ...], path: str) -> str:
+        for candidate in candidates:
+            if candidate in columns:
+                return str(columns[candidate])
+        raise ValueError(f"Could not find any of the columns {candidates} in '{path}'")
@@ -0,0 +1,127 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, List, Optional, Tuple
+
+PROFILE_CPU = 'cpu'
+PROFILE_MEMORY = 'memory'
+PROFILES = (PROFILE_CPU, PROFILE_MEMORY)
+
+DEFAULT_CPU_PROFILE_OUTPUT = '/tmp/web-scraper.pstats'
+DEFAULT_MEMORY_PROFILE_OUTPUT = '/tmp/web-scraper-memory.txt'
+DEFAULT_PROFILE_TOP = 25
+DEFAULT_SNAPSHOT_INTERVAL_S = 30.0
+
+CPU_SUMMARY_EXTENSION = '.txt'
+CPU_SUMMARY_SORT = 'cumulative'
+# the allocations of the profiler itself and of the imports are not reported
+MEMORY_PROFILE_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+                          tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                          tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+                          tracemalloc.Filter(False, '<unknown>'))
+
+
+class CpuProfiler:
+    # Profiles the calls of the main thread, where the reactor runs, and saves them as a .pstats file, to open with
+    # pstats or snakeviz, and the top functions by cumulative time next to it
+
+    def __init__(self, output: str = DEFAULT_CPU_PROFILE_OUTPUT, top: int = DEFAULT_PROFILE_TOP) -> None:
+        self.output = output
+        self.top = top
+        self.summary_output = output + CPU_SUMMARY_EXTENSION
+        self._profile = cProfile.Profile()
+
+    def __enter__(self) -> 'CpuProfiler':
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._profile.disable()
+        self._profile.dump_stats(self.output)
+        summary = self.summary()
+        with open(self.summary_output, 'w') as summary_file:
+            summary_file.write(summary)
+        print(summary)
+        print(f"Saved the cpu profile on '{self.output}' and its summary on '{self.summary_output}'")
+
+    def summary(self) -> str:
+        summary = io.StringIO()
+        pstats.Stats(self._profile, stream=summary).sort_stats(CPU_SUMMARY_SORT).print_stats(self.top)
+        return summary.getvalue()
+
+
+class MemoryProfiler:
+    # Traces the allocations with tracemalloc and takes a snapshot every interval seconds, on a thread so it works
+    # whatever runs on the main one. The report lists the allocation sites that grew the most between every pair of
+    # snapshots and over the whole run, with their growth per second
+
+    def __init__(self, output: str = DEFAULT_MEMORY_PROFILE_OUTPUT, top: int = DEFAULT_PROFILE_TOP,
+                 interval: float = DEFAULT_SNAPSHOT_INTERVAL_S) -> None:
+        self.output = output
+        self.top = top
+        self.interval = interval
+        self.snapshots = 0
+        self._first: Optional[Tuple[float, tracemalloc.Snapshot]] = None
+        self._previous: Optional[Tuple[float, tracemalloc.Snapshot]] = None
+        self._report: List[str] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._take_snapshots, name='web-scraper-memory-profiler', daemon=True)
+
+    def __enter__(self) -> 'MemoryProfiler':
+        tracemalloc.start()
+        self._snapshot()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if self._first and self._previous:
+            self._report += [f'Peak traced memory: {peak / 1024:.1f} KiB',
+                             MemoryProfiler._growth_report('Whole run', self._first, self._previous, self.top)]
+        report = '\n'.join(self._report) + '\n'
+        with open(self.output, 'w') as report_file:
+            report_file.write(report)
+        print(report)
+        print(f"Saved the memory profile of {self.snapshots} snapshots on '{self.output}'")
+
+    def _take_snapshots(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        snapshot = (time.monotonic(), tracemalloc.take_snapshot().filter_traces(MEMORY_PROFILE_FILTERS))
+        self.snapshots += 1
+        if self._previous:
+            self._report.append(MemoryProfiler._growth_report(f'Snapshot {self.snapshots}', self._previous, snapshot,
+                                                              self.top))
+        self._first = self._first or snapshot
+        # only the first and the last snapshots are kept
+        self._previous = snapshot
+
+    @staticmethod
+    def _growth_report(title: str, start: Tuple[float, tracemalloc.Snapshot], end: Tuple[float, tracemalloc.Snapshot],
+                       top: int) -> str:
+        elapsed = max(end[0] - start[0], 1e-9)
+        lines = [f'{title}, {elapsed:.1f}s, allocation sites growing fastest:']
+        growing = [stat for stat in end[1].compare_to(start[1], 'lineno') if stat.size_diff > 0][:top]
+        for stat in growing:
+            lines.append(f'  {stat.size_diff / elapsed / 1024:+10.1f} KiB/s {stat.size_diff / 1024:+10.1f} KiB'
+                         f' {stat.count_diff:+8d} blocks  {stat.traceback[0].filename}:{stat.traceback[0].lineno}')
+        return '\n'.join(lines)
+
+
+def create_profiler(profile: str, output: Optional[str] = None, top: int = DEFAULT_PROFILE_TOP,
+                    interval: float = DEFAULT_SNAPSHOT_INTERVAL_S) -> Any:
+    if profile == PROFILE_CPU:
+        return CpuProfiler(output or DEFAULT_CPU_PROFILE_OUTPUT, top)
+    if profile == PROFILE_MEMORY:
+        return MemoryProfiler(output or DEFAULT_MEMORY_PROFILE_OUTPUT, top, interval)
+    raise ValueError(f"Unknown profile '{profile}', expected one of {PROFILES}")
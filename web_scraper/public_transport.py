@@ -1,17 +1,42 @@
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 
+import numpy as np
 from geopy import distance
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, Dict
+
+from .points_of_interest import PointOfInterest, PointOfInterestLayer, parse_coords, EARTH_RADIUS_M
 
 GREEN_LUAS = 'GREEN_LUAS'
 RED_LUAS = 'RED_LUAS'
 DART = 'DART'
 
+BATCH_CHUNK_SIZE = 4096
+NO_DISTANCE = -1
+
+# lat_min, lon_min, lat_max, lon_max
+DUBLIN_BOUNDING_BOX = (53.20, -6.50, 53.50, -6.00)
+DEFAULT_GRID_STEP = 0.001
+GRID_FILE_MAGIC = b'WSGRID01'
+GRID_HEADER_ALIGNMENT = 64
+GRID_MAX_DISTANCE = np.iinfo(np.uint16).max
+# the grid rounds its distances, the exact lookups truncate them
+GRID_ROUNDING_ERROR_M = 1.5
+# WGS84 ellipsoid, the geodesic distances are computed on it
+WGS84_SEMI_MAJOR_AXIS_M = 6378137.0
+WGS84_ECCENTRICITY_SQUARED = 0.00669437999014
+
+DEFAULT_CACHE_SIZE = 100000
+# 5 decimal places are ~1m apart
+CACHE_COORDS_PRECISION = 5
+
 
 @dataclass
-class PublicTransportStation:
-    name: str
-    coords: Tuple[float, float]
+class PublicTransportStation(PointOfInterest):
     line: str
 
 
@@ -120,49 +145,373 @@ DART_STATIONS: List[PublicTransportStation] = [
 ]
 
 
+class StationIndex:
+
+    def __init__(self, stations: List[PublicTransportStation]) -> None:
+        self.stations = stations
+        radians = np.radians(np.array([station.coords for station in stations], dtype=np.float64))
+        self._lats = radians[:, 0]
+        self._lons = radians[:, 1]
+        self._cos_lats = np.cos(self._lats)
+
+    def closest_station(self, coords: Tuple[float, float]) -> Tuple[PublicTransportStation, int]:
+        indices, distances = self.closest_stations(np.array([coords]))
+        return self.stations[indices[0]], int(distances[0])
+
+    def closest_stations(self, coords: np.ndarray, refine: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        indices: np.ndarray = np.zeros(len(coords), dtype=np.intp)
+        distances = np.full(len(coords), float(NO_DISTANCE))
+
+        for start in range(0, len(coords), BATCH_CHUNK_SIZE):
+            end = start + BATCH_CHUNK_SIZE
+            indices[start:end], distances[start:end] = self._closest_haversine(coords[start:end])
+
+        invalid = np.isnan(coords).any(axis=1)
+        indices[invalid] = 0
+        distances[invalid] = NO_DISTANCE
+
+        if refine:
+            # the sphere is only used to rank the stations, the winner gets the exact ellipsoid distance
+            for row in np.flatnonzero(~invalid):
+                station = self.stations[indices[row]]
+                distances[row] = distance.distance((coords[row, 0], coords[row, 1]), station.coords).m
+
+        return indices, distances
+
+    def _closest_haversine(self, coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        lats = np.radians(coords[:, 0])[:, np.newaxis]
+        lons = np.radians(coords[:, 1])[:, np.newaxis]
+
+        haversine = np.sin((self._lats - lats) / 2) ** 2 + \
+            np.cos(lats) * self._cos_lats * np.sin((self._lons - lons) / 2) ** 2
+        closest = np.argmin(haversine, axis=1)
+        closest_haversine = np.minimum(haversine[np.arange(len(coords)), closest], 1.0)
+
+        return closest, 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(closest_haversine))
+
+
+GREEN_LUAS_INDEX = StationIndex(GREEN_LUAS_STATIONS)
+RED_LUAS_INDEX = StationIndex(RED_LUAS_STATIONS)
+DART_INDEX = StationIndex(DART_STATIONS)
+
+STATION_INDEXES: Dict[str, StationIndex] = {
+    GREEN_LUAS: GREEN_LUAS_INDEX,
+    RED_LUAS: RED_LUAS_INDEX,
+    DART: DART_INDEX,
+}
+
+
+class NearestStationGrid:
+    # Each cell keeps the closest station of every line to its centre and the geodesic distance to it. As the
+    # distance to the closest station moves at most as much as the point itself, a lookup is off by about the
+    # distance between the point and the centre of its cell, see max_error_m for the exact bound.
+
+    def __init__(self, lat_min: float, lon_min: float, step: float, lines: List[str],
+                 stations: np.ndarray, distances: np.ndarray) -> None:
+        self.lat_min = lat_min
+        self.lon_min = lon_min
+        self.step = step
+        self.lines = lines
+        self.rows, self.cols = stations.shape[1:]
+        self._stations = stations
+        self._distances = distances
+
+    @property
+    def max_error_m(self) -> float:
+        # The point is at most half of the diagonal of the widest cell, the one closest to the equator, away from the
+        # centre, measured with the largest radius of curvature of the ellipsoid in the grid. The closest station is
+        # ranked on a sphere, so near a tie the point and the centre may get different stations whose geodesic
+        # distances differ by up to the spread between the radii of curvature, relative to the longest distance
+        lats = [abs(self.lat_min), abs(self.lat_max)] + [abs(station.coords[0]) for line in self.lines
+                                                         for station in STATION_INDEXES[line].stations]
+        max_radius = NearestStationGrid._prime_vertical_radius(max(lats))
+        radius_spread = max_radius / NearestStationGrid._meridional_radius(min(lats))
+        cell_height = math.radians(self.step) * max_radius
+        cell_width = cell_height * math.cos(math.radians(min(abs(self.lat_min), abs(self.lat_max))))
+        half_diagonal = math.hypot(cell_height, cell_width) / 2
+
+        stored_distances = np.asarray(self._distances)
+        stored_distances = stored_distances[stored_distances != GRID_MAX_DISTANCE]
+        max_distance = float(stored_distances.max()) if stored_distances.size else 0.0
+        return radius_spread * half_diagonal + (radius_spread - 1) * (max_distance + half_diagonal) + \
+            GRID_ROUNDING_ERROR_M
+
+    @property
+    def lat_max(self) -> float:
+        return self.lat_min + self.rows * self.step
+
+    @property
+    def lon_max(self) -> float:
+        return self.lon_min + self.cols * self.step
+
+    def lookup(self, coords: Tuple[float, float]) -> Optional[Dict[str, Tuple[PublicTransportStation, int]]]:
+        row = math.floor((coords[0] - self.lat_min) / self.step)
+        col = math.floor((coords[1] - self.lon_min) / self.step)
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+
+        result = {}
+        for line_position, line in enumerate(self.lines):
+            station_distance = int(self._distances[line_position, row, col])
+            if station_distance == GRID_MAX_DISTANCE:
+                return None
+            station = STATION_INDEXES[line].stations[self._stations[line_position, row, col]]
+            result[line] = station, station_distance
+        return result
+
+    def save(self, path: str) -> None:
+        header = json.dumps({
+            'lat_min': self.lat_min,
+            'lon_min': self.lon_min,
+            'step': self.step,
+            'rows': self.rows,
+            'cols': self.cols,
+            'stations': {line: [station.name for station in STATION_INDEXES[line].stations] for line in self.lines},
+        }).encode()
+        data_offset = NearestStationGrid._data_offset(len(header))
+
+        with open(path, 'wb') as grid_file:
+            grid_file.write(GRID_FILE_MAGIC)
+            grid_file.write(np.uint32(len(header)).tobytes())
+            grid_file.write(header)
+            grid_file.write(b'\0' * (data_offset - grid_file.tell()))
+            grid_file.write(np.ascontiguousarray(self._distances, dtype='<u2').tobytes())
+            grid_file.write(np.ascontiguousarray(self._stations, dtype=np.uint8).tobytes())
+
+    @staticmethod
+    def load(path: str) -> 'NearestStationGrid':
+        with open(path, 'rb') as grid_file:
+            if grid_file.read(len(GRID_FILE_MAGIC)) != GRID_FILE_MAGIC:
+                raise ValueError(f"'{path}' is not a nearest station grid file")
+            header_size = int(np.frombuffer(grid_file.read(4), dtype='<u4')[0])
+            header = json.loads(grid_file.read(header_size))
+
+        lines = list(header['stations'])
+        for line in lines:
+            if line not in STATION_INDEXES or \
+                    header['stations'][line] != [station.name for station in STATION_INDEXES[line].stations]:
+                raise ValueError(f"The stations of '{line}' changed since '{path}' was built, please rebuild it")
+
+        shape = (len(lines), header['rows'], header['cols'])
+        data_offset = NearestStationGrid._data_offset(header_size)
+        distances: np.ndarray = np.memmap(path, dtype='<u2', mode='r', offset=data_offset, shape=shape)
+        stations = np.memmap(path, dtype=np.uint8, mode='r', offset=data_offset + distances.nbytes, shape=shape)
+
+        return NearestStationGrid(header['lat_min'], header['lon_min'], header['step'], lines, stations, distances)
+
+    @staticmethod
+    def build(bounding_box: Tuple[float, float, float, float] = DUBLIN_BOUNDING_BOX,
+              step: float = DEFAULT_GRID_STEP) -> 'NearestStationGrid':
+        lat_min, lon_min, lat_max, lon_max = bounding_box
+        rows = math.ceil(round((lat_max - lat_min) / step, 6))
+        cols = math.ceil(round((lon_max - lon_min) / step, 6))
+        centre_lats = lat_min + (np.arange(rows) + 0.5) * step
+        centre_lons = lon_min + (np.arange(cols) + 0.5) * step
+        centres = np.stack(np.meshgrid(centre_lats, centre_lons, indexing='ij'), axis=-1).reshape(-1, 2)
+
+        lines = list(STATION_INDEXES)
+        stations: np.ndarray = np.empty((len(lines), rows, cols), dtype=np.uint8)
+        distances: np.ndarray = np.empty((len(lines), rows, cols), dtype=np.uint16)
+        for line_position, line in enumerate(lines):
+            indices, line_distances = STATION_INDEXES[line].closest_stations(centres)
+            stations[line_position] = indices.reshape(rows, cols)
+            distances[line_position] = np.minimum(np.round(line_distances), GRID_MAX_DISTANCE).reshape(rows, cols)
+
+        return NearestStationGrid(lat_min, lon_min, step, lines, stations, distances)
+
+    @staticmethod
+    def _meridional_radius(lat: float) -> float:
+        return WGS84_SEMI_MAJOR_AXIS_M * (1 - WGS84_ECCENTRICITY_SQUARED) / \
+            (1 - WGS84_ECCENTRICITY_SQUARED * math.sin(math.radians(lat)) ** 2) ** 1.5
+
+    @staticmethod
+    def _prime_vertical_radius(lat: float) -> float:
+        return WGS84_SEMI_MAJOR_AXIS_M / math.sqrt(1 - WGS84_ECCENTRICITY_SQUARED * math.sin(math.radians(lat)) ** 2)
+
+    @staticmethod
+    def _data_offset(header_size: int) -> int:
+        header_end = len(GRID_FILE_MAGIC) + 4 + header_size
+        return -(-header_end // GRID_HEADER_ALIGNMENT) * GRID_HEADER_ALIGNMENT
+
+
 class PublicTransport:
+    _grid: Optional[NearestStationGrid] = None
+
+    @staticmethod
+    def use_grid(grid: Optional[NearestStationGrid]) -> None:
+        PublicTransport._grid = grid
 
     @staticmethod
     def get_closest_green_luas(coords: Optional[str]) -> Tuple[PublicTransportStation, int]:
 
-        return PublicTransport._get_closest_station(coords, GREEN_LUAS_STATIONS)
+        return PublicTransport._get_closest_station(coords, GREEN_LUAS_INDEX)
 
     @staticmethod
     def get_closest_red_luas(coords: Optional[str]) -> Tuple[PublicTransportStation, int]:
 
-        return PublicTransport._get_closest_station(coords, RED_LUAS_STATIONS)
+        return PublicTransport._get_closest_station(coords, RED_LUAS_INDEX)
 
     @staticmethod
-    def get_closest_dart(coords: Optional[str]) -> Tuple[PublicTransportStation, float]:
+    def get_closest_dart(coords: Optional[str]) -> Tuple[PublicTransportStation, int]:
 
-        return PublicTransport._get_closest_station(coords, DART_STATIONS)
+        return PublicTransport._get_closest_station(coords, DART_INDEX)
 
     @staticmethod
-    def _get_closest_station(coords: Optional[str], stations: List[PublicTransportStation]) \
-            -> Tuple[PublicTransportStation, int]:
-        default_result = stations[0], -1
+    def get_closest_stations(coords: Optional[str]) -> Dict[str, Tuple[PublicTransportStation, int]]:
+        return PublicTransport.get_closest_stations_for_coords(PublicTransport._parse_coords(coords))
 
-        if not coords:
-            return default_result
+    @staticmethod
+    def get_closest_stations_for_coords(parsed_coords: Optional[Tuple[float, float]]) \
+            -> Dict[str, Tuple[PublicTransportStation, int]]:
+        if parsed_coords and PublicTransport._grid:
+            grid_result = PublicTransport._grid.lookup(parsed_coords)
+            if grid_result is not None:
+                return grid_result
+
+        return {line: PublicTransport._get_closest_parsed_station(parsed_coords, station_index)
+                for line, station_index in STATION_INDEXES.items()}
 
-        split_coords = coords.split(",")
-        if len(split_coords) != 2:
-            print(f"Could not correctly parse the coords: '{coords}'")
-            return default_result
+    @staticmethod
+    def get_closest_stations_batch(parsed_coords: List[Optional[Tuple[float, float]]]) \
+            -> List[Dict[str, Tuple[PublicTransportStation, int]]]:
+        # the coords missing from the grid are ranked together, with one vectorized search per line
+        results: List[Optional[Dict[str, Tuple[PublicTransportStation, int]]]] = [None] * len(parsed_coords)
+        missing: List[int] = []
+        for position, coords in enumerate(parsed_coords):
+            if not coords:
+                results[position] = PublicTransport.get_closest_stations_for_coords(None)
+            elif PublicTransport._grid and (grid_result := PublicTransport._grid.lookup(coords)) is not None:
+                results[position] = grid_result
+            else:
+                missing.append(position)
 
-        parsed_cords = (float(split_coords[0]), float(split_coords[1]))
+        if missing:
+            missing_coords = np.array([parsed_coords[position] for position in missing], dtype=np.float64)
+            line_results = {line: station_index.closest_stations(missing_coords)
+                            for line, station_index in STATION_INDEXES.items()}
+            for row, position in enumerate(missing):
+                results[position] = {line: (STATION_INDEXES[line].stations[indices[row]], int(distances[row]))
+                                     for line, (indices, distances) in line_results.items()}
 
-        closest_station: PublicTransportStation = stations[0]
-        closest_station_distance = PublicTransport._get_distance_to_station(closest_station, parsed_cords)
+        return [result for result in results if result is not None]
+
+    @staticmethod
+    def _get_closest_station(coords: Optional[str], station_index: StationIndex) \
+            -> Tuple[PublicTransportStation, int]:
+        return PublicTransport._get_closest_parsed_station(PublicTransport._parse_coords(coords), station_index)
+
+    @staticmethod
+    def _get_closest_parsed_station(parsed_coords: Optional[Tuple[float, float]], station_index: StationIndex) \
+            -> Tuple[PublicTransportStation, int]:
+        if not parsed_coords:
+            return station_index.stations[0], NO_DISTANCE
 
-        for station in stations:
-            distance_to_station = PublicTransport._get_distance_to_station(station, parsed_cords)
-            if distance_to_station < closest_station_distance:
-                closest_station_distance = distance_to_station
-                closest_station = station
+        return station_index.closest_station(parsed_coords)
 
-        return closest_station, closest_station_distance
+    @staticmethod
+    def get_layer(line: str) -> PointOfInterestLayer:
+        return PointOfInterestLayer(line, STATION_INDEXES[line].stations)
 
     @staticmethod
-    def _get_distance_to_station(station: PublicTransportStation, coords: Tuple[float, float]) -> int:
-        return int(distance.distance(coords, station.coords).m)
+    def _parse_coords(coords: Optional[str]) -> Optional[Tuple[float, float]]:
+        return parse_coords(coords)
+
+
+class PublicTransportCache:
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, path: Optional[str] = None,
+                 precision: int = CACHE_COORDS_PRECISION) -> None:
+        self.max_size = max_size
+        self.path = path
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple[float, float], Dict[str, Tuple[PublicTransportStation, int]]]' = \
+            OrderedDict()
+        # the enrichment pipeline looks the stations up from its pool threads
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_closest_stations_batch(self, coords: List[Optional[str]]) \
+            -> List[Dict[str, Tuple[PublicTransportStation, int]]]:
+        keys = [(round(parsed_coords[0], self.precision), round(parsed_coords[1], self.precision))
+                if parsed_coords else None for parsed_coords in map(parse_coords, coords)]
+        with self._lock:
+            results = [self._get_entry(key) if key else None for key in keys]
+
+        missing = [position for position, result in enumerate(results) if result is None]
+        missing_results = PublicTransport.get_closest_stations_batch([keys[position] for position in missing])
+        with self._lock:
+            for position, result in zip(missing, missing_results):
+                results[position] = result
+                key = keys[position]
+                if key is not None:
+                    self._add_entry(key, result)
+        return [result for result in results if result is not None]
+
+    def get_closest_stations(self, coords: Optional[str]) -> Dict[str, Tuple[PublicTransportStation, int]]:
+        parsed_coords = parse_coords(coords)
+        if not parsed_coords:
+            return PublicTransport.get_closest_stations_for_coords(None)
+
+        key = round(parsed_coords[0], self.precision), round(parsed_coords[1], self.precision)
+        with self._lock:
+            result = self._get_entry(key)
+        if result is not None:
+            return result
+
+        result = PublicTransport.get_closest_stations_for_coords(key)
+        with self._lock:
+            self._add_entry(key, result)
+        return result
+
+    def _get_entry(self, key: Tuple[float, float]) -> Optional[Dict[str, Tuple[PublicTransportStation, int]]]:
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return result
+
+    def _add_entry(self, key: Tuple[float, float], result: Dict[str, Tuple[PublicTransportStation, int]]) -> None:
+        self._entries[key] = result
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+
+        entries = [[lat, lon, {line: [station.name, station_distance]
+                               for line, (station, station_distance) in result.items()}]
+                   for (lat, lon), result in self._entries.items()]
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as cache_file:
+            json.dump({'precision': self.precision, 'entries': entries}, cache_file)
+        os.replace(temporary_path, path)
+
+    def load(self, path: str) -> None:
+        with open(path) as cache_file:
+            cache_data = json.load(cache_file)
+
+        if cache_data.get('precision') != self.precision:
+            print(f"Ignoring the transport cache '{path}', it was saved with a different precision")
+            return
+
+        stations_by_name = {line: {station.name: station for station in station_index.stations}
+                            for line, station_index in STATION_INDEXES.items()}
+        for lat, lon, raw_result in cache_data.get('entries', [])[-self.max_size:]:
+            if set(raw_result) != set(STATION_INDEXES) or \
+                    any(name not in stations_by_name[line] for line, (name, _) in raw_result.items()):
+                continue
+            self._entries[(lat, lon)] = {line: (stations_by_name[line][name], station_distance)
+                                         for line, (name, station_distance) in raw_result.items()}
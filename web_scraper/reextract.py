@@ -0,0 +1,82 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Tuple
+
+from scrapy import Request, Spider
+from scrapy.crawler import Crawler
+from scrapy.http import HtmlResponse
+from scrapy.utils.misc import load_object
+
+from .html_archive import HtmlArchiveReader
+from .items import DaftProperty
+from .pipelines import OUTPUT_PIPELINES, OUTPUT_FORMAT_SETTING
+from .spiders import DaftSaleUsedSpider, ExtractorException, init_pool_spider, pool_spider
+
+REEXTRACT_CHUNK_SIZE = 200
+# the outputs of the crawls are not overwritten by default
+REEXTRACT_OUTPUT_SUFFIX = '-reextract'
+
+
+def reextract_chunk(directory: str, entries: List[Dict[str, Any]]) -> Tuple[List[DaftProperty], int]:
+    spider = pool_spider()
+    reader = HtmlArchiveReader(directory)
+    items: List[DaftProperty] = []
+    errors = 0
+    try:
+        for entry in entries:
+            response = HtmlResponse(entry['url'], status=entry['status'], body=reader.read(entry),
+                                    request=Request(entry['url']))
+            try:
+                items.extend(spider.parse_detailed_page(response))
+            except ExtractorException as e:
+                print(f"Could not extract '{entry['url']}': {e}")
+                errors += 1
+    finally:
+        reader.close()
+    return items, errors
+
+
+class Reextraction:
+    # Replays the archived pages through the extraction of the spider, without any request
+
+    def __init__(self, crawler: Crawler, directory: str, spider_kwargs: Dict[str, Any], workers: int) -> None:
+        self.crawler = crawler
+        self.directory = directory
+        self.spider_kwargs = spider_kwargs
+        self.workers = workers
+        self.pages = 0
+        self.items_written = 0
+        self.errors = 0
+
+    def run(self) -> None:
+        entries = [entry for entry in Reextraction._latest_entries(HtmlArchiveReader(self.directory).entries())
+                   if entry['status'] == 200]
+        self.pages = len(entries)
+        chunks = [entries[start:start + REEXTRACT_CHUNK_SIZE]
+                  for start in range(0, len(entries), REEXTRACT_CHUNK_SIZE)]
+
+        pipeline_path, _ = OUTPUT_PIPELINES[self.crawler.settings.get(OUTPUT_FORMAT_SETTING)]
+        pipeline = load_object(pipeline_path).from_crawler(self.crawler)
+        spider = Spider(name=f'{DaftSaleUsedSpider.name}Reextract')
+        pipeline.open_spider(spider)
+        try:
+            with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=init_pool_spider,
+                                     initargs=(self.spider_kwargs,)) as executor:
+                for items, errors in executor.map(reextract_chunk, [self.directory] * len(chunks), chunks):
+                    for item in items:
+                        pipeline.process_item(item, spider)
+                    self.items_written += len(items)
+                    self.errors += errors
+        finally:
+            pipeline.close_spider(spider)
+
+    @staticmethod
+    def _latest_entries(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # every crawl archives the pages again, only the newest page of every property is extracted
+        latest_entries: Dict[str, Dict[str, Any]] = {}
+        for entry in entries:
+            latest_entry = latest_entries.get(entry['url'])
+            if latest_entry is None or entry['archived_at'] >= latest_entry['archived_at']:
+                latest_entries[entry['url']] = entry
+        return list(latest_entries.values())
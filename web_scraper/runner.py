@@ -1,11 +1,37 @@
+import os
+import pprint
 from enum import Enum
 
-from argparse import Namespace, ArgumentParser
+from argparse import Namespace, ArgumentParser, ArgumentTypeError
+from typing import Tuple, Dict, Any
 
-from .spiders import DaftSaleUsedSpider
+from .checkpoint import DEFAULT_CHECKPOINT_INTERVAL_S
+from .http_cache import LISTING_TTL_SETTING, DETAIL_TTL_SETTING, DEFAULT_LISTING_TTL_S, DEFAULT_DETAIL_TTL_S
+from .pipelines import OUTPUT_PIPELINES, JSON_LINES_FORMAT, JSON_FORMAT, OUTPUT_PATH_SETTING, FLUSH_INTERVAL_SETTING, \
+    DEFAULT_FLUSH_INTERVAL, OUTPUT_FORMAT_SETTING, COMPRESSION_LEVEL_SETTING, ROTATE_ITEMS_SETTING, \
+    ROTATE_BYTES_SETTING, DEFAULT_COMPRESSION_LEVEL, DEFAULT_ROTATE_ITEMS, DEFAULT_ROTATE_BYTES, BATCH_SIZE_SETTING, \
+    DEFAULT_BATCH_SIZE, JSON_LINES_GZIP_FORMAT, SQLITE_FORMAT, CSV_FORMAT
+from .public_transport import NearestStationGrid, DUBLIN_BOUNDING_BOX, DEFAULT_GRID_STEP, DEFAULT_CACHE_SIZE
+from .seen_listings import DEFAULT_TTL_HOURS
+from .enrichment import ENRICHMENT_PIPELINE, ENRICHMENT_PIPELINE_ORDER, ENRICHMENT_POOL_SETTING, \
+    ENRICHMENT_WORKERS_SETTING, ENRICHMENT_BATCH_SIZE_SETTING, ENRICHMENT_POOLS, DEFAULT_ENRICHMENT_WORKERS, \
+    DEFAULT_ENRICHMENT_BATCH_SIZE
+from .profiling import PROFILES, DEFAULT_PROFILE_TOP, DEFAULT_SNAPSHOT_INTERVAL_S, create_profiler
+from .metrics import METRICS_EXTENSION, METRICS_EXTENSION_ORDER, METRICS_FILE_SETTING, METRICS_PORT_SETTING, \
+    METRICS_INTERVAL_SETTING, DEFAULT_METRICS_INTERVAL_S
+from .spiders import DaftSaleUsedSpider, EXTRACTION_MODES, EXTRACTION_MODE_COMPILED, DAFT_ADDRESS
+from .reextract import Reextraction, REEXTRACT_OUTPUT_SUFFIX
+from .workers import ShardedCrawl
 from scrapy.crawler import CrawlerProcess
 
 USER_AGENT_SETTING = 'USER_AGENT'
+ITEM_PIPELINES_SETTING = 'ITEM_PIPELINES'
+OUTPUT_PIPELINE_ORDER = 250
+DOWNLOADER_MIDDLEWARES_SETTING = 'DOWNLOADER_MIDDLEWARES'
+HTTP_CACHE_MIDDLEWARE_ORDER = 900
+CONCURRENT_REQUESTS_SETTING = 'CONCURRENT_REQUESTS'
+CONCURRENT_REQUESTS_PER_DOMAIN_SETTING = 'CONCURRENT_REQUESTS_PER_DOMAIN'
+EXTENSIONS_SETTING = 'EXTENSIONS'
 
 
 class WebSources(Enum):
@@ -17,12 +43,33 @@ class WebSources(Enum):
         return str(self.value)
 
 
+class Tools(Enum):
+    __order__ = 'BUILD_TRANSPORT_GRID REEXTRACT'
+    BUILD_TRANSPORT_GRID = 'build_transport_grid'
+    REEXTRACT = 'reextract'
+
+    def __str__(self) -> str:
+        return str(self.value)
+
+
 class Runner:
     def __init__(self) -> None:
         parser = ArgumentParser(description='Extract data from some websites.',
                                 prog='web-acraper',
                                 usage='web-scraper houses-for-sale '
                                       '--locations "dublin-4-dublin dublin-6-dublin"')
+        parser.set_defaults(tool=None)
+        parser.add_argument('--profile', choices=PROFILES,
+                            help='Profiles the whole run, before the command: "cpu" saves a cProfile .pstats file of'
+                                 ' the main process and a summary of its top functions, "memory" takes tracemalloc'
+                                 ' snapshots and reports the allocation sites growing fastest.')
+        parser.add_argument('--profile-output', type=str,
+                            help='File where the profile is saved, "/tmp/web-scraper.pstats" for "cpu", with the'
+                                 ' summary on "<output>.txt", and "/tmp/web-scraper-memory.txt" for "memory".')
+        parser.add_argument('--profile-top', type=int, default=DEFAULT_PROFILE_TOP,
+                            help='Number of functions or allocation sites reported.')
+        parser.add_argument('--profile-interval', type=float, default=DEFAULT_SNAPSHOT_INTERVAL_S,
+                            help='Seconds between the snapshots of the "memory" profile.')
         sub_parsers = parser.add_subparsers(title='Avalilable crawlers', required=True)
         parser_houses_for_sale = sub_parsers.add_parser('houses-for-sale',
                                                         help='scrape for used houses for sale data')
@@ -41,30 +88,204 @@ class Runner:
                                             help='Minimum beds to be searched for.')
         parser_houses_for_sale.add_argument('--max-beds', type=int,
                                             help='Maximum beds to be searched for.')
+        parser_houses_for_sale.add_argument('--poi-layers', type=Runner._poi_layer, nargs="+",
+                                            metavar='NAME=PATH',
+                                            help='Points of interest layers loaded from local CSV or GeoJSON'
+                                                 ' files, the distance to the closest point of each layer is'
+                                                 ' added to the results i.e: "schools=/data/schools.csv"')
+        parser_houses_for_sale.add_argument('--transport-grid', type=str,
+                                            help='Precomputed nearest station grid file, created with'
+                                                 ' build-transport-grid, used instead of computing the'
+                                                 ' distances for the properties inside of it.')
+        parser_houses_for_sale.add_argument('--transport-cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                                            help='Maximum number of coordinates which closest stations are kept'
+                                                 ' in memory, 0 disables the cache.')
+        parser_houses_for_sale.add_argument('--transport-cache-file', type=str,
+                                            help='File where the closest stations cache is kept between runs.')
+        parser_houses_for_sale.add_argument('--seen-listings', type=str,
+                                            help='Database of the already scraped properties, used to skip the'
+                                                 ' ones scraped less than --seen-ttl-hours ago.')
+        parser_houses_for_sale.add_argument('--seen-ttl-hours', type=float, default=DEFAULT_TTL_HOURS,
+                                            help='Hours until an already scraped property is scraped again.')
+        parser_houses_for_sale.add_argument('--force-refresh', action='store_true',
+                                            help='Scrape every property even if it was scraped recently.')
+        parser_houses_for_sale.add_argument('--cards-only', action='store_true',
+                                            help='Only scrape the data shown on the search result cards, without'
+                                                 ' requesting the detail page of every property.')
+        parser_houses_for_sale.add_argument('--detail-on-change', action='store_true',
+                                            help='With --cards-only and --seen-listings, request the detail page'
+                                                 ' of the new properties and the ones which card changed.')
+        parser_houses_for_sale.add_argument('--max-band-results', type=int,
+                                            help='Split the searches with more results than this in price bands'
+                                                 ' crawled concurrently, sized from the reported result counts.')
+        parser_houses_for_sale.add_argument('--split-beds', action='store_true',
+                                            help='With --max-band-results, split by beds the bands of a single'
+                                                 ' price that still have too many results.')
+        parser_houses_for_sale.add_argument('--workers', type=int, default=1,
+                                            help='Number of processes crawling in parallel, the crawl is sharded'
+                                                 ' by location, or by price when there is a single location.')
+        parser_houses_for_sale.add_argument('--checkpoint-dir', type=str,
+                                            help='Directory where the pending requests, the completed properties'
+                                                 ' and the state of the output are saved during the crawl.')
+        parser_houses_for_sale.add_argument('--checkpoint-interval', type=float,
+                                            default=DEFAULT_CHECKPOINT_INTERVAL_S,
+                                            help='Seconds between checkpoints.')
+        parser_houses_for_sale.add_argument('--resume', action='store_true',
+                                            help='Continue the crawl saved on --checkpoint-dir.')
+        parser_houses_for_sale.add_argument('--http-cache', type=str, metavar='DIR',
+                                            help='Directory where the responses are cached, compressed, and'
+                                                 ' revalidated once their TTL expires.')
+        parser_houses_for_sale.add_argument('--http-cache-listing-ttl', type=float, default=DEFAULT_LISTING_TTL_S,
+                                            help='Seconds a cached search result page is used without requesting'
+                                                 ' it again.')
+        parser_houses_for_sale.add_argument('--http-cache-detail-ttl', type=float, default=DEFAULT_DETAIL_TTL_S,
+                                            help='Seconds a cached property page is used without requesting it'
+                                                 ' again.')
+        parser_houses_for_sale.add_argument('--html-archive', type=str, metavar='DIR',
+                                            help='Directory where the property pages are archived, compressed, to'
+                                                 ' extract them again later with reextract.')
+        Runner._add_extraction_mode_argument(parser_houses_for_sale)
+        parser_houses_for_sale.add_argument('--enrichment-pool', choices=ENRICHMENT_POOLS,
+                                            help='Add the transport and points of interest fields on a pool of'
+                                                 ' threads or processes, in batches, instead of on the reactor'
+                                                 ' thread while parsing the properties.')
+        parser_houses_for_sale.add_argument('--enrichment-workers', type=int, default=DEFAULT_ENRICHMENT_WORKERS,
+                                            help='Number of threads or processes of --enrichment-pool.')
+        parser_houses_for_sale.add_argument('--enrichment-batch-size', type=int,
+                                            default=DEFAULT_ENRICHMENT_BATCH_SIZE,
+                                            help='Maximum number of properties enriched together by'
+                                                 ' --enrichment-pool.')
+        parser_houses_for_sale.add_argument('--daft-address', type=str, default=DAFT_ADDRESS,
+                                            help='Address of the site, to crawl a local copy of it, like the mock'
+                                                 ' server of the benchmarks, instead of daft.ie.')
+        parser_houses_for_sale.add_argument('--concurrent-requests', type=int,
+                                            help='Maximum number of requests sent at the same time, 16 by'
+                                                 ' default.')
+        parser_houses_for_sale.add_argument('--metrics-file', type=str,
+                                            help='File where the stage timings and the crawl stats are exported'
+                                                 ' in the Prometheus text format, like a .prom file of the node'
+                                                 ' exporter textfile collector.')
+        parser_houses_for_sale.add_argument('--metrics-port', type=int,
+                                            help='Local port where the stage timings and the crawl stats are'
+                                                 ' served in the Prometheus text format, on any path.')
+        parser_houses_for_sale.add_argument('--metrics-interval', type=float, default=DEFAULT_METRICS_INTERVAL_S,
+                                            help='Seconds between the exports to --metrics-file.')
+        Runner._add_output_arguments(parser_houses_for_sale)
 
         parser_houses_for_rent = sub_parsers.add_parser('houses-for-rent',
                                                         help='scrape for houses for rent data')
         parser_houses_for_rent.set_defaults(source=WebSources.HOUSES_FOR_RENT, type=WebSources)
 
+        parser_build_transport_grid = sub_parsers.add_parser('build-transport-grid',
+                                                             help='precompute the closest stations grid')
+        parser_build_transport_grid.set_defaults(source=None, tool=Tools.BUILD_TRANSPORT_GRID)
+        parser_build_transport_grid.add_argument('--output', type=str, required=True,
+                                                 help='File where the grid is saved.')
+        parser_build_transport_grid.add_argument('--step', type=float, default=DEFAULT_GRID_STEP,
+                                                 help='Size of the grid cells in degrees, the smaller it is the'
+                                                      ' smaller is the distance error.')
+        parser_build_transport_grid.add_argument('--bounding-box', type=float, nargs=4,
+                                                 default=list(DUBLIN_BOUNDING_BOX),
+                                                 metavar=('LAT_MIN', 'LON_MIN', 'LAT_MAX', 'LON_MAX'),
+                                                 help='Area covered by the grid, Dublin by default.')
+
+        parser_reextract = sub_parsers.add_parser('reextract',
+                                                  help='extract the properties of an html archive again, without'
+                                                       ' any request')
+        parser_reextract.set_defaults(source=None, tool=Tools.REEXTRACT)
+        parser_reextract.add_argument('--archive', type=str, required=True,
+                                      help='Directory of the html archive, created with --html-archive.')
+        parser_reextract.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                                      help='Number of processes extracting the pages, one per core by default.')
+        Runner._add_extraction_mode_argument(parser_reextract)
+        parser_reextract.add_argument('--poi-layers', type=Runner._poi_layer, nargs="+", metavar='NAME=PATH',
+                                      help='Points of interest layers added to the results.')
+        parser_reextract.add_argument('--transport-grid', type=str,
+                                      help='Precomputed nearest station grid file.')
+        Runner._add_output_arguments(parser_reextract, REEXTRACT_OUTPUT_SUFFIX)
+
         self._parser = parser
 
-        self.crawler_settings = {
+        self.crawler_settings: Dict[str, Any] = {
             USER_AGENT_SETTING: 'Mozilla/5.0 AppleWebKit/537.36 (KHTML, like Gecko; compatible;'
                                 ' Googlebot/2.1; +http://www.google.com/bot.html)'
                                 ' Chrome/80.1.2.4‡ Safari/537.36',
-            'ITEM_PIPELINES': {'web_scraper.pipelines.JsonWriterPipeline': 250}
+            ITEM_PIPELINES_SETTING: {OUTPUT_PIPELINES[JSON_LINES_FORMAT][0]: OUTPUT_PIPELINE_ORDER}
         }
 
         self._process = CrawlerProcess(settings=self.crawler_settings)
 
+    @staticmethod
+    def _add_output_arguments(parser: ArgumentParser, default_output_suffix: str = '') -> None:
+        parser.add_argument('--output-format', type=str, choices=list(OUTPUT_PIPELINES),
+                            default=JSON_LINES_FORMAT,
+                            help='Format of the scraped data, "jsonl" (the default, it was "json"'
+                                 ' before) streams one property per line, "jsonl.gz" and "jsonl.xz"'
+                                 ' stream them to compressed segments, "sqlite" upserts them into a'
+                                 ' SQLite database, "csv" writes a row per property and "json"'
+                                 ' keeps everything in memory until the end.')
+        default_outputs = {output_format: Runner._default_output(output_format, default_output_suffix)
+                           for output_format in OUTPUT_PIPELINES}
+        parser.add_argument('--output', type=str,
+                            help='File where the scraped data is saved, by default'
+                                 f' "{default_outputs[JSON_LINES_FORMAT]}" for "jsonl" and'
+                                 f' "{default_outputs[JSON_FORMAT]}" for "json".'
+                                 ' It is the prefix of the segments for the compressed formats,'
+                                 f' "{default_outputs[JSON_LINES_GZIP_FORMAT]}" by default,'
+                                 f' "{default_outputs[SQLITE_FORMAT]}" for "sqlite" and'
+                                 f' "{default_outputs[CSV_FORMAT]}" for "csv".')
+        parser.add_argument('--flush-interval', type=int, default=DEFAULT_FLUSH_INTERVAL,
+                            help='Number of properties written between flushes to the output.')
+        parser.add_argument('--compression-level', type=int, default=DEFAULT_COMPRESSION_LEVEL,
+                            help='Compression level of the compressed formats, 1 to 9.')
+        parser.add_argument('--rotate-items', type=int, default=DEFAULT_ROTATE_ITEMS,
+                            help='Maximum properties per compressed segment, 0 for no limit.')
+        parser.add_argument('--rotate-bytes', type=int, default=DEFAULT_ROTATE_BYTES,
+                            help='Maximum size of a compressed segment, 0 for no limit.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of properties inserted per transaction on "sqlite".')
+
     def run(self, args: Namespace) -> None:
+        if not args.profile:
+            self._run(args)
+            return
+
+        with create_profiler(args.profile, args.profile_output, args.profile_top, args.profile_interval):
+            self._run(args)
+
+    def _run(self, args: Namespace) -> None:
+        if args.tool == Tools.BUILD_TRANSPORT_GRID:
+            self._build_transport_grid(args)
+            return
+
+        if args.tool == Tools.REEXTRACT:
+            self._apply_settings(Runner._output_settings(args, REEXTRACT_OUTPUT_SUFFIX))
+            self._reextract(args)
+            return
+
         if args.source == WebSources.HOUSES_FOR_SALE:
-            self._process.crawl(DaftSaleUsedSpider,
-                                locations=args.locations,
-                                min_price=args.min_price,
-                                max_price=args.max_price,
-                                min_beds=args.min_beds,
-                                max_beds=args.max_beds)
+            if args.detail_on_change and not (args.cards_only and args.seen_listings):
+                self._parser.error('--detail-on-change needs --cards-only and --seen-listings')
+            if args.resume and not args.checkpoint_dir:
+                self._parser.error('--resume needs --checkpoint-dir')
+            if args.checkpoint_dir and (args.workers > 1 or args.output_format == JSON_FORMAT):
+                self._parser.error('--checkpoint-dir does not support --workers or the json output')
+            if (args.metrics_file or args.metrics_port is not None) and args.workers > 1:
+                self._parser.error('--metrics-file and --metrics-port do not support --workers')
+            if args.transport_cache_file and args.workers > 1:
+                # every worker would overwrite the cache file saved by the others
+                self._parser.error('--transport-cache-file does not support --workers')
+            if args.seen_listings and args.workers > 1:
+                # the workers would wait on the write transactions of each other on the same database
+                self._parser.error('--seen-listings does not support --workers')
+            self._apply_settings(Runner._enrichment_settings(
+                args, {**Runner._output_settings(args), **Runner._http_cache_settings(args),
+                       **Runner._concurrency_settings(args), **Runner._metrics_settings(args)}))
+            spider_kwargs = Runner._spider_kwargs(args)
+            if args.workers > 1:
+                self._run_workers(spider_kwargs, args.workers)
+                return
+            self._process.crawl(DaftSaleUsedSpider, **spider_kwargs)
         else:
             print("Parse not implemented yet!!")
             exit(1)
@@ -72,3 +293,147 @@ class Runner:
 
     def get_arg_parser(self) -> ArgumentParser:
         return self._parser
+
+    def _run_workers(self, spider_kwargs: Dict[str, Any], workers: int) -> None:
+        sharded_crawl = ShardedCrawl(self._process.create_crawler(DaftSaleUsedSpider), self.crawler_settings,
+                                     spider_kwargs, workers)
+        sharded_crawl.run()
+        print(f"Crawled {len(sharded_crawl.shards)} shards, {sharded_crawl.failed_workers} workers failed:")
+        pprint.pprint(sharded_crawl.stats)
+
+    def _reextract(self, args: Namespace) -> None:
+        spider_kwargs = dict(poi_layers=dict(args.poi_layers) if args.poi_layers else None,
+                             transport_grid=args.transport_grid,
+                             extraction_mode=args.extraction_mode)
+        reextraction = Reextraction(self._process.create_crawler(DaftSaleUsedSpider), args.archive, spider_kwargs,
+                                    args.workers)
+        reextraction.run()
+        print(f"Extracted {reextraction.items_written} properties from {reextraction.pages} archived pages,"
+              f" {reextraction.errors} errors")
+
+    @staticmethod
+    def _spider_kwargs(args: Namespace) -> Dict[str, Any]:
+        return dict(locations=args.locations,
+                    min_price=args.min_price,
+                    max_price=args.max_price,
+                    min_beds=args.min_beds,
+                    max_beds=args.max_beds,
+                    poi_layers=dict(args.poi_layers) if args.poi_layers else None,
+                    transport_grid=args.transport_grid,
+                    transport_cache_size=args.transport_cache_size,
+                    transport_cache_file=args.transport_cache_file,
+                    seen_listings=args.seen_listings,
+                    seen_ttl_hours=args.seen_ttl_hours,
+                    force_refresh=args.force_refresh,
+                    cards_only=args.cards_only,
+                    detail_on_change=args.detail_on_change,
+                    max_band_results=args.max_band_results,
+                    split_beds=args.split_beds,
+                    checkpoint_dir=args.checkpoint_dir,
+                    checkpoint_interval=args.checkpoint_interval,
+                    resume=args.resume,
+                    html_archive=args.html_archive,
+                    extraction_mode=args.extraction_mode,
+                    defer_enrichment=bool(args.enrichment_pool),
+                    daft_address=args.daft_address)
+
+    @staticmethod
+    def _add_extraction_mode_argument(parser: ArgumentParser) -> None:
+        parser.add_argument('--extraction-mode', choices=EXTRACTION_MODES, default=EXTRACTION_MODE_COMPILED,
+                            help='How the property pages are extracted: "compiled" evaluates every selector once'
+                                 ' per page with precompiled XPaths, "css" runs the css selectors one by one and'
+                                 ' "next-data" reads the embedded __NEXT_DATA__ JSON, with the css selectors as'
+                                 ' fallback. "streaming" parses the page incrementally and stops once every'
+                                 ' extracted element was seen.')
+
+    def _apply_settings(self, settings: Dict[str, Any]) -> None:
+        self.crawler_settings.update(settings)
+        self._process.settings.setdict(settings, priority='cmdline')
+
+    @staticmethod
+    def _default_output(output_format: str, suffix: str = '') -> str:
+        # the suffix goes before the extension, "/tmp/data.jl" is "/tmp/data-reextract.jl"
+        _, default_output = OUTPUT_PIPELINES[output_format]
+        root, extension = os.path.splitext(default_output)
+        return root + suffix + extension
+
+    @staticmethod
+    def _output_settings(args: Namespace, default_output_suffix: str = '') -> Dict[str, Any]:
+        pipeline, _ = OUTPUT_PIPELINES[args.output_format]
+        return {
+            ITEM_PIPELINES_SETTING: {pipeline: OUTPUT_PIPELINE_ORDER},
+            OUTPUT_PATH_SETTING: args.output or Runner._default_output(args.output_format, default_output_suffix),
+            FLUSH_INTERVAL_SETTING: args.flush_interval,
+            OUTPUT_FORMAT_SETTING: args.output_format,
+            COMPRESSION_LEVEL_SETTING: args.compression_level,
+            ROTATE_ITEMS_SETTING: args.rotate_items,
+            ROTATE_BYTES_SETTING: args.rotate_bytes,
+            BATCH_SIZE_SETTING: args.batch_size,
+        }
+
+    @staticmethod
+    def _enrichment_settings(args: Namespace, settings: Dict[str, Any]) -> Dict[str, Any]:
+        if not args.enrichment_pool:
+            return settings
+        return {
+            **settings,
+            ITEM_PIPELINES_SETTING: {**settings[ITEM_PIPELINES_SETTING],
+                                     ENRICHMENT_PIPELINE: ENRICHMENT_PIPELINE_ORDER},
+            ENRICHMENT_POOL_SETTING: args.enrichment_pool,
+            ENRICHMENT_WORKERS_SETTING: args.enrichment_workers,
+            ENRICHMENT_BATCH_SIZE_SETTING: args.enrichment_batch_size,
+        }
+
+    @staticmethod
+    def _concurrency_settings(args: Namespace) -> Dict[str, Any]:
+        if not args.concurrent_requests:
+            return {}
+        # the whole crawl is on a single domain
+        return {
+            CONCURRENT_REQUESTS_SETTING: args.concurrent_requests,
+            CONCURRENT_REQUESTS_PER_DOMAIN_SETTING: args.concurrent_requests,
+        }
+
+    @staticmethod
+    def _metrics_settings(args: Namespace) -> Dict[str, Any]:
+        if not args.metrics_file and args.metrics_port is None:
+            return {}
+        return {
+            EXTENSIONS_SETTING: {METRICS_EXTENSION: METRICS_EXTENSION_ORDER},
+            METRICS_FILE_SETTING: args.metrics_file,
+            METRICS_PORT_SETTING: args.metrics_port,
+            METRICS_INTERVAL_SETTING: args.metrics_interval,
+        }
+
+    @staticmethod
+    def _http_cache_settings(args: Namespace) -> Dict[str, Any]:
+        if not args.http_cache:
+            return {}
+        return {
+            'HTTPCACHE_ENABLED': True,
+            'HTTPCACHE_DIR': args.http_cache,
+            'HTTPCACHE_GZIP': True,
+            'HTTPCACHE_EXPIRATION_SECS': 0,
+            'HTTPCACHE_STORAGE': 'scrapy.extensions.httpcache.FilesystemCacheStorage',
+            'HTTPCACHE_POLICY': 'web_scraper.http_cache.DaftCachePolicy',
+            DOWNLOADER_MIDDLEWARES_SETTING: {
+                'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': None,
+                'web_scraper.http_cache.DaftHttpCacheMiddleware': HTTP_CACHE_MIDDLEWARE_ORDER,
+            },
+            LISTING_TTL_SETTING: args.http_cache_listing_ttl,
+            DETAIL_TTL_SETTING: args.http_cache_detail_ttl,
+        }
+
+    @staticmethod
+    def _build_transport_grid(args: Namespace) -> None:
+        grid = NearestStationGrid.build(tuple(args.bounding_box), args.step)
+        grid.save(args.output)
+        print(f"Saved a {grid.rows}x{grid.cols} transport grid to '{args.output}',"
+              f" max distance error: {grid.max_error_m:.0f}m")
+
+    @staticmethod
+    def _poi_layer(value: str) -> Tuple[str, str]:
+        name, separator, path = value.partition('=')
+        if not separator or not name.strip() or not path.strip():
+            raise ArgumentTypeError(f"'{value}' is not in the NAME=PATH format")
+        return name.strip(), path.strip()
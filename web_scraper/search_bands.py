@@ -0,0 +1,74 @@
+import math
+from dataclasses import dataclass, replace
+from typing import Optional, List, Tuple
+
+DEFAULT_MAX_BAND_RESULTS = 1000
+OPEN_PRICE_PIVOT = 500000
+OPEN_BEDS_PIVOT = 4
+# most of the properties are cheaper than this, the open range above it is a shard on its own
+SHARD_OPEN_PRICE_LIMIT = 1000000
+
+
+@dataclass(frozen=True)
+class SearchBand:
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    min_beds: Optional[int] = None
+    max_beds: Optional[int] = None
+
+
+class SearchBandPlanner:
+    # The bands are inclusive and never overlap, so the properties on the edges can only be listed twice if their
+    # price changes during the crawl
+
+    def __init__(self, max_band_results: int = DEFAULT_MAX_BAND_RESULTS, split_beds: bool = False) -> None:
+        if max_band_results < 1:
+            raise ValueError(f"The maximum number of results per band must be positive, not {max_band_results}")
+        self.max_band_results = max_band_results
+        self.split_beds = split_beds
+
+    def split(self, band: SearchBand, results_count: int) -> List[SearchBand]:
+        if results_count <= self.max_band_results:
+            return []
+
+        parts = math.ceil(results_count / self.max_band_results)
+        price_ranges = _split_range(band.min_price, band.max_price, parts, OPEN_PRICE_PIVOT)
+        if price_ranges:
+            return [replace(band, min_price=min_price, max_price=max_price) for min_price, max_price in price_ranges]
+
+        if self.split_beds:
+            beds_ranges = _split_range(band.min_beds, band.max_beds, parts, OPEN_BEDS_PIVOT)
+            return [replace(band, min_beds=min_beds, max_beds=max_beds) for min_beds, max_beds in beds_ranges]
+
+        return []
+
+
+def _split_range(low: Optional[int], high: Optional[int], parts: int,
+                 open_pivot: int) -> List[Tuple[Optional[int], Optional[int]]]:
+    low = low or 0
+    if high is None:
+        # the size of an open range is unknown, so it is split in two and the upper half is split again if the
+        # reported count is still too big
+        pivot = max(2 * low, low + open_pivot)
+        return [(low, pivot - 1), (pivot, None)]
+
+    width = high - low + 1
+    if width < 2:
+        return []
+
+    step = math.ceil(width / min(parts, width))
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+
+def shard_price_range(min_price: Optional[int], max_price: Optional[int],
+                      shards: int) -> List[Tuple[Optional[int], Optional[int]]]:
+    if shards < 2:
+        return [(min_price, max_price)]
+
+    if max_price is None:
+        low = min_price or 0
+        if low >= SHARD_OPEN_PRICE_LIMIT:
+            return [(min_price, max_price)]
+        return shard_price_range(min_price, SHARD_OPEN_PRICE_LIMIT - 1, shards - 1) + [(SHARD_OPEN_PRICE_LIMIT, None)]
+
+    return _split_range(min_price, max_price, shards, OPEN_PRICE_PIVOT) or [(min_price, max_price)]
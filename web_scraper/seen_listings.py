@@ -0,0 +1,88 @@
+import sqlite3
+import time
+from typing import Optional
+
+DEFAULT_TTL_HOURS = 24.0
+COMMIT_INTERVAL = 200
+
+SEEN_LISTINGS_TABLE = 'seen_listings'
+
+
+class SeenListingsStore:
+
+    def __init__(self, path: str, ttl_hours: float = DEFAULT_TTL_HOURS, force_refresh: bool = False) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.force_refresh = force_refresh
+        self.skipped = 0
+        self.scraped = 0
+        self._pending_writes = 0
+        self._connection: Optional[sqlite3.Connection] = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(f'CREATE TABLE IF NOT EXISTS {SEEN_LISTINGS_TABLE} ('
+                                 'link TEXT PRIMARY KEY, '
+                                 'first_seen_at REAL NOT NULL, '
+                                 'last_seen_at REAL NOT NULL, '
+                                 'scraped_at REAL, '
+                                 'card_hash TEXT)')
+        columns = {row[1] for row in self._connection.execute(f'PRAGMA table_info({SEEN_LISTINGS_TABLE})')}
+        if 'card_hash' not in columns:
+            self._connection.execute(f'ALTER TABLE {SEEN_LISTINGS_TABLE} ADD COLUMN card_hash TEXT')
+        self._connection.commit()
+
+    def should_scrape(self, link: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        scraped_at = self._scraped_at(link)
+        self._write(f'INSERT INTO {SEEN_LISTINGS_TABLE} (link, first_seen_at, last_seen_at) VALUES (?, ?, ?)'
+                    ' ON CONFLICT(link) DO UPDATE SET last_seen_at = excluded.last_seen_at', (link, now, now))
+
+        if self.force_refresh or scraped_at is None or scraped_at < now - self.ttl_seconds:
+            return True
+        self.skipped += 1
+        return False
+
+    def card_changed(self, link: str, card_hash: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        row = self._get_connection().execute(f'SELECT card_hash FROM {SEEN_LISTINGS_TABLE} WHERE link = ?',
+                                             (link,)).fetchone()
+        self._write(f'INSERT INTO {SEEN_LISTINGS_TABLE} (link, first_seen_at, last_seen_at, card_hash)'
+                    ' VALUES (?, ?, ?, ?) ON CONFLICT(link) DO UPDATE SET'
+                    ' last_seen_at = excluded.last_seen_at, card_hash = excluded.card_hash',
+                    (link, now, now, card_hash))
+
+        if self.force_refresh or not row or row[0] != card_hash:
+            return True
+        self.skipped += 1
+        return False
+
+    def mark_scraped(self, link: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self.scraped += 1
+        self._write(f'INSERT INTO {SEEN_LISTINGS_TABLE} (link, first_seen_at, last_seen_at, scraped_at)'
+                    ' VALUES (?, ?, ?, ?) ON CONFLICT(link) DO UPDATE SET'
+                    ' last_seen_at = excluded.last_seen_at, scraped_at = excluded.scraped_at',
+                    (link, now, now, now))
+
+    def close(self) -> None:
+        if self._connection:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
+
+    def _scraped_at(self, link: str) -> Optional[float]:
+        row = self._get_connection().execute(f'SELECT scraped_at FROM {SEEN_LISTINGS_TABLE} WHERE link = ?',
+                                             (link,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, statement: str, parameters: tuple) -> None:
+        connection = self._get_connection()
+        connection.execute(statement, parameters)
+        self._pending_writes += 1
+        if self._pending_writes >= COMMIT_INTERVAL:
+            connection.commit()
+            self._pending_writes = 0
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if not self._connection:
+            raise RuntimeError(f"The seen listings store '{self.path}' is closed")
+        return self._connection
@@ -1,10 +1,28 @@
+import copy
+import hashlib
+import json
 import re
-from typing import Generator, Any, Dict, Optional, List
-
-from scrapy import Spider, Request
+from dataclasses import asdict
+from time import perf_counter
+from typing import AsyncGenerator, Generator, Any, Callable, Dict, Optional, List, Set, Tuple
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+from scrapy import Spider, Request, Selector, signals
+from scrapy.crawler import Crawler
 from scrapy.http import Response
+from twisted.internet import task
+
+from .checkpoint import CrawlCheckpoint, DEFAULT_CHECKPOINT_INTERVAL_S
+from .html_archive import HtmlArchiveWriter
+from .items import DaftProperty
+from .metrics import StageTimings
 
-from .public_transport import PublicTransport
+from .points_of_interest import PointOfInterestLayer, parse_coords
+from .public_transport import PublicTransport, PublicTransportCache, PublicTransportStation, NearestStationGrid, \
+    GREEN_LUAS, RED_LUAS, DART, NO_DISTANCE, DEFAULT_CACHE_SIZE
+from .search_bands import SearchBand, SearchBandPlanner
+from .seen_listings import SeenListingsStore, DEFAULT_TTL_HOURS
 
 IRELAND_AREA = "ireland"
 
@@ -17,6 +35,13 @@ BER_RATING_EXEMPT = None
 
 PROPERTY_CARD_SELECTOR = 'li[data-testid^="result"] > a::attr(href)'
 
+CARD_SELECTOR = 'li[data-testid^="result"]'
+CARD_LINK_SELECTOR = 'a::attr(href)'
+CARD_PRICE_SELECTOR = 'div[data-testid="price"] > h3::text'
+CARD_ADDRESS_SELECTOR = 'p[data-testid="address"]::text'
+
+RESULTS_COUNT_SELECTOR = 'h1[data-testid="search-h1"]::text'
+
 DAFT_ADDRESS = "https://www.daft.ie"
 PROPERTIES_FOR_SALE = "/property-for-sale"
 
@@ -31,8 +56,34 @@ STREET_VIEW_SELECTOR = 'a[data-testid="streetview-button"]::attr(href)'
 DESCRIPTION_SELECTOR = 'div[data-testid="description"]::text'
 STATISTICS_SELECTOR = 'div[data-testid="statistics"] > div > div > div > p::text'
 
+DETAIL_PAGE_SELECTORS = (PROPERTY_TYPE_SELECTOR, MAIN_ADDRESS_SELECTOR, BER_RATING_ALT_SELECTOR, PRICE_SELECTOR,
+                         BEDS_SELECTOR, BATHS_SELECTOR, FLOOR_AREA_SELECTOR, STREET_VIEW_SELECTOR, DESCRIPTION_SELECTOR,
+                         STATISTICS_SELECTOR)
+
+EXTRACTION_MODE_CSS = 'css'
+EXTRACTION_MODE_COMPILED = 'compiled'
+EXTRACTION_MODE_NEXT_DATA = 'next-data'
+EXTRACTION_MODE_STREAMING = 'streaming'
+EXTRACTION_MODES = (EXTRACTION_MODE_CSS, EXTRACTION_MODE_COMPILED, EXTRACTION_MODE_NEXT_DATA,
+                    EXTRACTION_MODE_STREAMING)
+
+STREAMING_CHUNK_BYTES = 4 * 1024
+
 DEFAULT_PAGE_SIZE = 20
 
+PAGE_FROM_META = 'page_from'
+PAGE_CHAIN_META = 'page_chain'
+SEARCH_BAND_META = 'search_band'
+CHECKPOINT_META_KEYS = (PAGE_FROM_META, PAGE_CHAIN_META, SEARCH_BAND_META)
+LISTING_PAGE_PRIORITY = 1
+DOWNLOAD_LATENCY_META = 'download_latency'
+
+TRANSPORT_LINE_FIELDS = {
+    GREEN_LUAS: 'green_luas',
+    RED_LUAS: 'red_luas',
+    DART: 'dart',
+}
+
 
 class DaftSaleUsedSpider(Spider):  # type: ignore
     name = "DaftSaleUsed"
@@ -43,10 +94,31 @@ class DaftSaleUsedSpider(Spider):  # type: ignore
                  max_price: Optional[int] = None,
                  min_beds: Optional[int] = None,
                  max_beds: Optional[int] = None,
+                 poi_layers: Optional[Dict[str, str]] = None,
+                 transport_grid: Optional[str] = None,
+                 transport_cache_size: Optional[int] = None,
+                 transport_cache_file: Optional[str] = None,
+                 seen_listings: Optional[str] = None,
+                 seen_ttl_hours: Optional[float] = None,
+                 force_refresh: bool = False,
+                 cards_only: bool = False,
+                 detail_on_change: bool = False,
+                 max_band_results: Optional[int] = None,
+                 split_beds: bool = False,
+                 checkpoint_dir: Optional[str] = None,
+                 checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL_S,
+                 resume: bool = False,
+                 html_archive: Optional[str] = None,
+                 html_archive_writer: Optional[str] = None,
+                 extraction_mode: str = EXTRACTION_MODE_CSS,
+                 defer_enrichment: bool = False,
+                 daft_address: str = DAFT_ADDRESS,
                  ) -> None:
         super(DaftSaleUsedSpider, self).__init__()
 
-        initial_url = DAFT_ADDRESS + PROPERTIES_FOR_SALE
+        # another address, like a local copy of the site, can be crawled instead of daft.ie
+        self.daft_address = daft_address.rstrip('/')
+        initial_url = self.daft_address + PROPERTIES_FOR_SALE
 
         url_args = "?"
         initial_location = IRELAND_AREA
@@ -62,11 +134,9 @@ class DaftSaleUsedSpider(Spider):  # type: ignore
         initial_url += f"/{initial_location}"
         self.base_url = initial_url
 
-        url_args += DaftSaleUsedSpider._url_arg(PAGE_SIZE, DEFAULT_PAGE_SIZE)
-        url_args += DaftSaleUsedSpider._url_arg('salePrice_from', min_price)
-        url_args += DaftSaleUsedSpider._url_arg('salePrice_to', max_price)
-        url_args += DaftSaleUsedSpider._url_arg('numBeds_from', min_beds)
-        url_args += DaftSaleUsedSpider._url_arg('numBeds_to', max_beds)
+        self.location_url_args = url_args
+        self.search_band = SearchBand(min_price, max_price, min_beds, max_beds)
+        url_args = self._search_url_args(self.search_band)
         self.base_url_args = url_args
         self.start_from = 0
 
@@ -75,41 +145,363 @@ class DaftSaleUsedSpider(Spider):  # type: ignore
         self.start_urls = [self.base_url + url_args]
         print(f"Defined start url as: '{self.start_urls}'")
 
-    def parse(self, response: Response) -> Generator[Request, None, None]:
-        properties_response = response.css(PROPERTY_CARD_SELECTOR)
-        for daft_property in properties_response:
-            partial_url = daft_property.get()
-            detailed_link = DAFT_ADDRESS + partial_url
-            yield Request(detailed_link, callback=self.parse_detailed_page)
-
-        if properties_response:
-            self.start_from += DEFAULT_PAGE_SIZE
-            next_page_url = self.base_url + self.base_url_args + DaftSaleUsedSpider._url_arg("from", self.start_from)
-            yield Request(next_page_url, callback=self.parse)
-
-    def parse_detailed_page(self, response: Response) -> Generator[Dict[str, Any], None, None]:
-        geolocation_coords = DaftExtractor.extract_geolocation(response)
-
-        yield {
-            'link': response.request.url,
-            'property_type': DaftExtractor.extract_property_type(response),
-            'ber_rating': DaftExtractor.extract_ber_rating(response),
-            'price': DaftExtractor.extract_price(response),
-            'bedrooms': DaftExtractor.extract_bedrooms(response),
-            'bathrooms': DaftExtractor.extract_bathrooms(response),
-            'floor_area_m2': DaftExtractor.extract_floor_area(response),
-            'main_address': DaftExtractor.extract_main_address(response),
-            'sector': DaftExtractor.extract_sector(response),
-            'region': DaftExtractor.extract_region(response),
-            'geolocation': geolocation_coords,
-            'description': DaftExtractor.extract_description(response),
-            'updated_at': DaftExtractor.extract_updated_at(response),
-            'views': DaftExtractor.extract_views(response),
-            'green_luas_distance_m': PublicTransport.get_closest_green_luas(geolocation_coords)[1],
-            'red_luas_distance_m': PublicTransport.get_closest_red_luas(geolocation_coords)[1],
-            'dart_distance_m': PublicTransport.get_closest_dart(geolocation_coords)[1],
+        self.poi_layers: List[PointOfInterestLayer] = []
+        for layer_name, layer_path in (poi_layers or {}).items():
+            self.poi_layers.append(PointOfInterestLayer.load(layer_name, layer_path))
+            print(f"Loaded {len(self.poi_layers[-1])} points of interest for '{layer_name}' from '{layer_path}'")
+
+        if transport_grid:
+            grid = NearestStationGrid.load(transport_grid)
+            PublicTransport.use_grid(grid)
+            print(f"Using the transport grid '{transport_grid}', max distance error: {grid.max_error_m:.0f}m")
+
+        # the transport and points of interest fields are added by the enrichment pipeline, whose process pool
+        # builds its own spiders with these arguments
+        self.defer_enrichment = defer_enrichment
+        self.enrichment_kwargs = dict(poi_layers=poi_layers, transport_grid=transport_grid,
+                                      transport_cache_size=transport_cache_size)
+
+        if transport_cache_size is None:
+            transport_cache_size = DEFAULT_CACHE_SIZE
+        self.transport_cache: Optional[PublicTransportCache] = None
+        if transport_cache_size > 0:
+            self.transport_cache = PublicTransportCache(transport_cache_size, transport_cache_file)
+
+        self.seen_listings: Optional[SeenListingsStore] = None
+        if seen_listings:
+            self.seen_listings = SeenListingsStore(seen_listings,
+                                                   DEFAULT_TTL_HOURS if seen_ttl_hours is None else seen_ttl_hours,
+                                                   force_refresh)
+
+        self.cards_only = cards_only
+        self.detail_on_change = detail_on_change
+        if detail_on_change and not (cards_only and self.seen_listings):
+            raise ValueError('Fetching the details of the changed cards needs the cards only mode and the seen'
+                             ' listings store')
+
+        self.band_planner: Optional[SearchBandPlanner] = None
+        if max_band_results:
+            self.band_planner = SearchBandPlanner(max_band_results, split_beds)
+        self.search_bands_count = 1
+        self.duplicated_links = 0
+        self._listed_links: Set[str] = set()
+
+        self.checkpoint: Optional[CrawlCheckpoint] = None
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoint_loop: Optional[task.LoopingCall] = None
+        if checkpoint_dir:
+            self.checkpoint = CrawlCheckpoint(checkpoint_dir, resume)
+
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode '{extraction_mode}', expected one of {EXTRACTION_MODES}")
+        self.extraction_mode = extraction_mode
+        self.next_data_pages = 0
+        self.css_fallback_pages = 0
+
+        self.html_archive: Optional[HtmlArchiveWriter] = None
+        if html_archive:
+            self.html_archive = HtmlArchiveWriter(html_archive, writer=html_archive_writer)
+
+        self.timings = StageTimings()
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler, *args: Any, **kwargs: Any) -> 'DaftSaleUsedSpider':
+        spider = super(DaftSaleUsedSpider, cls).from_crawler(crawler, *args, **kwargs)
+        if spider.checkpoint or spider.seen_listings:
+            crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        if spider.checkpoint:
+            crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(spider.item_failed, signal=signals.item_dropped)
+            crawler.signals.connect(spider.item_failed, signal=signals.item_error)
+        return spider
+
+    def spider_opened(self) -> None:
+        if self.checkpoint:
+            self._checkpoint_loop = task.LoopingCall(self.checkpoint.save)
+            self._checkpoint_loop.start(self.checkpoint_interval, now=False)
+
+    async def start(self) -> AsyncGenerator[Request, None]:
+        # used by Scrapy 2.13 and later, the older versions call start_requests
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self) -> Generator[Request, None, None]:
+        if not self.checkpoint:
+            for url in self.start_urls:
+                yield Request(url, dont_filter=True)
+            return
+
+        if self.checkpoint.resumed and self.checkpoint.pending:
+            for url, pending_request in list(self.checkpoint.pending.items()):
+                yield self._restore_request(url, pending_request['callback'], pending_request['meta'])
+        else:
+            for url in self.start_urls:
+                yield self._track(Request(url, callback=self.parse, dont_filter=True))
+
+    def item_scraped(self, item: Dict[str, Any], response: Optional[Response] = None) -> None:
+        # the items are only completed once every pipeline wrote them, until then their pages stay pending
+        if self.checkpoint:
+            self.checkpoint.mark_completed(item['link'])
+            self._complete_detailed_page(response)
+        if self.seen_listings and response is not None and self._is_detailed_page(response):
+            self.seen_listings.mark_scraped(item['link'])
+
+    def item_failed(self, item: Dict[str, Any], response: Optional[Response] = None) -> None:
+        # dropped or failed on a pipeline, it would fail the same way on resume
+        if self.checkpoint:
+            self._complete_detailed_page(response)
+
+    def parse(self, response: Response) -> Generator[Any, None, None]:
+        self._observe_download(response)
+        yield from self.timings.timed('parse', self._parse_listing_page(response))
+        if self.checkpoint:
+            self.checkpoint.complete_pending(DaftSaleUsedSpider._original_url(response))
+
+    def _parse_listing_page(self, response: Response) -> Generator[Any, None, None]:
+        search_band = response.meta.get(SEARCH_BAND_META, self.search_band)
+        results_count = None
+        if PAGE_FROM_META not in response.meta:
+            results_count = DaftExtractor.extract_results_count(response)
+            if self.band_planner and results_count is not None:
+                sub_bands = self.band_planner.split(search_band, results_count)
+                if sub_bands:
+                    self.search_bands_count += len(sub_bands) - 1
+                    for sub_band in sub_bands:
+                        yield self._band_request(sub_band)
+                    return
+
+        if self.cards_only:
+            properties_response = response.css(CARD_SELECTOR)
+            for card in properties_response:
+                yield from self._parse_card(card)
+        else:
+            properties_response = response.css(PROPERTY_CARD_SELECTOR)
+            for daft_property in properties_response:
+                partial_url = daft_property.get()
+                detailed_link = self.daft_address + partial_url
+                if self._is_duplicated(detailed_link) or self._is_completed(detailed_link):
+                    continue
+                if self.seen_listings and not self.seen_listings.should_scrape(detailed_link):
+                    continue
+                yield self._track(Request(detailed_link, callback=self.parse_detailed_page))
+
+        if not properties_response:
+            return
+
+        page_from = response.meta.get(PAGE_FROM_META, self.start_from)
+        if results_count is not None:
+            # the whole pagination is known after the first page, so all the pages are requested at once, the
+            # last one keeps following the next pages in case new properties were published meanwhile
+            page_offsets = range(page_from + DEFAULT_PAGE_SIZE, results_count, DEFAULT_PAGE_SIZE)
+            for page_offset in page_offsets:
+                yield self._page_request(search_band, page_offset, page_offset == page_offsets[-1])
+        elif response.meta.get(PAGE_CHAIN_META, True):
+            yield self._page_request(search_band, page_from + DEFAULT_PAGE_SIZE, True)
+
+    def _band_request(self, search_band: SearchBand) -> Request:
+        band_url = self.base_url + self._search_url_args(search_band) + DaftSaleUsedSpider._url_arg("from", 0)
+        return self._track(Request(band_url, callback=self.parse, priority=LISTING_PAGE_PRIORITY,
+                                   meta={SEARCH_BAND_META: search_band}))
+
+    def _page_request(self, search_band: SearchBand, page_from: int, chain: bool) -> Request:
+        page_url = self.base_url + self._search_url_args(search_band) + DaftSaleUsedSpider._url_arg("from", page_from)
+        return self._track(Request(page_url, callback=self.parse, priority=LISTING_PAGE_PRIORITY,
+                                   meta={PAGE_FROM_META: page_from, PAGE_CHAIN_META: chain,
+                                         SEARCH_BAND_META: search_band}))
+
+    def _track(self, request: Request) -> Request:
+        if self.checkpoint:
+            meta = {key: value for key, value in request.meta.items() if key in CHECKPOINT_META_KEYS}
+            if SEARCH_BAND_META in meta:
+                meta[SEARCH_BAND_META] = asdict(meta[SEARCH_BAND_META])
+            self.checkpoint.add_pending(request.url, request.callback.__name__, meta)
+        return request
+
+    def _restore_request(self, url: str, callback: str, meta: Dict[str, Any]) -> Request:
+        if SEARCH_BAND_META in meta:
+            meta[SEARCH_BAND_META] = SearchBand(**meta[SEARCH_BAND_META])
+        if callback == self.parse.__name__:
+            return Request(url, callback=self.parse, priority=LISTING_PAGE_PRIORITY, meta=meta, dont_filter=True)
+        return Request(url, callback=self.parse_detailed_page, meta=meta)
+
+    def _complete_detailed_page(self, response: Optional[Response]) -> None:
+        # the cards are scraped while their listing page is still being parsed, it is completed by parse
+        if self.checkpoint and response is not None and self._is_detailed_page(response):
+            self.checkpoint.complete_pending(DaftSaleUsedSpider._original_url(response))
+
+    def _is_detailed_page(self, response: Response) -> bool:
+        request = getattr(response, 'request', None)
+        return request is not None and request.callback == self.parse_detailed_page
+
+    def _is_completed(self, link: str) -> bool:
+        return bool(self.checkpoint and link in self.checkpoint.completed)
+
+    def _search_url_args(self, search_band: SearchBand) -> str:
+        url_args = self.location_url_args
+        url_args += DaftSaleUsedSpider._url_arg(PAGE_SIZE, DEFAULT_PAGE_SIZE)
+        url_args += DaftSaleUsedSpider._url_arg('salePrice_from', search_band.min_price)
+        url_args += DaftSaleUsedSpider._url_arg('salePrice_to', search_band.max_price)
+        url_args += DaftSaleUsedSpider._url_arg('numBeds_from', search_band.min_beds)
+        url_args += DaftSaleUsedSpider._url_arg('numBeds_to', search_band.max_beds)
+        return url_args
+
+    def _is_duplicated(self, link: str) -> bool:
+        # only the partitioned searches can list the same property twice, on the edges of the bands
+        if not self.band_planner:
+            return False
+        if link in self._listed_links:
+            self.duplicated_links += 1
+            return True
+        self._listed_links.add(link)
+        return False
+
+    def _parse_card(self, card: Selector) -> Generator[Any, None, None]:
+        item = DaftCardExtractor.extract_card(card, self.daft_address)
+        if not item or self._is_duplicated(item['link']) or self._is_completed(item['link']):
+            return
+
+        if self.detail_on_change and self.seen_listings and \
+                self.seen_listings.card_changed(item['link'], DaftSaleUsedSpider._card_hash(item)):
+            yield self._track(Request(item['link'], callback=self.parse_detailed_page))
+        else:
+            yield item
+
+    def parse_detailed_page(self, response: Response) -> Generator[DaftProperty, None, None]:
+        start = perf_counter()
+        self._observe_download(response)
+        if self.html_archive:
+            self.html_archive.add(response.request.url, response.body, response.status)
+
+        item = DaftProperty(response.request.url, **self._extract_fields(response))
+        if not self.defer_enrichment:
+            enrichment_start = perf_counter()
+            if self.transport_cache is not None:
+                closest_stations = self.transport_cache.get_closest_stations(item.geolocation)
+            else:
+                closest_stations = PublicTransport.get_closest_stations(item.geolocation)
+            self._enrich(item, closest_stations)
+            self.timings.observe('enrichment', perf_counter() - enrichment_start)
+
+        self.timings.observe('parse_detailed_page', perf_counter() - start)
+        yield item
+
+    def enrich_batch(self, items: List[Any]) -> List[Any]:
+        # used by the enrichment pipeline, the closest stations of the whole batch are searched together
+        geolocations = [item['geolocation'] for item in items]
+        if self.transport_cache is not None:
+            batch_closest_stations = self.transport_cache.get_closest_stations_batch(geolocations)
+        else:
+            batch_closest_stations = PublicTransport.get_closest_stations_batch(list(map(parse_coords, geolocations)))
+        for item, closest_stations in zip(items, batch_closest_stations):
+            self._enrich(item, closest_stations)
+        return items
+
+    def _enrich(self, item: Any, closest_stations: Dict[str, Tuple[PublicTransportStation, int]]) -> None:
+        for line, field_prefix in TRANSPORT_LINE_FIELDS.items():
+            station, station_distance = closest_stations[line]
+            item[f'{field_prefix}_station'] = station.name if station_distance != NO_DISTANCE else None
+            item[f'{field_prefix}_distance_m'] = station_distance
+
+        if self.poi_layers:
+            parsed_coords = parse_coords(item['geolocation'])
+            for layer in self.poi_layers:
+                closest_points = layer.nearest(parsed_coords) if parsed_coords else []
+                item[f'{layer.name}_closest'] = closest_points[0][0].name if closest_points else None
+                item[f'{layer.name}_distance_m'] = closest_points[0][1] if closest_points else NO_DISTANCE
+
+    def _extract_fields(self, response: Response) -> Dict[str, Any]:
+        if self.extraction_mode == EXTRACTION_MODE_COMPILED:
+            # the html is parsed once for every selector
+            root = self._timed('extract/html', lambda: response.selector.root)
+            return self._timed('extract/compiled', CompiledDaftExtractor.extract_fields, root)
+
+        if self.extraction_mode == EXTRACTION_MODE_STREAMING:
+            return self._timed('extract/streaming', StreamingDaftExtractor.extract_fields, response.body,
+                               response.encoding)
+
+        if self.extraction_mode == EXTRACTION_MODE_NEXT_DATA:
+            fields = self._timed('extract/next_data', NextDataDaftExtractor.extract_fields, response.body)
+            if fields is not None:
+                self.next_data_pages += 1
+                return fields
+            self.css_fallback_pages += 1
+
+        # the html is parsed by the first selector, so it is part of the property_type timing
+        return {
+            'property_type': self._timed('extract/property_type', DaftExtractor.extract_property_type, response),
+            'ber_rating': self._timed('extract/ber_rating', DaftExtractor.extract_ber_rating, response),
+            'price': self._timed('extract/price', DaftExtractor.extract_price, response),
+            'bedrooms': self._timed('extract/bedrooms', DaftExtractor.extract_bedrooms, response),
+            'bathrooms': self._timed('extract/bathrooms', DaftExtractor.extract_bathrooms, response),
+            'floor_area_m2': self._timed('extract/floor_area_m2', DaftExtractor.extract_floor_area, response),
+            'main_address': self._timed('extract/main_address', DaftExtractor.extract_main_address, response),
+            'sector': self._timed('extract/sector', DaftExtractor.extract_sector, response),
+            'region': self._timed('extract/region', DaftExtractor.extract_region, response),
+            'geolocation': self._timed('extract/geolocation', DaftExtractor.extract_geolocation, response),
+            'description': self._timed('extract/description', DaftExtractor.extract_description, response),
+            'updated_at': self._timed('extract/updated_at', DaftExtractor.extract_updated_at, response),
+            'views': self._timed('extract/views', DaftExtractor.extract_views, response),
         }
 
+    def _timed(self, stage: str, function: Callable[..., Any], *args: Any) -> Any:
+        start = perf_counter()
+        result = function(*args)
+        self.timings.observe(stage, perf_counter() - start)
+        return result
+
+    def _observe_download(self, response: Response) -> None:
+        try:
+            download_latency = response.meta.get(DOWNLOAD_LATENCY_META)
+        except AttributeError:
+            # the responses built out of a crawl may not be tied to any request
+            return
+        if download_latency is not None:
+            self.timings.observe('download', download_latency)
+
+    def closed(self, reason: str) -> None:
+        stats = self.crawler.stats
+        if self.checkpoint:
+            if self._checkpoint_loop and self._checkpoint_loop.running:
+                self._checkpoint_loop.stop()
+            if reason == 'finished':
+                self.checkpoint.finish()
+            else:
+                self.checkpoint.save()
+            stats.set_value('checkpoint/saves', self.checkpoint.saves)
+
+        if self.band_planner:
+            stats.set_value('search_bands/count', self.search_bands_count)
+            stats.set_value('search_bands/duplicated_links', self.duplicated_links)
+
+        if self.transport_cache is not None:
+            stats.set_value('public_transport_cache/hits', self.transport_cache.hits)
+            stats.set_value('public_transport_cache/misses', self.transport_cache.misses)
+            stats.set_value('public_transport_cache/size', len(self.transport_cache))
+            self.transport_cache.save()
+
+        if self.html_archive:
+            stats.set_value('html_archive/pages', self.html_archive.pages)
+            self.html_archive.close()
+
+        if self.extraction_mode == EXTRACTION_MODE_NEXT_DATA:
+            stats.set_value('extraction/next_data', self.next_data_pages)
+            stats.set_value('extraction/css_fallback', self.css_fallback_pages)
+
+        if self.seen_listings:
+            stats.set_value('seen_listings/skipped', self.seen_listings.skipped)
+            stats.set_value('seen_listings/scraped', self.seen_listings.scraped)
+            self.seen_listings.close()
+
+        self.timings.publish(stats)
+
+    @staticmethod
+    def _original_url(response: Response) -> str:
+        return str(response.meta.get('redirect_urls', [response.url])[0])
+
+    @staticmethod
+    def _card_hash(item: Dict[str, Any]) -> str:
+        return hashlib.sha1(json.dumps(item, sort_keys=True).encode()).hexdigest()
+
     @staticmethod
     def _url_arg(arg_name: str, arg_value: Any) -> str:
         if arg_value:
@@ -125,16 +517,31 @@ class DaftExtractor:
     _FLOOR_AREA_REGEX = re.compile(".*\\s+(\\d+(\\.\\d+)?).* m")
     _UPDATED_AT_REGEX = re.compile("^(\\d{1,2}).(\\d{1,2}).(\\d{4})$")
     _ONLY_NUMBERS_REGEX = re.compile("^(\\d+,)?\\d+$")
+    _RESULTS_COUNT_REGEX = re.compile("\\d+(,\\d{3})*")
+
+    @staticmethod
+    def extract_results_count(response: Response) -> Optional[int]:
+        results_text = DaftExtractor._extract_css_selector(response, RESULTS_COUNT_SELECTOR)
+        if not results_text:
+            return None
+        matcher = DaftExtractor._RESULTS_COUNT_REGEX.search(results_text)
+        return int(matcher.group(0).replace(",", "")) if matcher else None
 
     @staticmethod
     def extract_property_type(response: Response) -> str:
-        result = str(DaftExtractor._extract_css_selector(response, PROPERTY_TYPE_SELECTOR))
-        return result.strip()
+        return DaftExtractor.parse_property_type(DaftExtractor._extract_css_selector(response, PROPERTY_TYPE_SELECTOR))
+
+    @staticmethod
+    def parse_property_type(property_type_text: Optional[str]) -> str:
+        return str(property_type_text).strip()
 
     @staticmethod
     def extract_ber_rating(response: Response) -> Optional[str]:
-        ber_rating = str(DaftExtractor._extract_css_selector(
-            response, BER_RATING_ALT_SELECTOR))
+        return DaftExtractor.parse_ber_rating(DaftExtractor._extract_css_selector(response, BER_RATING_ALT_SELECTOR))
+
+    @staticmethod
+    def parse_ber_rating(ber_rating_text: Optional[str]) -> Optional[str]:
+        ber_rating = str(ber_rating_text)
 
         if ber_rating == BER_RATING_EXEMPT_CODE:
             return None
@@ -143,7 +550,10 @@ class DaftExtractor:
 
     @staticmethod
     def extract_price(response: Response) -> Optional[int]:
-        price_text = str(DaftExtractor._extract_css_selector(response, PRICE_SELECTOR))
+        return DaftExtractor.parse_price(str(DaftExtractor._extract_css_selector(response, PRICE_SELECTOR)))
+
+    @staticmethod
+    def parse_price(price_text: str) -> Optional[int]:
         result = None
         if price_text:
             try:
@@ -167,13 +577,19 @@ class DaftExtractor:
 
     @staticmethod
     def extract_main_address(response: Response) -> str:
-        result = str(DaftExtractor._extract_css_selector(response, MAIN_ADDRESS_SELECTOR))
-        return result.strip()
+        return DaftExtractor.parse_main_address(DaftExtractor._extract_css_selector(response, MAIN_ADDRESS_SELECTOR))
+
+    @staticmethod
+    def parse_main_address(main_address_text: Optional[str]) -> str:
+        return str(main_address_text).strip()
 
     @staticmethod
     def extract_sector(response: Response) -> Optional[str]:
-        main_address_parts = str(DaftExtractor._extract_css_selector(
-            response, MAIN_ADDRESS_SELECTOR)).split(',')
+        return DaftExtractor.parse_sector(str(DaftExtractor._extract_css_selector(response, MAIN_ADDRESS_SELECTOR)))
+
+    @staticmethod
+    def parse_sector(main_address: str) -> Optional[str]:
+        main_address_parts = main_address.split(',')
         result = None
         if len(main_address_parts) > 1:
             result = main_address_parts[-1].strip()
@@ -181,8 +597,11 @@ class DaftExtractor:
 
     @staticmethod
     def extract_region(response: Response) -> Optional[str]:
-        main_address_parts = str(DaftExtractor._extract_css_selector(
-            response, MAIN_ADDRESS_SELECTOR)).split(',')
+        return DaftExtractor.parse_region(str(DaftExtractor._extract_css_selector(response, MAIN_ADDRESS_SELECTOR)))
+
+    @staticmethod
+    def parse_region(main_address: str) -> Optional[str]:
+        main_address_parts = main_address.split(',')
         result = None
         if len(main_address_parts) > 2 and DUBLIN_CITY_SECTOR in main_address_parts[-1]:
             result = main_address_parts[-3].strip()
@@ -192,7 +611,10 @@ class DaftExtractor:
 
     @staticmethod
     def extract_geolocation(response: Response) -> Optional[str]:
-        street_view_link = DaftExtractor._extract_css_selector(response, STREET_VIEW_SELECTOR)
+        return DaftExtractor.parse_geolocation(DaftExtractor._extract_css_selector(response, STREET_VIEW_SELECTOR))
+
+    @staticmethod
+    def parse_geolocation(street_view_link: Optional[str]) -> Optional[str]:
         result = None
         if street_view_link:
             raw_coordinates = street_view_link.split('=')[-1]
@@ -201,7 +623,11 @@ class DaftExtractor:
 
     @staticmethod
     def extract_description(response: Response) -> str:
-        description_text = DaftExtractor._extract_css_selector(response, DESCRIPTION_SELECTOR, True)
+        return DaftExtractor.parse_description(
+            DaftExtractor._extract_css_selector(response, DESCRIPTION_SELECTOR, True))
+
+    @staticmethod
+    def parse_description(description_text: List[str]) -> str:
         result = ""
         for line in description_text:
             if line_text := line.strip():
@@ -210,7 +636,10 @@ class DaftExtractor:
 
     @staticmethod
     def extract_updated_at(response: Response) -> Optional[str]:
-        statistics_raw = DaftExtractor._extract_css_selector(response, STATISTICS_SELECTOR, True)
+        return DaftExtractor.parse_updated_at(DaftExtractor._extract_css_selector(response, STATISTICS_SELECTOR, True))
+
+    @staticmethod
+    def parse_updated_at(statistics_raw: List[str]) -> Optional[str]:
         updated_at = None
         for statistics_entry in statistics_raw:
             if matcher := DaftExtractor._UPDATED_AT_REGEX.match(statistics_entry):
@@ -220,7 +649,10 @@ class DaftExtractor:
 
     @staticmethod
     def extract_views(response: Response) -> Optional[int]:
-        statistics_raw = DaftExtractor._extract_css_selector(response, STATISTICS_SELECTOR, True)
+        return DaftExtractor.parse_views(DaftExtractor._extract_css_selector(response, STATISTICS_SELECTOR, True))
+
+    @staticmethod
+    def parse_views(statistics_raw: List[str]) -> Optional[int]:
         views = None
         for statistics_entry in statistics_raw:
             if DaftExtractor._ONLY_NUMBERS_REGEX.match(statistics_entry):
@@ -238,7 +670,10 @@ class DaftExtractor:
 
     @staticmethod
     def extract_first_int(response: Response, selector: str, name: str) -> Optional[int]:
-        property_text = DaftExtractor._extract_css_selector(response, selector)
+        return DaftExtractor.parse_first_int(DaftExtractor._extract_css_selector(response, selector), name)
+
+    @staticmethod
+    def parse_first_int(property_text: Optional[str], name: str) -> Optional[int]:
         result = None
         if property_text:
             try:
@@ -250,7 +685,10 @@ class DaftExtractor:
 
     @staticmethod
     def extract_first_float(response: Response, selector: str, name: str) -> Optional[float]:
-        property_text = DaftExtractor._extract_css_selector(response, selector)
+        return DaftExtractor.parse_first_float(DaftExtractor._extract_css_selector(response, selector), name)
+
+    @staticmethod
+    def parse_first_float(property_text: Optional[str], name: str) -> Optional[float]:
         result = None
         if property_text:
             try:
@@ -261,9 +699,187 @@ class DaftExtractor:
         return result
 
 
+class CompiledDaftExtractor:
+    # Every selector is translated to XPath and compiled once, then evaluated once per page, even the ones used by
+    # several fields like the main address or the statistics
+    _XPATHS = {selector: etree.XPath(HTMLTranslator().css_to_xpath(selector)) for selector in DETAIL_PAGE_SELECTORS}
+
+    @staticmethod
+    def extract_fields(root: Any) -> Dict[str, Any]:
+        values = {selector: [str(value) for value in xpath(root)]
+                  for selector, xpath in CompiledDaftExtractor._XPATHS.items()}
+        first_values = {selector: selector_values[0] if selector_values else None
+                        for selector, selector_values in values.items()}
+        main_address = str(first_values[MAIN_ADDRESS_SELECTOR])
+
+        return {
+            'property_type': DaftExtractor.parse_property_type(first_values[PROPERTY_TYPE_SELECTOR]),
+            'ber_rating': DaftExtractor.parse_ber_rating(first_values[BER_RATING_ALT_SELECTOR]),
+            'price': DaftExtractor.parse_price(str(first_values[PRICE_SELECTOR])),
+            'bedrooms': DaftExtractor.parse_first_int(first_values[BEDS_SELECTOR], 'beds'),
+            'bathrooms': DaftExtractor.parse_first_int(first_values[BATHS_SELECTOR], 'baths'),
+            'floor_area_m2': DaftExtractor.parse_first_float(first_values[FLOOR_AREA_SELECTOR], 'floor-area'),
+            'main_address': DaftExtractor.parse_main_address(first_values[MAIN_ADDRESS_SELECTOR]),
+            'sector': DaftExtractor.parse_sector(main_address),
+            'region': DaftExtractor.parse_region(main_address),
+            'geolocation': DaftExtractor.parse_geolocation(first_values[STREET_VIEW_SELECTOR]),
+            'description': DaftExtractor.parse_description(values[DESCRIPTION_SELECTOR]),
+            'updated_at': DaftExtractor.parse_updated_at(values[STATISTICS_SELECTOR]),
+            'views': DaftExtractor.parse_views(values[STATISTICS_SELECTOR]),
+        }
+
+
+class StreamingDaftExtractor:
+    # Feeds the body to an incremental parser and copies only the elements the selectors start from to a small tree,
+    # stopping as soon as all of them were seen. Everything else is dropped once parsed, so the whole page is never
+    # kept in memory, and the compiled selectors are evaluated on the small tree. The parser only reports the tags
+    # of the targets, so the other elements never reach python
+    _TARGET_REGEX = re.compile('^(\\w+)\\[data-testid="([\\w-]+)"\\]')
+    _TARGETS = frozenset(matcher.groups() for matcher in map(_TARGET_REGEX.match, DETAIL_PAGE_SELECTORS) if matcher)
+    _TARGET_TAGS = sorted({tag for tag, _ in _TARGETS})
+
+    @staticmethod
+    def extract_fields(body: bytes, encoding: Optional[str] = None) -> Dict[str, Any]:
+        return CompiledDaftExtractor.extract_fields(StreamingDaftExtractor.extract_targets(body, encoding))
+
+    @staticmethod
+    def extract_targets(body: bytes, encoding: Optional[str] = None) -> Any:
+        parser = etree.HTMLPullParser(events=('start', 'end'), tag=StreamingDaftExtractor._TARGET_TAGS,
+                                      encoding=encoding)
+        targets = etree.Element('html')
+        pending = set(StreamingDaftExtractor._TARGETS)
+        # the target being parsed, the ones inside it are copied with it
+        open_target = None
+        for start in range(0, len(body), STREAMING_CHUNK_BYTES):
+            parser.feed(body[start:start + STREAMING_CHUNK_BYTES])
+            for event, element in parser.read_events():
+                if event == 'start':
+                    target = (element.tag, element.get('data-testid'))
+                    if target in StreamingDaftExtractor._TARGETS:
+                        pending.discard(target)
+                        if open_target is None:
+                            open_target = element
+                elif element is open_target:
+                    targets.append(copy.deepcopy(element))
+                    StreamingDaftExtractor._drop_parsed(element)
+                    open_target = None
+                elif open_target is None:
+                    StreamingDaftExtractor._drop_parsed(element)
+            if not pending and open_target is None:
+                break
+        return targets
+
+    @staticmethod
+    def _drop_parsed(element: Any) -> None:
+        element.clear(keep_tail=True)
+        parent = element.getparent()
+        while parent is not None and element.getprevious() is not None:
+            del parent[0]
+
+
+class NextDataDaftExtractor:
+    # The property pages are rendered from the listing embedded on the __NEXT_DATA__ script, so it is read straight
+    # from the body without building the html tree. Returns None when the page has no listing or one of its fields can
+    # not be parsed, to use the selectors
+    _NEXT_DATA_REGEX = re.compile(b'<script id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.DOTALL)
+
+    @staticmethod
+    def extract_fields(body: bytes) -> Optional[Dict[str, Any]]:
+        listing, page_props = NextDataDaftExtractor._extract_listing(body)
+        if listing is None:
+            return None
+
+        try:
+            return NextDataDaftExtractor._parse_listing(listing, page_props)
+        except (ExtractorException, AttributeError, TypeError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _parse_listing(listing: Dict[str, Any], page_props: Dict[str, Any]) -> Dict[str, Any]:
+        main_address = DaftExtractor.parse_main_address(listing.get('title'))
+        point = listing.get('point') or {}
+        coordinates = point.get('coordinates') or []
+        floor_area = listing.get('floorArea') or {}
+        views = page_props.get('listingViews')
+
+        return {
+            'property_type': DaftExtractor.parse_property_type(listing.get('propertyType')),
+            'ber_rating': DaftExtractor.parse_ber_rating((listing.get('ber') or {}).get('rating')),
+            'price': DaftExtractor.parse_price(str(listing.get('price'))),
+            'bedrooms': DaftExtractor.parse_first_int(NextDataDaftExtractor._text(listing.get('numBedrooms')), 'beds'),
+            'bathrooms': DaftExtractor.parse_first_int(NextDataDaftExtractor._text(listing.get('numBathrooms')),
+                                                       'baths'),
+            'floor_area_m2': DaftExtractor.parse_first_float(NextDataDaftExtractor._text(floor_area.get('value')),
+                                                             'floor-area'),
+            'main_address': main_address,
+            'sector': DaftExtractor.parse_sector(main_address),
+            'region': DaftExtractor.parse_region(main_address),
+            # GeoJSON points are longitude first
+            'geolocation': f'{coordinates[1]},{coordinates[0]}' if len(coordinates) == 2 else None,
+            'description': DaftExtractor.parse_description(str(listing.get('description') or '').splitlines()),
+            'updated_at': DaftExtractor.parse_updated_at([str(listing.get('lastUpdateDate'))]),
+            'views': DaftExtractor.parse_views([str(views)]) if views is not None else None,
+        }
+
+    @staticmethod
+    def _extract_listing(body: bytes) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        matcher = NextDataDaftExtractor._NEXT_DATA_REGEX.search(body)
+        if not matcher:
+            return None, {}
+
+        try:
+            page_props = json.loads(matcher.group(1))['props']['pageProps']
+        except (ValueError, KeyError, TypeError):
+            return None, {}
+        listing = page_props.get('listing') if isinstance(page_props, dict) else None
+        if not isinstance(listing, dict):
+            return None, {}
+        return listing, page_props
+
+    @staticmethod
+    def _text(value: Any) -> Optional[str]:
+        # the numbers of the listing can be sent as "3 Bed" or as 3
+        return str(value) if value is not None else None
+
+
+class DaftCardExtractor:
+
+    @staticmethod
+    def extract_card(card: Selector, daft_address: str = DAFT_ADDRESS) -> Optional[Dict[str, Any]]:
+        partial_url = card.css(CARD_LINK_SELECTOR).get()
+        if not partial_url:
+            return None
+
+        main_address = card.css(CARD_ADDRESS_SELECTOR).get(default='').strip()
+        return {
+            'link': daft_address + partial_url,
+            'property_type': card.css(PROPERTY_TYPE_SELECTOR).get(default='').strip() or None,
+            'price': DaftExtractor.parse_price(card.css(CARD_PRICE_SELECTOR).get(default='')),
+            'bedrooms': DaftExtractor.extract_first_int(card, BEDS_SELECTOR, 'beds'),
+            'bathrooms': DaftExtractor.extract_first_int(card, BATHS_SELECTOR, 'baths'),
+            'floor_area_m2': DaftExtractor.extract_first_float(card, FLOOR_AREA_SELECTOR, 'floor-area'),
+            'main_address': main_address,
+            'sector': DaftExtractor.parse_sector(main_address),
+            'region': DaftExtractor.parse_region(main_address),
+        }
+
+
 class ExtractorException(Exception):
     def __init__(self, error_msg: str, raw_value: str, error: Any):
         self.message = f'{error_msg}:\'{raw_value}\' - {error}'
 
     def __str__(self) -> str:
         return self.message
+
+
+# created once on every process of the enrichment and reextraction pools
+_pool_spider: Optional[DaftSaleUsedSpider] = None
+
+
+def init_pool_spider(spider_kwargs: Dict[str, Any]) -> None:
+    global _pool_spider
+    _pool_spider = DaftSaleUsedSpider(**spider_kwargs)
+
+
+def pool_spider() -> DaftSaleUsedSpider:
+    return _pool_spider or DaftSaleUsedSpider()
@@ -0,0 +1,153 @@
+import multiprocessing
+import queue
+from typing import Any, Dict, List, Optional
+
+from scrapy import Spider
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.utils.misc import load_object
+
+from .metrics import timed_process_item, QUANTILE_STAT_SUFFIXES
+from .pipelines import OUTPUT_PIPELINES, OUTPUT_FORMAT_SETTING
+from .search_bands import shard_price_range
+from .spiders import DaftSaleUsedSpider
+
+WORKER_PIPELINE = 'web_scraper.workers.WorkerQueuePipeline'
+# after any other pipeline, in place of the output one
+WORKER_PIPELINE_ORDER = 1000
+ITEM_PIPELINES_SETTING = 'ITEM_PIPELINES'
+# the workers would all try to listen on the same telnet port
+TELNET_CONSOLE_SETTING = 'TELNETCONSOLE_ENABLED'
+WORKER_BATCH_SIZE = 100
+WORKER_POLL_INTERVAL_S = 1.0
+
+# stats of the whole crawl of every worker, they can not be summed either
+FIRST_WORKER_STATS = frozenset(('start_time',))
+LAST_WORKER_STATS = frozenset(('finish_time', 'elapsed_time_seconds', 'memusage/max', 'memusage/startup'))
+
+ITEMS_MESSAGE = 'items'
+STATS_MESSAGE = 'stats'
+
+# set on every worker process before its crawl starts
+_worker_queue: Optional[Any] = None
+
+
+class WorkerQueuePipeline:
+    # the items are sent in batches to the parent process, which writes all of them to the output
+    def __init__(self, batch_size: int = WORKER_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        self._items: List[Any] = []
+
+    def close_spider(self, spider: Spider) -> None:
+        self._flush()
+
+    @timed_process_item
+    def process_item(self, item: Any, spider: Spider) -> Any:
+        self._items.append(dict(item))
+        if len(self._items) >= self.batch_size:
+            self._flush()
+        return item
+
+    def _flush(self) -> None:
+        if self._items and _worker_queue is not None:
+            _worker_queue.put((ITEMS_MESSAGE, self._items))
+        self._items = []
+
+
+def shard_spider_kwargs(spider_kwargs: Dict[str, Any], workers: int) -> List[Dict[str, Any]]:
+    locations = spider_kwargs.get('locations') or []
+    if len(locations) > 1:
+        shards = min(workers, len(locations))
+        return [dict(spider_kwargs, locations=locations[shard::shards]) for shard in range(shards)]
+
+    return [dict(spider_kwargs, min_price=min_price, max_price=max_price) for min_price, max_price in
+            shard_price_range(spider_kwargs.get('min_price'), spider_kwargs.get('max_price'), workers)]
+
+
+def run_worker(settings: Dict[str, Any], spider_kwargs: Dict[str, Any], worker_queue: Any) -> None:
+    global _worker_queue
+    _worker_queue = worker_queue
+
+    process = CrawlerProcess(settings=settings)
+    crawler = process.create_crawler(DaftSaleUsedSpider)
+    process.crawl(crawler, **spider_kwargs)
+    process.start()
+    worker_queue.put((STATS_MESSAGE, crawler.stats.get_stats()))
+
+
+class ShardedCrawl:
+
+    def __init__(self, crawler: Crawler, settings: Dict[str, Any], spider_kwargs: Dict[str, Any],
+                 workers: int) -> None:
+        self.crawler = crawler
+        self.settings = settings
+        self.shards = shard_spider_kwargs(spider_kwargs, workers)
+        self.items_written = 0
+        self.worker_stats: List[Dict[str, Any]] = []
+        self.failed_workers = 0
+
+    def run(self) -> None:
+        # every worker runs its own reactor on a spawned process, as twisted can not be forked once started
+        context = multiprocessing.get_context('spawn')
+        worker_queue = context.Queue()
+        output_pipelines = {pipeline for pipeline, _ in OUTPUT_PIPELINES.values()}
+        worker_pipelines = {pipeline: order for pipeline, order in self.settings.get(ITEM_PIPELINES_SETTING, {}).items()
+                            if pipeline not in output_pipelines}
+        worker_settings = dict(self.settings, **{ITEM_PIPELINES_SETTING: {**worker_pipelines,
+                                                                          WORKER_PIPELINE: WORKER_PIPELINE_ORDER},
+                                                 TELNET_CONSOLE_SETTING: False})
+        processes = [context.Process(target=run_worker,
+                                     args=(worker_settings, ShardedCrawl._worker_kwargs(shard, index), worker_queue),
+                                     name=f'web-scraper-worker-{index}')
+                     for index, shard in enumerate(self.shards)]
+        for process in processes:
+            process.start()
+
+        pipeline_path, _ = OUTPUT_PIPELINES[self.crawler.settings.get(OUTPUT_FORMAT_SETTING)]
+        pipeline = load_object(pipeline_path).from_crawler(self.crawler)
+        spider = Spider(name=f'{DaftSaleUsedSpider.name}Workers')
+        pipeline.open_spider(spider)
+        try:
+            finished_workers = 0
+            while finished_workers + self.failed_workers < len(processes):
+                try:
+                    message_type, payload = worker_queue.get(timeout=WORKER_POLL_INTERVAL_S)
+                except queue.Empty:
+                    self.failed_workers = sum(1 for process in processes if process.exitcode not in (None, 0))
+                    continue
+
+                if message_type == ITEMS_MESSAGE:
+                    for item in payload:
+                        pipeline.process_item(item, spider)
+                    self.items_written += len(payload)
+                elif message_type == STATS_MESSAGE:
+                    self.worker_stats.append(payload)
+                    finished_workers += 1
+        finally:
+            pipeline.close_spider(spider)
+            for process in processes:
+                process.join()
+
+    @staticmethod
+    def _worker_kwargs(shard: Dict[str, Any], index: int) -> Dict[str, Any]:
+        # every worker archives the pages to its own segments and index
+        if shard.get('html_archive'):
+            return dict(shard, html_archive_writer=f'worker{index}')
+        return shard
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        merged_stats: Dict[str, Any] = {'workers/count': len(self.shards), 'workers/failed': self.failed_workers,
+                                        'workers/items_written': self.items_written}
+        for worker_stats in self.worker_stats:
+            for key, value in worker_stats.items():
+                if key in FIRST_WORKER_STATS:
+                    merged_stats[key] = min(merged_stats.get(key, value), value)
+                elif key in LAST_WORKER_STATS:
+                    merged_stats[key] = max(merged_stats.get(key, value), value)
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    if key.endswith(QUANTILE_STAT_SUFFIXES):
+                        # the quantiles can not be summed, the one of the slowest worker is an upper bound
+                        merged_stats[key] = max(merged_stats.get(key, 0), value)
+                    else:
+                        merged_stats[key] = merged_stats.get(key, 0) + value
+        return merged_stats